@@ -0,0 +1,19 @@
+"""
+Loader Bot - Componentes del loader ETL de raw_data
+
+Este paquete agrupa las piezas reutilizables del comando `loader`
+(core/management/commands/loader.py), que sigue siendo el orquestador del daemon.
+
+Módulos:
+- archiver: Compresión en segundo plano de processed/ (zstd/gzip) e índice de archivos para loader_replay
+- file_watcher: Detección inmediata de segmentos publicados en RAW_DIR (watchdog o polling)
+- stock_history: Particiones mensuales, retención y migración legacy de product_stock_log
+"""
+
+from .archiver import SegmentArchiver
+from .file_watcher import RawDirWatcher
+
+__all__ = [
+    'RawDirWatcher',
+    'SegmentArchiver',
+]
@@ -0,0 +1,291 @@
+"""
+Archivado en segundo plano de los segmentos ya cargados.
+
+Tras cargar un segmento el loader solo lo renombra a `processed/.pending/` (instantáneo,
+libera el lease) y un pool de hilos lo recomprime: zstd multihilo si `zstandard` está
+instalado, gzip si no. Cada archivo terminado agrega una línea a `processed/archive_index.jsonl`
+con el rango de product_id y de capture_timestamp que contiene; `loader_replay` usa ese
+índice para elegir qué archivos volver a pasar por el loader.
+
+Si el proceso muere a mitad de una compresión, el segmento sigue en `.pending/` y se
+retoma con `recover()` al arrancar (el temporal a medio escribir se descarta).
+"""
+import gzip
+import io
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("loader.archiver")
+
+ARCHIVE_INDEX_NAME = "archive_index.jsonl"
+PENDING_DIRNAME = ".pending"
+SEEN_RECORD_TYPE = "seen"
+FORMAT_SUFFIXES = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz", "none": ".jsonl"}
+SEGMENT_SUFFIXES = (".jsonl.zst", ".jsonl.gz", ".jsonl")
+READ_CHUNK_SIZE = 1 << 20
+
+
+def segment_basename(name):
+    """Nombre sin extensión de segmento (.jsonl, .jsonl.gz o .jsonl.zst)."""
+    for suffix in SEGMENT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return pathlib.Path(name).stem
+
+
+def segment_format(name):
+    """Formato ("zstd", "gzip" o "none") según la extensión."""
+    for fmt, suffix in FORMAT_SUFFIXES.items():
+        if name.endswith(suffix):
+            return fmt
+    return None
+
+
+def open_segment(path, mode="rt"):
+    """Abre un segmento según su extensión, descomprimiendo en streaming ("rt" o "rb")."""
+    path = pathlib.Path(path)
+    text = "t" in mode
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"{path.name}: se necesita el paquete zstandard para leer archivos .zst")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        stream = io.BufferedReader(raw, READ_CHUNK_SIZE)
+    elif path.name.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    else:
+        stream = open(path, "rb")
+    if text:
+        return io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    return stream
+
+
+def resolve_format(fmt):
+    """Formato efectivo: zstd cae a gzip si `zstandard` no está instalado."""
+    fmt = (fmt or "gzip").lower()
+    if fmt not in FORMAT_SUFFIXES:
+        raise ValueError(f"Formato de archivo desconocido: {fmt}")
+    if fmt == "zstd" and zstandard is None:
+        logger.warning("⚠️ zstandard no está instalado: archivando con gzip")
+        return "gzip"
+    return fmt
+
+
+class SegmentSummary:
+    """Rangos de product_id y de captura de un segmento (lo que se guarda en el índice)."""
+
+    def __init__(self):
+        self.records = 0
+        self.seen_ids = 0
+        self.min_product_id = None
+        self.max_product_id = None
+        self.captured_from = None
+        self.captured_to = None
+
+    def add_ids(self, ids):
+        for product_id in ids:
+            if not isinstance(product_id, int):
+                continue
+            if self.min_product_id is None or product_id < self.min_product_id:
+                self.min_product_id = product_id
+            if self.max_product_id is None or product_id > self.max_product_id:
+                self.max_product_id = product_id
+
+    def add_line(self, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(record, dict):
+            return
+        if record.get("record_type") == SEEN_RECORD_TYPE:
+            ids = record.get("ids") or []
+            self.seen_ids += len(ids)
+            self.add_ids(ids)
+        elif record.get("id"):
+            self.records += 1
+            self.add_ids([record["id"]])
+        else:
+            return
+        captured = record.get("capture_timestamp")
+        if isinstance(captured, str):
+            # ISO en UTC con el mismo formato: el orden de strings es el cronológico
+            if self.captured_from is None or captured < self.captured_from:
+                self.captured_from = captured
+            if self.captured_to is None or captured > self.captured_to:
+                self.captured_to = captured
+
+    def as_dict(self):
+        return {
+            "records": self.records,
+            "seen_ids": self.seen_ids,
+            "min_product_id": self.min_product_id,
+            "max_product_id": self.max_product_id,
+            "captured_from": self.captured_from,
+            "captured_to": self.captured_to,
+        }
+
+
+def compress_segment(source, target, fmt, level=3, threads=-1):
+    """
+    Escribe `source` (cualquier formato) en `target` con `fmt`, línea a línea, y retorna
+    el SegmentSummary. La escritura va a un temporal y se publica con rename.
+    """
+    summary = SegmentSummary()
+    tmp = target.with_name(f".{target.name}.tmp")
+    with open_segment(source, "rb") as f_in, open(tmp, "wb") as raw_out:
+        if fmt == "zstd":
+            out = zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(raw_out, closefd=False)
+        elif fmt == "gzip":
+            out = gzip.GzipFile(fileobj=raw_out, mode="wb", compresslevel=min(max(level, 1), 9))
+        else:
+            out = raw_out
+        for line in f_in:
+            out.write(line)
+            summary.add_line(line)
+        if out is not raw_out:
+            out.close()
+    os.replace(tmp, target)
+    return summary
+
+
+def summarize_segment(path):
+    """SegmentSummary de un archivo sin reescribirlo."""
+    summary = SegmentSummary()
+    with open_segment(path, "rb") as f:
+        for line in f:
+            summary.add_line(line)
+    return summary
+
+
+def read_index(directory):
+    """Entradas de `archive_index.jsonl`, una por archivo (la última gana; líneas corruptas se ignoran)."""
+    path = pathlib.Path(directory) / ARCHIVE_INDEX_NAME
+    if not path.exists():
+        return []
+    entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and entry.get("archive"):
+                entries[entry["archive"]] = entry
+    return list(entries.values())
+
+
+class SegmentArchiver:
+    """
+    Pool de compresión para `processed/`. `stage()` mueve el segmento fuera de la cola
+    del loader y `submit()` encola su compresión; sin pool (workers=0) se comprime en el
+    hilo que llama.
+    """
+
+    def __init__(self, directory, fmt="zstd", workers=2, level=3, threads=-1):
+        self.directory = pathlib.Path(directory)
+        self.pending_dir = self.directory / PENDING_DIRNAME
+        self.pending_dir.mkdir(parents=True, exist_ok=True)
+        self.format = resolve_format(fmt)
+        self.level = level
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archiver") if workers > 0 else None
+        self._index_lock = threading.Lock()
+        self._inflight = set()  # Nombres en `.pending/` que este proceso ya encoló o está comprimiendo
+        self._inflight_lock = threading.Lock()
+
+    def stage(self, filepath, archive_basename):
+        """Rename a `.pending/` conservando la extensión original. Retorna la nueva ruta."""
+        suffix = filepath.name[len(segment_basename(filepath.name)):]
+        staged = self.pending_dir / f"{archive_basename}{suffix}"
+        os.replace(filepath, staged)
+        os.utime(staged)  # El rename conserva el mtime: marcar el momento del archivado
+        return staged
+
+    def submit(self, staged):
+        with self._inflight_lock:
+            if staged.name in self._inflight:
+                return None
+            self._inflight.add(staged.name)
+        if self.pool is None:
+            return self.archive(staged)
+        return self.pool.submit(self.archive, staged)
+
+    def archive(self, staged):
+        """Comprime un segmento de `.pending/`, lo registra en el índice y borra el original."""
+        started = datetime.utcnow()
+        basename = segment_basename(staged.name)
+        target = self.directory / f"{basename}{FORMAT_SUFFIXES[self.format]}"
+        try:
+            source_bytes = staged.stat().st_size
+            if staged.name[len(basename):] == target.name[len(basename):]:
+                # Ya está en el formato de archivo (p. ej. .gz con LOADER_ARCHIVE_FORMAT=gzip)
+                summary = summarize_segment(staged)
+                os.replace(staged, target)
+            else:
+                summary = compress_segment(staged, target, self.format, self.level, self.threads)
+            entry = {
+                "archive": target.name,
+                "source": staged.name,
+                "format": self.format,
+                **summary.as_dict(),
+                "bytes": target.stat().st_size,
+                "source_bytes": source_bytes,
+                "archived_at": started.isoformat(),
+            }
+            self.append_index(entry)
+            # Después del índice: si el proceso muere antes, recover() lo rehace (el índice se deduplica por nombre)
+            staged.unlink(missing_ok=True)
+            logger.info(f"   📦 Archivado: {target.name} ({entry['source_bytes'] / 1e6:.1f} → {entry['bytes'] / 1e6:.1f} MB)")
+            return entry
+        except Exception as e:
+            logger.error(f"   ❌ Error archivando {staged.name}: {e} (queda en {PENDING_DIRNAME}/)")
+            return None
+        finally:
+            with self._inflight_lock:
+                self._inflight.discard(staged.name)
+
+    def append_index(self, entry):
+        # Una sola write() con O_APPEND por línea: segura entre hilos y entre contenedores
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._index_lock:
+            with open(self.directory / ARCHIVE_INDEX_NAME, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def recover(self, stale_after=0):
+        """
+        Reencola segmentos que quedaron en `.pending/` (proceso caído a mitad de archivado).
+        Con varios loaders sobre el mismo RAW_DIR, `stale_after` evita tomar los que otro
+        proceso está comprimiendo ahora; los que encoló este proceso nunca se repiten, así
+        que el daemon puede llamarlo en cada ciclo.
+        """
+        now = time.time()
+        with self._inflight_lock:
+            inflight = set(self._inflight)
+        staged = []
+        for p in self.pending_dir.iterdir():
+            if p.name.startswith(".") or not p.name.endswith(SEGMENT_SUFFIXES) or p.name in inflight:
+                continue
+            try:
+                if now - p.stat().st_mtime >= stale_after:
+                    staged.append(p)
+            except FileNotFoundError:
+                continue  # Otro proceso lo terminó de archivar mientras listábamos
+        for path in sorted(staged):
+            logger.info(f"♻️ Retomando archivado pendiente: {path.name}")
+            self.submit(path)
+        return len(staged)
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
@@ -0,0 +1,119 @@
+"""
+Detección de segmentos nuevos en RAW_DIR para el loader.
+
+El scraper publica cada segmento con un rename atómico (`.part` → `raw_products_*.jsonl.gz`).
+Este módulo despierta al loader apenas aparece uno, en lugar de esperar el ciclo fijo
+de 5 minutos. Usa watchdog (inotify en Linux) si está instalado; si no, hace polling
+liviano del directorio cada pocos segundos.
+"""
+import logging
+import os
+import pathlib
+import threading
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    _WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    _WATCHDOG_AVAILABLE = False
+
+from .archiver import SEGMENT_SUFFIXES
+
+logger = logging.getLogger("loader.watcher")
+
+
+class _SegmentEventHandler(FileSystemEventHandler):
+    """Marca el watcher ante creación o rename de un archivo que coincide con el prefijo."""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class RawDirWatcher:
+    """
+    Señal "hay archivos nuevos" sobre `directory`.
+
+    El loader llama a `wait(timeout)` entre ciclos: retorna True si llegó un segmento
+    (antes del timeout) y False si venció el timeout (escaneo periódico de respaldo).
+    Varios eventos seguidos se colapsan en uno solo: el loader procesa todo lo pendiente.
+    """
+
+    def __init__(self, directory, prefix="raw_products_", poll_interval=2.0, use_watchdog=True):
+        self.directory = pathlib.Path(directory)
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog and _WATCHDOG_AVAILABLE
+        self._event = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+        self._known = set()
+
+    @property
+    def mode(self):
+        return "watchdog" if self.use_watchdog else "polling"
+
+    def matches(self, path):
+        name = os.path.basename(path)
+        return name.startswith(self.prefix) and name.endswith(SEGMENT_SUFFIXES)
+
+    def notify(self, path):
+        if self.matches(path):
+            self._event.set()
+
+    def start(self):
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.schedule(_SegmentEventHandler(self), str(self.directory), recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self._known = self._scan()
+            self._thread = threading.Thread(target=self._poll_loop, name="loader-watcher", daemon=True)
+            self._thread.start()
+        logger.info(f"👀 Vigilando {self.directory} ({self.mode})")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def clear(self):
+        """Descarta eventos pendientes (llamar justo antes de listar los archivos a procesar)."""
+        self._event.clear()
+
+    def wait(self, timeout):
+        """True si apareció un segmento antes de `timeout` segundos."""
+        triggered = self._event.wait(timeout)
+        self._event.clear()
+        return triggered
+
+    # ─────── Polling (sin watchdog) ───────
+
+    def _scan(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return {e.name for e in entries if self.matches(e.name)}
+        except FileNotFoundError:
+            return set()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            current = self._scan()
+            if current - self._known:
+                self._event.set()
+            self._known = current
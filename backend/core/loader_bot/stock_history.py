@@ -0,0 +1,189 @@
+"""
+Historial de stock particionado por mes.
+
+product_stock_log es una tabla particionada por rango sobre snapshot_at (una partición
+`product_stock_log_pYYYYMM` por mes, más `product_stock_log_default` de respaldo). El
+loader solo agrega filas cuando cambia la cantidad de un (producto, bodega); el último
+valor vive en product_stock_latest.
+
+Política de retención: los meses más viejos que la retención se resumen por día en
+product_stock_daily y luego su partición se desengancha y se borra (sin DELETE masivo
+ni VACUUM). Las funciones reciben un cursor DB-API (Django o psycopg2) y no confirman:
+la transacción es de quien llama.
+"""
+import re
+from datetime import date
+
+STOCK_LOG_TABLE = "product_stock_log"
+STOCK_LATEST_TABLE = "product_stock_latest"
+STOCK_DAILY_TABLE = "product_stock_daily"
+LEGACY_TABLE = "product_stock_log_legacy"  # Tabla sin particionar previa a la migración 0022
+DEFAULT_PARTITION = f"{STOCK_LOG_TABLE}_default"
+
+PARTITION_RE = re.compile(rf"^{STOCK_LOG_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+# Un valor por (producto, bodega) y día: apertura/cierre por orden de captura
+ROLLUP_SQL = f"""
+    INSERT INTO {STOCK_DAILY_TABLE} AS d
+        (product_id, warehouse_id, day, open_qty, close_qty, min_qty, max_qty, changes)
+    SELECT product_id, warehouse_id, snapshot_at::date,
+           (array_agg(stock_qty ORDER BY snapshot_at))[1],
+           (array_agg(stock_qty ORDER BY snapshot_at DESC))[1],
+           MIN(stock_qty), MAX(stock_qty), COUNT(*)
+    FROM {{source}}
+    WHERE product_id IS NOT NULL AND warehouse_id IS NOT NULL {{where}}
+    GROUP BY product_id, warehouse_id, snapshot_at::date
+    ON CONFLICT (product_id, warehouse_id, day) DO UPDATE SET
+        close_qty = EXCLUDED.close_qty,
+        min_qty = LEAST(d.min_qty, EXCLUDED.min_qty),
+        max_qty = GREATEST(d.max_qty, EXCLUDED.max_qty),
+        changes = d.changes + EXCLUDED.changes
+"""
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{STOCK_LOG_TABLE}_p{month:%Y%m}"
+
+
+def table_exists(cursor, name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    """Meses con partición propia, ordenados: [(mes, nombre)]."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        [STOCK_LOG_TABLE],
+    )
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def create_partition(cursor, month):
+    """
+    Crea la partición del mes si no existe. Las filas que hayan caído en la partición
+    default para ese rango se mueven a la nueva (si no, Postgres rechaza la creación).
+    Retorna True si la creó.
+    """
+    name = partition_name(month)
+    if table_exists(cursor, name):
+        return False
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    has_default = table_exists(cursor, DEFAULT_PARTITION)
+    moved = 0
+    if has_default:
+        cursor.execute(
+            f"CREATE TEMP TABLE stock_log_moved ON COMMIT DROP AS "
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE snapshot_at >= %s AND snapshot_at < %s RETURNING *) "
+            f"SELECT * FROM moved",
+            [start, end],
+        )
+        moved = cursor.rowcount
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {STOCK_LOG_TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [start, end],
+    )
+    if has_default:
+        if moved:
+            cursor.execute(f"INSERT INTO {STOCK_LOG_TABLE} SELECT * FROM stock_log_moved")
+        cursor.execute("DROP TABLE stock_log_moved")
+    return True
+
+
+def ensure_partitions(cursor, months_ahead=2, today=None):
+    """Particiones del mes actual y de los `months_ahead` siguientes. Retorna las creadas."""
+    current = month_start(today or date.today())
+    return [
+        partition_name(add_months(current, n))
+        for n in range(months_ahead + 1)
+        if create_partition(cursor, add_months(current, n))
+    ]
+
+
+def retention_cutoff(retention_months, today=None):
+    """Primer mes que se conserva en detalle."""
+    return add_months(month_start(today or date.today()), -retention_months)
+
+
+def rollup(cursor, source, where="", params=None):
+    """Resume `source` (tabla o partición) por día en product_stock_daily."""
+    cursor.execute(ROLLUP_SQL.format(source=source, where=f"AND {where}" if where else ""), params or [])
+    return cursor.rowcount
+
+
+def expire_partitions(cursor, retention_months, today=None, dry_run=False):
+    """
+    Aplica la retención: resume y borra las particiones anteriores al corte, y las
+    filas viejas de la partición default. Retorna los nombres de las particiones borradas.
+    """
+    cutoff = retention_cutoff(retention_months, today)
+    expired = [name for month, name in list_partitions(cursor) if month < cutoff]
+    if dry_run:
+        return expired
+    for name in expired:
+        rollup(cursor, name)
+        cursor.execute(f"ALTER TABLE {STOCK_LOG_TABLE} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+    if table_exists(cursor, DEFAULT_PARTITION):
+        rollup(cursor, DEFAULT_PARTITION, "snapshot_at < %s", [cutoff.isoformat()])
+        cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE snapshot_at < %s", [cutoff.isoformat()])
+    return expired
+
+
+def legacy_months(cursor):
+    """Meses con filas en la tabla legacy, ordenados."""
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', snapshot_at)::date FROM {LEGACY_TABLE} "
+        f"WHERE snapshot_at IS NOT NULL ORDER BY 1"
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def import_legacy_month(cursor, month, cutoff):
+    """
+    Migra un mes de la tabla legacy. Dentro de la retención solo se copian los cambios
+    de cantidad (compactación con lag(); cada mes conserva su primer valor por par);
+    los meses anteriores van directo al resumen diario.
+    Retorna las filas escritas.
+    """
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    if month < cutoff:
+        return rollup(cursor, LEGACY_TABLE, "snapshot_at >= %s AND snapshot_at < %s", [start, end])
+    create_partition(cursor, month)
+    cursor.execute(
+        f"INSERT INTO {STOCK_LOG_TABLE} (id, product_id, warehouse_id, stock_qty, snapshot_at) "
+        f"SELECT id, product_id, warehouse_id, stock_qty, snapshot_at FROM ("
+        f"  SELECT *, lag(stock_qty) OVER (PARTITION BY product_id, warehouse_id ORDER BY snapshot_at, id) AS prev_qty"
+        f"  FROM {LEGACY_TABLE} WHERE snapshot_at >= %s AND snapshot_at < %s"
+        f") changes WHERE prev_qty IS DISTINCT FROM stock_qty",
+        [start, end],
+    )
+    return cursor.rowcount
+
+
+def seed_latest_from_legacy(cursor):
+    """Completa product_stock_latest con el último valor legacy (no pisa lo que ya cargó el loader)."""
+    cursor.execute(
+        f"INSERT INTO {STOCK_LATEST_TABLE} (product_id, warehouse_id, stock_qty, snapshot_at) "
+        f"SELECT DISTINCT ON (product_id, warehouse_id) product_id, warehouse_id, stock_qty, snapshot_at "
+        f"FROM {LEGACY_TABLE} WHERE product_id IS NOT NULL AND warehouse_id IS NOT NULL AND snapshot_at IS NOT NULL "
+        f"ORDER BY product_id, warehouse_id, snapshot_at DESC "
+        f"ON CONFLICT (product_id, warehouse_id) DO NOTHING"
+    )
+    return cursor.rowcount
@@ -2,7 +2,10 @@
 from django.core.management.base import BaseCommand
 from core.models import Product
 from core.ai_classifier import classify_term
+from core.services.vector_search_service import VectorSearchService
+import os
 import sys
+import socket
 import pathlib
 import logging
 import time
@@ -29,52 +32,124 @@ if not logger.handlers:
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+# Cola: product_classification_queue (la llena un trigger en products). Cada réplica toma un
+# lote con SKIP LOCKED y lo marca con un lease en not_before: ningún producto pasa dos veces
+# por Ollama, y lo que tomó un classifier caído vuelve a la cola cuando vence el lease.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+CLAIM_BATCH = int(os.getenv("CLASSIFIER_BATCH", "10"))  # Lote chico: el lease cubre pocas llamadas al LLM
+LEASE_SECONDS = int(os.getenv("CLASSIFIER_LEASE_SECONDS", "600"))
+RETRY_COOLDOWN = int(os.getenv("CLASSIFIER_RETRY_COOLDOWN", "900"))  # s antes de reintentar un producto fallido
+MAX_ATTEMPTS = int(os.getenv("CLASSIFIER_MAX_ATTEMPTS", "5"))  # fallos seguidos antes de descartarlo
+
+# Prioridad: productos CON vector primero (consenso visual), los más nuevos antes
+SQL_CLAIM = """
+    UPDATE product_classification_queue q
+    SET not_before = NOW() + make_interval(secs => %(lease)s), claimed_by = %(worker)s, claimed_at = NOW()
+    FROM (
+        SELECT cq.product_id FROM product_classification_queue cq
+        LEFT JOIN product_embeddings pe ON pe.product_id = cq.product_id
+        WHERE cq.not_before <= NOW()
+        ORDER BY (pe.embedding_visual IS NULL), cq.enqueued_at DESC
+        LIMIT %(limit)s
+        FOR UPDATE OF cq SKIP LOCKED
+    ) c
+    WHERE q.product_id = c.product_id
+    RETURNING q.product_id, q.enqueued_at;
+"""
+# Solo se borra si nadie lo volvió a encolar mientras tanto (concepto borrado a mitad de proceso)
+SQL_DONE = """
+    DELETE FROM product_classification_queue WHERE product_id = %s AND enqueued_at = %s;
+"""
+SQL_RETRY = """
+    UPDATE product_classification_queue
+    SET attempts = attempts + 1, claimed_by = NULL,
+        not_before = CASE WHEN attempts + 1 >= %(max_attempts)s THEN NULL
+                          ELSE NOW() + make_interval(secs => %(cooldown)s) END
+    WHERE product_id = %(product_id)s AND enqueued_at = %(enqueued_at)s;
+"""
+SQL_RELEASE = """
+    UPDATE product_classification_queue SET not_before = NOW(), claimed_by = NULL
+    WHERE claimed_by = %s AND not_before > NOW();
+"""
+
 class Command(BaseCommand):
     help = 'Agent 1: Taxonomy Classifier (The Labeler). Uses Visual Consensus.'
 
     def handle(self, *args, **options):
         logger.info("🏷️ AGENT 1: TAXONOMY CLASSIFIER STARTED (SCHOOL MODE 🏫)")
-        
+        logger.info(f"   Worker: {WORKER_ID} (lotes de {CLAIM_BATCH}, lease {LEASE_SECONDS}s)")
+
+        self.release_claims()  # Claims de una ejecución anterior de este mismo worker (reinicio del contenedor)
+        try:
+            self.run()
+        except KeyboardInterrupt:
+            logger.info("⏹️ Deteniendo classifier (Ctrl+C)...")
+        finally:
+            self.release_claims()
+
+    def run(self):
         while True:
             # 0. Stability: Close old DB connections to prevent timeouts overnight
             close_old_connections()
             
-            # 1. Fetch Candidates (Priority: Products with EYES 👀)
+            # 1. Claim de un lote (Priority: Products with EYES 👀)
             # Queremos priorizar productos que YA tienen vector visual para aplicar el consenso.
             # Si procesamos productos sin vector, el classifier estaría "ciego" y perderíamos la oportunidad de aprender.
+            # SKIP LOCKED: otra réplica que reclama al mismo tiempo toma otras filas (autocommit: el lock dura solo el UPDATE)
+            with connection.cursor() as cur:
+                cur.execute(SQL_CLAIM, {"lease": LEASE_SECONDS, "worker": WORKER_ID, "limit": CLAIM_BATCH})
+                claimed = cur.fetchall()
             
-            # Query A: Sin clasificar + CON Vector (Los mejores alumnos)
-            pending_products = Product.objects.filter(
-                taxonomy_concept__isnull=True,
-                is_active=True,
-                productembedding__embedding_visual__isnull=False
-            ).order_by('-created_at')[:50]
-            
-            # Query B: Fallback (Si no hay productos vectorizados listos, procesar lo que haya)
-            if not pending_products.exists():
-                pending_products = Product.objects.filter(
-                    taxonomy_concept__isnull=True,
-                    is_active=True
-                ).order_by('-created_at')[:50]
-            
-            if not pending_products.exists():
+            if not claimed:
                 logger.info("💤 Todo limpio. Esperando nuevos productos... (30s)")
                 time.sleep(30)
                 continue
             
-            logger.info(f"⚡ Procesando lote de {pending_products.count()} productos... (Prioridad Visual)")
+            products = Product.objects.in_bulk([pid for pid, _ in claimed])
+            logger.info(f"⚡ Procesando lote de {len(claimed)} productos... (Prioridad Visual)")
             
-            for prod in pending_products:
+            for pid, enqueued_at in claimed:
+                prod = products.get(pid)
                 try:
-                    self.classify_product(prod)
+                    # Ya clasificado (a mano o por una versión anterior del classifier): solo sale de la cola
+                    done = prod is None or prod.taxonomy_concept is not None or self.classify_product(prod)
                     # Rate limit suave para no saturar Ollama
                     time.sleep(0.1)
                 except Exception as e:
-                    logger.error(f"❌ Error classifying product {prod.product_id}: {e}")
+                    logger.error(f"❌ Error classifying product {pid}: {e}")
+                    done = False
+                self.finish_claim(pid, enqueued_at, done)
             
             # Sleep between batches
             time.sleep(2)
 
+    def finish_claim(self, pid, enqueued_at, done):
+        """Saca el producto de la cola, o lo devuelve con cooldown (descartado tras MAX_ATTEMPTS fallos)."""
+        try:
+            with connection.cursor() as cur:
+                if done:
+                    cur.execute(SQL_DONE, (pid, enqueued_at))
+                else:
+                    cur.execute(SQL_RETRY, {
+                        "product_id": pid, "enqueued_at": enqueued_at,
+                        "max_attempts": MAX_ATTEMPTS, "cooldown": RETRY_COOLDOWN,
+                    })
+        except Exception as e:
+            # El lease vence y otro classifier (o este) lo vuelve a tomar
+            logger.warning(f"   ⚠️ No se pudo actualizar la cola para {pid}: {e}")
+
+    def release_claims(self):
+        """Devuelve a la cola lo tomado por este worker que no llegó a clasificarse (apagado ordenado)."""
+        try:
+            close_old_connections()
+            with connection.cursor() as cur:
+                cur.execute(SQL_RELEASE, (WORKER_ID,))
+                released = cur.rowcount
+            if released:
+                logger.info(f"↩️ {released} productos devueltos a la cola")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron liberar los claims (vencen en {LEASE_SECONDS}s): {e}")
+
     def classify_product(self, prod):
         # 0. COMBINED CONTEXT: Title + Intro of Description
         term = prod.title or ""
@@ -110,6 +185,8 @@ class Command(BaseCommand):
                     vector = row[0]
                     # Buscar vecinos visuales CON sus categorías (Query Avanzada)
                     # Usamos ARRAY_AGG para compactar las categorías de cada vecino en una sola fila
+                    # Pista de contexto para el LLM: 5 vecinos con ef_search bajo alcanzan
+                    neighbor_ids = [pid for pid, _ in VectorSearchService.nearest(cur, vector, 5, exclude_id=prod.product_id, ef_search=40)]
                     sql_neighbors = """
                         SELECT 
                             p.title,
@@ -123,14 +200,11 @@ class Command(BaseCommand):
                                 ), 
                                 ''
                             ) as neighbor_cats
-                        FROM product_embeddings pe
-                        JOIN products p ON pe.product_id = p.product_id
-                        WHERE pe.product_id != %s 
-                        AND pe.embedding_visual IS NOT NULL
-                        ORDER BY pe.embedding_visual <=> %s
-                        LIMIT 5
+                        FROM products p
+                        WHERE p.product_id = ANY(%s)
+                        ORDER BY array_position(%s::bigint[], p.product_id)
                     """
-                    cur.execute(sql_neighbors, (prod.product_id, vector))
+                    cur.execute(sql_neighbors, (neighbor_ids, neighbor_ids))
                     
                     neighbors = cur.fetchall()
                     if neighbors:
@@ -167,14 +241,18 @@ class Command(BaseCommand):
             industry = result.get('parent_industry')
             level = result.get('classification') # INDUSTRY, CONCEPT, PRODUCT
             
+            # UPDATE SPECIFIC FIELDS ONLY to avoid touching generated columns like profit_margin
+            # y solo si sigue sin concepto: nunca se pisa una clasificación ya hecha
+            unclassified = Product.objects.filter(pk=prod.pk, taxonomy_concept__isnull=True)
             if concept_name:
-                prod.taxonomy_concept = concept_name
-                prod.taxonomy_industry = industry
-                prod.taxonomy_level = level
-                # UPDATE SPECIFIC FIELDS ONLY to avoid touching generated columns like profit_margin
-                prod.save(update_fields=['taxonomy_concept', 'taxonomy_industry', 'taxonomy_level'])
+                updated = unclassified.update(
+                    taxonomy_concept=concept_name, taxonomy_industry=industry, taxonomy_level=level,
+                )
                 logger.info(f"   ✅ {term[:30]}... -> [{industry}] > [{concept_name}]")
             else:
                 logger.warning(f"   ⚠️ No concept name returned for {term}")
-                prod.taxonomy_concept = "UNKNOWN"
-                prod.save(update_fields=['taxonomy_concept'])
+                updated = unclassified.update(taxonomy_concept="UNKNOWN")
+            if not updated:
+                logger.info(f"   ↪️ {prod.product_id} ya estaba clasificado; se conserva su concepto")
+            return True
+        return False
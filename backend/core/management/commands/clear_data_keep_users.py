@@ -21,13 +21,21 @@ DELETE_ORDER = [
     "core.WorkflowProgress",
     "core.ReportBatch",
     # Productos / clusters (hijos primero)
+    "core.ProductEmbeddingQueue",
+    "core.ProductClassificationQueue",
     "core.ProductEmbedding",
+    "core.ImageUrlCache",
+    "core.ImageFetchFailure",
+    "core.ImageEmbedding",
     "core.ProductClusterMembership",
     "core.MarketIntelligenceLog",
     "core.UniqueProductCluster",
     "core.ProductCategory",
+    "core.ProductStockDaily",
+    "core.ProductStockLatest",
     "core.ProductStockLog",
     "core.Product",
+    "core.ProductRawBlob",
     "core.AIFeedback",
     "core.ClusterDecisionLog",
     "core.ClusterConfig",
@@ -18,6 +18,9 @@ from dotenv import load_dotenv
 
 from django.db.models import F
 from django.db.models.functions import Now
+
+from core.services.vector_search_service import VectorSearchService
+
 load_dotenv()
 
 # ─────── Configuración de Logs ───────
@@ -228,22 +231,19 @@ def run_hybrid_clustering(conn):
         CONFIG = load_config(cur, concept_name=concept)
         
         # 3. Buscar Candidatos (Vector Search RESTRINGIDO al Bucket)
-        # Solo buscamos items que sean del mismo concepto taxonómico
+        # Solo buscamos items que sean del mismo concepto taxonómico y ya agrupados
+        # ef_search bajo: solo 5 candidatos por producto y cientos de productos por ciclo (el filtro usa iterative scan)
+        neighbors = VectorSearchService.nearest(cur, vector, 5, exclude_id=pid, concept=concept, clustered_only=True,
+                                                ef_search=40)
         sql_candidates = """
-            SELECT 
-                p.product_id, p.title, p.url_image_s3,
-                pcm.cluster_id,
-                (pe.embedding_visual <=> %s) as distance
-            FROM product_embeddings pe
-            JOIN products p ON pe.product_id = p.product_id
+            SELECT p.product_id, p.title, p.url_image_s3, pcm.cluster_id
+            FROM products p
             JOIN product_cluster_membership pcm ON p.product_id = pcm.product_id
-            WHERE pe.product_id != %s
-            AND p.taxonomy_concept = %s  -- <-- OPTIMIZACIÓN CRÍTICA (Nivel 2)
-            ORDER BY distance ASC
-            LIMIT 5
+            WHERE p.product_id = ANY(%s)
         """
-        cur.execute(sql_candidates, (vector, pid, concept))
-        raw_candidates = cur.fetchall()
+        cur.execute(sql_candidates, ([c_pid for c_pid, _ in neighbors],))
+        details = {row[0]: row for row in cur.fetchall()}
+        raw_candidates = [details[c_pid] + (dist,) for c_pid, dist in neighbors if c_pid in details]
         
         best_score = 0.0
         best_match = None
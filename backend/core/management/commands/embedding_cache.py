@@ -0,0 +1,76 @@
+"""
+Mantenimiento de la caché de embeddings del vectorizer (image_embeddings / image_url_cache).
+
+- --prune: desalojo LRU. Borra las imágenes sin aciertos en --max-age-days y, si aún
+  quedan más de --max-entries, las de last_used_at más viejo. Las URLs que apuntaban a
+  ellas se borran en cascada.
+- --purge-model: borra los vectores de otro modelo (tras cambiar MODEL_NAME).
+- Sin flags: muestra estadísticas.
+
+Uso:
+  python backend/manage.py embedding_cache
+  python backend/manage.py embedding_cache --prune [--max-age-days 90] [--max-entries 2000000] [--dry-run]
+  python backend/manage.py embedding_cache --purge-model google/siglip-so400m-patch14-384
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import ImageEmbedding, ImageUrlCache, ProductEmbedding
+
+
+class Command(BaseCommand):
+    help = "Estadísticas y desalojo LRU de la caché de embeddings por imagen/URL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prune", action="store_true", help="Desalojar entradas poco usadas (LRU).")
+        parser.add_argument("--max-age-days", type=int, default=90, help="Días sin aciertos antes de desalojar (default: 90).")
+        parser.add_argument("--max-entries", type=int, default=None, help="Máximo de imágenes a conservar.")
+        parser.add_argument("--purge-model", metavar="MODELO_ACTUAL", help="Borrar vectores de cualquier modelo distinto a este.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se borraría.")
+
+    def handle(self, *args, **options):
+        if options["purge_model"]:
+            self.purge_model(options["purge_model"], options["dry_run"])
+        if options["prune"]:
+            self.prune(options["max_age_days"], options["max_entries"], options["dry_run"])
+        self.stats()
+
+    def purge_model(self, current_model, dry_run):
+        stale = ImageEmbedding.objects.exclude(model=current_model)
+        if dry_run:
+            self.stdout.write(f"  Vectores de otros modelos a borrar: {stale.count()}")
+            return
+        deleted, _ = stale.delete()
+        self.stdout.write(f"  Borrados (con sus URLs): {deleted}")
+
+    def prune(self, max_age_days, max_entries, dry_run):
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        expired = ImageEmbedding.objects.filter(last_used_at__lt=cutoff)
+        overflow = ImageEmbedding.objects.none()
+        if max_entries is not None:
+            keep = ImageEmbedding.objects.filter(last_used_at__gte=cutoff).order_by("-last_used_at")
+            overflow = ImageEmbedding.objects.filter(
+                last_used_at__gte=cutoff
+            ).exclude(image_hash__in=keep.values("image_hash")[:max_entries])
+
+        if dry_run:
+            self.stdout.write(f"  Sin aciertos desde {cutoff:%Y-%m-%d}: {expired.count()}")
+            if max_entries is not None:
+                self.stdout.write(f"  Por encima de {max_entries} entradas: {overflow.count()}")
+            return
+        deleted_expired, _ = expired.delete()
+        deleted_overflow, _ = overflow.delete() if max_entries is not None else (0, None)
+        self.stdout.write(f"  Desalojadas: {deleted_expired} por antigüedad, {deleted_overflow} por tamaño (incluye URLs)")
+
+    def stats(self):
+        images = ImageEmbedding.objects.count()
+        urls = ImageUrlCache.objects.count()
+        embeddings = ProductEmbedding.objects.filter(embedding_visual__isnull=False).count()
+        self.stdout.write(f"  Imágenes en caché: {images} | URLs: {urls} | Productos con embedding: {embeddings}")
+        if embeddings and images:
+            self.stdout.write(f"  Productos por imagen distinta: {embeddings / images:.2f}")
+        for row in ImageEmbedding.objects.values("model").annotate(total=Count("image_hash")).order_by("-total"):
+            self.stdout.write(f"    {row['model']}: {row['total']}")
@@ -8,18 +8,27 @@ import logging
 import pathlib
 import sys
 import time
-import gzip
+import io
+import re
 import shutil
 from datetime import datetime
+from hashlib import blake2b
 from collections import defaultdict
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.management.base import BaseCommand
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text, MetaData
+from sqlalchemy import bindparam, create_engine, select, text, MetaData
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.dialects.postgresql import insert
 
+from core.loader_bot.archiver import SEGMENT_SUFFIXES, SegmentArchiver, open_segment, segment_basename
+from core.loader_bot.file_watcher import RawDirWatcher
+from core.loader_bot import stock_history
+from core.models import ProductRawBlob
+
 load_dotenv()
 
 # ─────── Configuración de Logs ───────
@@ -46,18 +55,158 @@ PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 # Configuración
 PROCESS_INTERVAL = 300  # 5 minutos
 COMPRESS_PROCESSED = True  # Comprimir archivos procesados en lugar de eliminarlos
+RAW_FILE_PREFIX = "raw_products_"  # Solo segmentos del scraper (no otros JSONL de raw_data)
+SEEN_RECORD_TYPE = "seen"  # Líneas heartbeat del scraper: productos vistos sin cambios
+TOUCH_CHUNK_SIZE = 10000  # IDs por UPDATE de last_seen_at
+
+# Ingesta: "copy" → COPY a tablas temporales de staging + INSERT ... SELECT ... ON CONFLICT
+#          "insert" → un INSERT ... VALUES por tabla con todo el archivo (legacy)
+INGEST_MODE = os.getenv("LOADER_INGEST_MODE", "copy").lower()
+COPY_CHUNK_SIZE = int(os.getenv("LOADER_COPY_CHUNK_SIZE", "5000"))  # registros por chunk de COPY
+
+# Detección de segmentos: despertar apenas el scraper publica uno (watchdog o polling).
+# PROCESS_INTERVAL queda como escaneo periódico de respaldo.
+WATCH_ENABLED = os.getenv("LOADER_WATCH", "True").lower() in ("1", "true", "yes")
+WATCH_POLL_SECONDS = float(os.getenv("LOADER_WATCH_POLL_SECONDS", "2"))  # solo sin watchdog
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("LOADER_WATCH_DEBOUNCE_SECONDS", "1"))  # agrupar segmentos seguidos
+# Backpressure: tras un ciclo de N segundos, pausar N * ratio antes del siguiente (DB lenta → menos presión)
+BACKPRESSURE_RATIO = float(os.getenv("LOADER_BACKPRESSURE_RATIO", "0.5"))
+
+# Workers: N archivos en paralelo. Cada worker toma un archivo con un lease atómico
+# (rename a RAW_DIR/inflight/); sirve también con varios contenedores loader.
+WORKERS = int(os.getenv("LOADER_WORKERS", "1"))
+INFLIGHT_DIRNAME = "inflight"
+LEASE_TIMEOUT = int(os.getenv("LOADER_LEASE_TIMEOUT", "900"))  # s sin actividad → lease vencido
+
+# Archivado en segundo plano: el segmento cargado se mueve a processed/.pending/ al instante
+# y un pool lo recomprime (zstd multihilo; gzip si zstandard no está instalado)
+ARCHIVE_FORMAT = os.getenv("LOADER_ARCHIVE_FORMAT", "zstd") if COMPRESS_PROCESSED else "none"
+ARCHIVE_WORKERS = int(os.getenv("LOADER_ARCHIVE_WORKERS", "2"))
+ARCHIVE_LEVEL = int(os.getenv("LOADER_ARCHIVE_LEVEL", "3"))
+ARCHIVE_THREADS = int(os.getenv("LOADER_ARCHIVE_THREADS", "-1"))  # zstd: -1 = un hilo por core
+
+# Procesamiento en streaming: productos por chunk (commit + checkpoint .offset por chunk)
+CHUNK_SIZE = int(os.getenv("LOADER_CHUNK_SIZE", "5000"))
+
+# Esquema: solo se reflejan las tablas destino, una vez; se vuelven a reflejar cuando
+# cambia django_migrations (consulta trivial por archivo en lugar de reflejar toda la DB)
+LOADER_TABLES = (
+    "products", "suppliers", "warehouses", "product_stock_log", "product_stock_latest", "product_raw_blobs",
+)
+SCHEMA_VERSION_SQL = "SELECT COUNT(*), MAX(id) FROM django_migrations"
+
+# Columnas que se actualizan ante conflicto (compartidas por ambos modos de ingesta)
+WAREHOUSE_UPSERT_COLUMNS = ("last_seen_at",)
+SUPPLIER_UPSERT_COLUMNS = ("name", "store_name", "plan_name", "is_verified", "updated_at")
+PRODUCT_UPSERT_COLUMNS = (
+    "sale_price", "suggested_price", "updated_at", "last_seen_at", "description",
+    "url_image_s3", "is_active", "sku", "title", "product_type",
+    "raw_data",  # Legacy: se deja en NULL al reescribir (el payload vive en product_raw_blobs)
+    "raw_blob_digest",
+    "supplier_id",  # Actualizar supplier también
+    "captured_at",
+    "content_hash",
+)
+# Columnas que forman el content_hash (sin timestamps de carga/captura)
+PRODUCT_HASH_COLUMNS = (
+    "supplier_id", "sku", "title", "description", "sale_price", "suggested_price",
+    "product_type", "url_image_s3", "is_active", "raw_blob_digest",
+)
+# Con archivos en paralelo el orden de carga no está garantizado: nunca pisar datos
+# capturados después de los que trae la fila entrante. Y si el contenido no cambió,
+# no reescribir la fila (WAL, TOAST de raw_data, updated_at que miran otros workers).
+PRODUCT_UPSERT_GUARD = (
+    "({table}.captured_at IS NULL OR {table}.captured_at <= EXCLUDED.captured_at) "
+    "AND {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+)
+# Productos sin cambios: solo se avanzan last_seen_at y captured_at (UPDATE angosto, sin TOAST)
+PRODUCT_TOUCH_COLUMNS = ("last_seen_at", "captured_at")
+PRODUCT_TOUCH_GUARD = "t.content_hash = s.content_hash AND t.captured_at < s.captured_at"
+# Historial de stock: solo se registra un cambio de cantidad posterior al último valor conocido
+STOCK_CHANGE_GUARD = (
+    "{table}.stock_qty IS DISTINCT FROM EXCLUDED.stock_qty AND {table}.snapshot_at < EXCLUDED.snapshot_at"
+)
+STOCK_PARTITION_MONTHS_AHEAD = int(os.getenv("STOCK_PARTITION_MONTHS_AHEAD", "2"))
+# Ruta COPY: condiciones del UPDATE de dimensiones compartidas (t = fila actual, s = staging).
+# last_seen_at de bodegas se refresca con granularidad de una hora para no bloquear la fila en cada chunk.
+WAREHOUSE_TOUCH_GUARD = "t.last_seen_at IS NULL OR t.last_seen_at < s.last_seen_at - interval '1 hour'"
+SUPPLIER_CHANGE_GUARD = (
+    "(t.name, t.store_name, t.plan_name, t.is_verified) "
+    "IS DISTINCT FROM (s.name, s.store_name, s.plan_name, s.is_verified)"
+)
+
+
+def row_hash(row, columns=PRODUCT_HASH_COLUMNS):
+    """Hash (hex, 32 caracteres) del contenido de una fila de products."""
+    payload = json.dumps([row.get(c) for c in columns], sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"), default=str)
+    return blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def copy_value(value):
+    """Valor Python → campo del formato text de COPY (NULL = \\N, escapes de \\, tab y saltos de línea)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()  # bytea en formato hex (\x escapado para COPY)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+
+
+def copy_rows(cursor, table, columns, rows):
+    """COPY de `rows` (dicts) a `table` en formato text. El buffer vive solo durante el chunk."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(copy_value(row.get(c)) for c in columns))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
 
 class Command(BaseCommand):
     help = 'ETL Loader Daemon con Validación de Calidad y Gestión de Archivos'
+    raw_dir = RAW_DIR
+    pool = None
+    _engine = None
+    _engine_lock = threading.Lock()
+    _schema = None  # (versión de migraciones, tablas)
+    _schema_lock = threading.Lock()
+    archiver = None  # SegmentArchiver (pool en el daemon; síncrono si se usa sin handle())
+    archive_processed = True  # False: los segmentos cargados se borran (loader_replay)
+    apply_heartbeats = True  # False: ignorar líneas "seen" (un reproceso no es evidencia de que el producto sigue vivo)
 
     def handle(self, *args, **options):
-        logger.info("🚀 LOADER DAEMON INICIADO (Ciclo de 5 minutos)")
+        watcher = None
+        if WATCH_ENABLED:
+            watcher = RawDirWatcher(self.raw_dir, prefix=RAW_FILE_PREFIX, poll_interval=WATCH_POLL_SECONDS).start()
+            logger.info(f"🚀 LOADER DAEMON INICIADO (Eventos de RAW_DIR vía {watcher.mode} + escaneo cada {PROCESS_INTERVAL}s)")
+        else:
+            logger.info("🚀 LOADER DAEMON INICIADO (Ciclo de 5 minutos)")
+        
+        if WORKERS > 1:
+            self.pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="loader-worker")
+            logger.info(f"👷 {WORKERS} workers en paralelo (lease por archivo en {INFLIGHT_DIRNAME}/)")
         
-        session = self.get_session()
+        self.archiver = self.build_archiver(ARCHIVE_WORKERS)
+        self.archiver.recover(stale_after=LEASE_TIMEOUT)
+        logger.info(f"🗜️ Archivado en segundo plano: {self.archiver.format} con {ARCHIVE_WORKERS} worker(s)")
         
         while True:
             try:
                 cycle_start = time.time()
+                if watcher:
+                    watcher.clear()  # Lo que llegue desde ahora dispara el próximo ciclo
+                
+                # Leases de workers caídos vuelven a la cola (y sus archivados a medias, al pool)
+                self.recover_stale_leases()
+                self.archiver.recover(stale_after=LEASE_TIMEOUT)
+                self.ensure_stock_partitions()
                 
                 # Obtener archivos en orden cronológico (más viejo primero)
                 files = self.get_files_chronologically()
@@ -66,19 +215,14 @@ class Command(BaseCommand):
                     logger.info("⏳ Sin archivos pendientes. Esperando próximo ciclo...")
                 else:
                     logger.info(f"📂 Encontrados {len(files)} archivo(s) para procesar")
-                    
-                    for filepath in files:
-                        try:
-                            self.process_file_complete(filepath, session)
-                        except Exception as e:
-                            logger.error(f"❌ Error procesando {filepath.name}: {e}")
-                            logger.error(traceback.format_exc())
-                            # Mover a failed para no bloquear
-                            self.archive_file(filepath, success=False, reason=str(e))
-                            # Continuar con el siguiente archivo
+                    self.process_backlog(files)
                 
-                # Esperar hasta completar el ciclo de 5 minutos
                 elapsed = time.time() - cycle_start
+                if watcher:
+                    self.wait_for_files(watcher, elapsed)
+                    continue
+                
+                # Esperar hasta completar el ciclo de 5 minutos
                 remaining = PROCESS_INTERVAL - elapsed
                 
                 if remaining > 0:
@@ -89,47 +233,183 @@ class Command(BaseCommand):
 
             except KeyboardInterrupt:
                 logger.info("⏹️ Deteniendo loader (Ctrl+C)...")
+                if watcher:
+                    watcher.stop()
+                if self.pool:
+                    self.pool.shutdown(wait=True)
+                self.archiver.shutdown(wait=True)  # Terminar las compresiones en curso
                 break
             except Exception as e:
                 logger.error(f"💥 Error crítico en loop principal: {e}")
                 time.sleep(30)
-                try:
-                    session = self.get_session()  # Reconnect
-                except Exception as reconnect_error:
-                    logger.error(f"❌ Error reconectando a DB: {reconnect_error}")
+                self.reset_sessions()  # Reconnect (cada worker crea su sesión nueva al siguiente archivo)
+
+    def wait_for_files(self, watcher, elapsed):
+        """
+        Espera el próximo segmento (o el escaneo de respaldo de PROCESS_INTERVAL).
+        
+        Backpressure: si el ciclo anterior fue lento (DB bajo carga), primero se pausa
+        elapsed * BACKPRESSURE_RATIO; los segmentos que lleguen mientras tanto se
+        acumulan y se procesan juntos en el siguiente ciclo.
+        """
+        cooldown = min(elapsed * BACKPRESSURE_RATIO, PROCESS_INTERVAL)
+        if cooldown >= 1:
+            logger.info(f"🐢 Ciclo de {int(elapsed)}s. Pausa de {int(cooldown)}s antes del siguiente (backpressure)...")
+            time.sleep(cooldown)
+        
+        if watcher.wait(PROCESS_INTERVAL):
+            time.sleep(WATCH_DEBOUNCE_SECONDS)  # Agrupar segmentos publicados casi a la vez
+            logger.info("⚡ Segmento nuevo detectado")
+        else:
+            logger.info(f"⏳ Escaneo periódico ({PROCESS_INTERVAL}s sin eventos)")
+
+    # ─────── Workers y leases ───────
+
+    def process_backlog(self, files):
+        """
+        Procesa `files` (más viejo primero) con el pool de workers, o en serie si no hay pool.
+        Cada archivo se toma con un lease: si otro worker/proceso lo tomó, se salta.
+        """
+        if self.pool is None:
+            for filepath in files:
+                self.process_leased_file(filepath)
+        else:
+            list(self.pool.map(self.process_leased_file, files))
+
+    def process_leased_file(self, filepath):
+        """Toma el lease de `filepath`, lo procesa y lo archiva. Retorna False si no se obtuvo el lease."""
+        lease = self.claim_file(filepath)
+        if lease is None:
+            return False
+        try:
+            self.process_file_complete(lease, self.worker_session())
+        except Exception as e:
+            logger.error(f"❌ Error procesando {lease.name}: {e}")
+            logger.error(traceback.format_exc())
+            # Mover a failed para no bloquear
+            self.archive_file(lease, success=False, reason=str(e))
+        finally:
+            if lease.exists():
+                # No se archivó (error transitorio de DB o lectura): reintentar en el próximo ciclo
+                self.release_file(lease)
+        return True
+
+    @property
+    def inflight_dir(self):
+        path = self.raw_dir / INFLIGHT_DIRNAME
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def claim_file(self, filepath):
+        """Lease atómico: rename a inflight/. Retorna la ruta del lease o None si otro worker ganó."""
+        lease = self.inflight_dir / filepath.name
+        checkpoint = self.checkpoint_path(filepath)
+        try:
+            os.rename(filepath, lease)
+        except FileNotFoundError:
+            return None
+        os.utime(lease)  # El rename conserva el mtime: marcar el inicio del lease
+        if checkpoint.exists():
+            os.replace(checkpoint, self.checkpoint_path(lease))
+        return lease
+
+    def release_file(self, lease):
+        """Devuelve un lease a RAW_DIR (checkpoint primero: quien lo tome ve el progreso)."""
+        target = self.raw_dir / lease.name
+        checkpoint = self.checkpoint_path(lease)
+        if checkpoint.exists():
+            os.replace(checkpoint, self.checkpoint_path(target))
+        os.replace(lease, target)
+
+    def recover_stale_leases(self):
+        """Leases sin actividad (archivo ni checkpoint) en LEASE_TIMEOUT: el worker murió."""
+        now = time.time()
+        for lease in list(self.inflight_dir.iterdir()):
+            if not lease.name.startswith(RAW_FILE_PREFIX) or not lease.name.endswith(SEGMENT_SUFFIXES):
+                continue
+            try:
+                checkpoint = self.checkpoint_path(lease)
+                activity = max(p.stat().st_mtime for p in (lease, checkpoint) if p.exists())
+                if now - activity > LEASE_TIMEOUT:
+                    logger.warning(f"♻️ Lease vencido ({int(now - activity)}s sin actividad): {lease.name}. Devolviendo a la cola...")
+                    self.release_file(lease)
+            except (FileNotFoundError, ValueError):
+                continue  # Otro worker lo archivó mientras tanto
+
+    def worker_session(self):
+        """Sesión de DB propia del hilo actual (las sesiones SQLAlchemy no son thread-safe)."""
+        if not hasattr(self, "_sessions"):
+            self._sessions = threading.local()
+            self._session_generation = 0
+        local = self._sessions
+        if getattr(local, "generation", None) != self._session_generation:
+            if getattr(local, "session", None) is not None:
+                local.session.close()  # Devuelve la conexión al pool
+            local.session = self.get_session()
+            local.generation = self._session_generation
+        return local.session
+
+    def reset_sessions(self):
+        """
+        Invalida las sesiones de todos los workers (se recrean al próximo uso) y vacía
+        el pool de conexiones: tras un error crítico las conexiones pueden estar muertas.
+        """
+        self._session_generation = getattr(self, "_session_generation", 0) + 1
+        if Command._engine is not None:
+            Command._engine.dispose()
+
+    @property
+    def engine(self):
+        """Engine único del proceso (pool compartido por los workers), creado al primer uso."""
+        with Command._engine_lock:
+            if Command._engine is None:
+                user = os.getenv("POSTGRES_USER", "droptools_admin")
+                pwd = os.getenv("POSTGRES_PASSWORD", "secure_password_123")
+                host = os.getenv("POSTGRES_HOST", "127.0.0.1")
+                port = os.getenv("POSTGRES_PORT", "5433")
+                dbname = os.getenv("POSTGRES_DB", "droptools_db")
+                raw_db_url = f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{dbname}"
+
+                Command._engine = create_engine(
+                    raw_db_url,
+                    echo=False,
+                    json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
+                    connect_args={'client_encoding': 'utf8'},
+                    pool_size=max(WORKERS, 1) + 1,
+                    pool_pre_ping=True,  # Descarta conexiones cortadas por la DB entre archivos
+                )
+            return Command._engine
 
     def get_session(self):
-        """Crea sesión de base de datos"""
-        user = os.getenv("POSTGRES_USER", "droptools_admin")
-        pwd = os.getenv("POSTGRES_PASSWORD", "secure_password_123")
-        host = os.getenv("POSTGRES_HOST", "127.0.0.1")
-        port = os.getenv("POSTGRES_PORT", "5433")
-        dbname = os.getenv("POSTGRES_DB", "droptools_db")
-        raw_db_url = f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{dbname}"
-        
-        engine = create_engine(
-            raw_db_url, 
-            echo=False, 
-            json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
-            connect_args={'client_encoding': 'utf8'}
-        )
-        Session = sessionmaker(bind=engine)
-        return Session()
+        """Crea sesión de base de datos sobre el engine compartido"""
+        return sessionmaker(bind=self.engine)()
+
+    @staticmethod
+    def batch_basename(filepath):
+        """Nombre sin extensión (.jsonl, .jsonl.gz o .jsonl.zst): raw_products_YYYYMMDD_HHMMSS[_N]"""
+        return segment_basename(filepath.name)
+
+    @staticmethod
+    def open_batch_file(filepath):
+        """Abre un segmento en modo texto (.gz y .zst se descomprimen en streaming)."""
+        return open_segment(filepath, "rt")
 
     def get_files_chronologically(self):
         """
-        Obtiene archivos .jsonl en orden cronológico (más viejo primero)
+        Obtiene segmentos del scraper en orden cronológico (más viejo primero)
         basándose en el timestamp en el nombre del archivo.
-        """
-        files = list(RAW_DIR.glob("*.jsonl"))
         
-        # Filtrar archivos que no sean de offset
-        files = [f for f in files if not f.name.endswith('.offset')]
+        - raw_products_*.jsonl.gz: segmentos publicados atómicamente (siempre completos)
+        - raw_products_*.jsonl: formato legacy sin comprimir
+        - raw_products_*.jsonl.zst: archivos de processed/ reinyectados por loader_replay
+        Los .part (segmentos en escritura) empiezan con punto y nunca coinciden con el glob.
+        """
+        files = [f for suffix in SEGMENT_SUFFIXES for f in self.raw_dir.glob(f"{RAW_FILE_PREFIX}*{suffix}")]
         
-        # Ordenar por timestamp en el nombre (formato: raw_products_YYYYMMDD_HHMMSS.jsonl)
+        # Ordenar por timestamp en el nombre (formato: raw_products_YYYYMMDD_HHMMSS[_N].jsonl[.gz])
         try:
-            files.sort(key=lambda f: f.stem.split('_')[-2:])  # Ordena por fecha y hora
-        except:
+            files.sort(key=lambda f: [int(n) for n in re.findall(r'\d+', self.batch_basename(f))])
+        except Exception:
             # Fallback: ordenar por fecha de modificación
             files.sort(key=lambda f: f.stat().st_mtime)
         
@@ -137,72 +417,71 @@ class Command(BaseCommand):
 
     def process_file_complete(self, filepath, session):
         """
-        Procesa un archivo completo con validación de calidad y gestión.
+        Procesa un archivo en streaming, por chunks de CHUNK_SIZE productos.
         
         Pasos:
-        1. Leer y validar productos
-        2. Insertar en DB con ON CONFLICT
+        1. Reflejar las tablas destino
+        2. Por chunk: leer y validar productos, insertar en DB con ON CONFLICT,
+           commit y checkpoint (.offset) con la última línea confirmada
         3. Validar calidad de inserción
         4. Comprimir/mover archivo si todo OK
+        
+        La memoria queda acotada al chunk. Si el proceso muere a mitad de archivo,
+        el siguiente intento retoma desde el checkpoint en lugar de reprocesarlo entero.
         """
         logger.info(f"📂 Procesando archivo: {filepath.name}")
         
-        # ─── PASO 1: Leer y Validar Productos ───
-        products_raw = []
-        products_valid = []
+        # ─── PASO 1: Preparar Metadata DB ───
+        tables = self.reflect_tables(session)
+        if tables is None:
+            return
+        
+        # ─── PASO 2: Leer, Validar e Insertar por Chunks ───
+        start_line = self.read_checkpoint(filepath)
+        if start_line:
+            logger.info(f"   ⏩ Reanudando desde la línea {start_line} (checkpoint)")
+        
+        chunk = []
+        chunk_seen = []
         stats = {
             "total_lines": 0,
             "valid_products": 0,
             "no_image": 0,
             "no_product_id": 0,
             "no_supplier_id": 0,  # NUEVO: productos sin proveedor
-            "json_errors": 0
+            "seen_unchanged": 0,  # IDs reportados en heartbeats "seen"
+            "json_errors": 0,
+            "processed": 0,  # Filas insertadas/actualizadas en products
+            "chunks": 0
         }
         
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            line_num = start_line
+            with self.open_batch_file(filepath) as f:
                 for line_num, line in enumerate(f, 1):
-                    stats["total_lines"] += 1
+                    if line_num <= start_line:
+                        continue  # Ya confirmado en un intento anterior
                     
-                    if not line.strip():
-                        continue
+                    stats["total_lines"] += 1
                     
-                    # Log de progreso cada 5000 líneas para archivos grandes
-                    if line_num % 5000 == 0:
-                        logger.info(f"   ...Leyendo línea {line_num}")
-
+                    if line.strip():
+                        # Log de progreso cada 5000 líneas para archivos grandes
+                        if line_num % 5000 == 0:
+                            logger.info(f"   ...Leyendo línea {line_num}")
+                        self.validate_line(line, line_num, chunk, chunk_seen, stats)
                     
-                    try:
-                        record = json.loads(line)
-                        products_raw.append(record)
-                        
-                        # Validación 1: product_id obligatorio
-                        if not record.get("id"):
-                            stats["no_product_id"] += 1
-                            continue
-                        
-                        # Validación 2: supplier_id obligatorio (clave compuesta)
-                        supplier = record.get("supplier", {})
-                        if not supplier or not supplier.get("id"):
-                            stats["no_supplier_id"] += 1
-                            continue
-                        
-                        # Validación 3: imagen obligatoria (solo para nuevos productos)
-                        # La imagen puede actualizarse después, pero debe existir inicialmente
-                        if not record.get("image_url"):
-                            stats["no_image"] += 1
-                            continue
-                        
-                        # Producto válido
-                        products_valid.append(record)
-                        stats["valid_products"] += 1
-                        
-                    except json.JSONDecodeError as e:
-                        stats["json_errors"] += 1
-                        logger.warning(f"   ⚠️ Línea {line_num}: JSON inválido")
-                        continue
+                    if len(chunk) >= CHUNK_SIZE or len(chunk_seen) >= TOUCH_CHUNK_SIZE:
+                        if not self.flush_chunk(filepath, chunk, chunk_seen, line_num, session, tables, stats):
+                            self.archive_file(filepath, success=False, stats=stats, reason=f"db_chunk_failed_line_{line_num}")
+                            return
+                        chunk, chunk_seen = [], []
+            
+            if (chunk or chunk_seen) and not self.flush_chunk(filepath, chunk, chunk_seen, line_num, session, tables, stats):
+                self.archive_file(filepath, success=False, stats=stats, reason=f"db_chunk_failed_line_{line_num}")
+                return
         
         except Exception as e:
+            # Los chunks ya confirmados quedan en el checkpoint: el próximo ciclo retoma desde ahí
             logger.error(f"❌ Error leyendo archivo {filepath.name}: {e}")
             return
         
@@ -212,74 +491,166 @@ class Command(BaseCommand):
         logger.info(f"      Sin imagen: {stats['no_image']}")
         logger.info(f"      Sin product_id: {stats['no_product_id']}")
         logger.info(f"      Sin supplier_id: {stats['no_supplier_id']}")
+        logger.info(f"      Vistos sin cambios: {stats['seen_unchanged']}")
         logger.info(f"      Errores JSON: {stats['json_errors']}")
+        logger.info(f"      Chunks confirmados: {stats['chunks']}")
         
-        if stats["valid_products"] == 0:
+        # ─── PASO 3: Validar Inserción ───
+        if stats["valid_products"] == 0 and stats["seen_unchanged"] == 0 and not start_line:
             logger.warning(f"   ⚠️ No hay productos válidos en {filepath.name}. Moviendo a processed...")
             self.archive_file(filepath, success=False, reason="no_valid_products")
             return
         
-        # ─── PASO 2: Preparar Metadata DB ───
-        meta = MetaData()
+        expected_count = stats["valid_products"]
+        if stats["processed"] < expected_count:
+            logger.info(f"   ℹ️ {expected_count - stats['processed']} productos sin cambios (mismo content_hash) o duplicados dentro del archivo")
+        
+        logger.info(f"   ✅ Procesados {stats['processed']} productos de {expected_count} válidos")
+        
+        # ─── PASO 4: Archivar Archivo ───
+        self.archive_file(filepath, success=True, stats=stats)
+
+    def validate_line(self, line, line_num, chunk, chunk_seen, stats):
+        """Parsea y valida una línea: productos válidos a `chunk`, heartbeats a `chunk_seen`."""
         try:
-            meta.reflect(bind=session.get_bind())
-            t_products = meta.tables.get('products')
-            t_suppliers = meta.tables.get('suppliers')
-            t_warehouses = meta.tables.get('warehouses')
-            t_stock = meta.tables.get('product_stock_log')
-        except Exception as e:
-            logger.error(f"❌ Error reflejando tablas DB: {e}")
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            stats["json_errors"] += 1
+            logger.warning(f"   ⚠️ Línea {line_num}: JSON inválido")
             return
         
-        if not all([t_products is not None, t_suppliers is not None, t_warehouses is not None, t_stock is not None]):
-            logger.error("❌ Error CRÍTICO: Tablas no encontradas en DB")
+        # Heartbeat: productos sin cambios desde su última emisión
+        if record.get("record_type") == SEEN_RECORD_TYPE:
+            ids = []
+            for pid in record.get("ids") or []:
+                try:
+                    ids.append(int(pid))
+                except (TypeError, ValueError):
+                    stats["no_product_id"] += 1  # Igual que un producto sin id: se descarta, no frena el archivo
+            if len(ids) < len(record.get("ids") or []):
+                logger.warning(f"   ⚠️ Línea {line_num}: heartbeat con IDs no numéricos (descartados)")
+            chunk_seen.extend(ids)
+            stats["seen_unchanged"] += len(ids)
             return
         
-        # ─── PASO 3: Insertar en DB ───
-        inserted_count = self.ingest_batch_validated(
-            products_valid, 
-            session, 
-            t_products, 
-            t_suppliers, 
-            t_warehouses, 
-            t_stock
-        )
+        # Validación 1: product_id obligatorio
+        if not record.get("id"):
+            stats["no_product_id"] += 1
+            return
         
-        # ─── PASO 4: Validar Inserción ───
-        expected_count = stats["valid_products"]
+        # Validación 2: supplier_id obligatorio (clave compuesta)
+        supplier = record.get("supplier", {})
+        if not supplier or not supplier.get("id"):
+            stats["no_supplier_id"] += 1
+            return
         
-        # La diferencia es aceptable si es por duplicados, PERO solo si hubo éxito
-        if inserted_count > 0 and inserted_count < expected_count:
-            duplicate_count = expected_count - inserted_count
-            logger.info(f"   ℹ️ {duplicate_count} productos ya existían (actualizados)")
-        elif inserted_count == 0 and expected_count > 0:
-            logger.warning(f"   ⚠️ 0 productos procesados de {expected_count} válidos. Posible error en batch.")
-            # Si falló la inserción masiva (y esperábamos insertar), marcar como error
-            self.archive_file(filepath, success=False, stats=stats, reason="db_insertion_failed_zero_count")
+        # Validación 3: imagen obligatoria (solo para nuevos productos)
+        # La imagen puede actualizarse después, pero debe existir inicialmente
+        if not record.get("image_url"):
+            stats["no_image"] += 1
             return
         
-        logger.info(f"   ✅ Procesados {inserted_count} productos de {expected_count} válidos")
+        # Producto válido
+        chunk.append(record)
+        stats["valid_products"] += 1
+
+    def flush_chunk(self, filepath, records, seen_ids, line_num, session, tables, stats):
+        """
+        Confirma un chunk en una sola transacción (heartbeats + upserts) y avanza el checkpoint.
         
-        # ─── PASO 5: Archivar Archivo ───
-        self.archive_file(filepath, success=True, stats=stats)
+        Retorna: True si el chunk quedó confirmado.
+        """
+        t_products = tables[0]
+        if seen_ids and self.apply_heartbeats and not self.touch_last_seen(seen_ids, session, t_products, commit=not records):
+            return False
+        
+        if records:
+            ingest = self.ingest_batch_copy if INGEST_MODE == "copy" else self.ingest_batch_validated
+            processed = ingest(records, session, *tables)
+            if processed is None:
+                return False
+            stats["processed"] += processed
+        
+        self.write_checkpoint(filepath, line_num)
+        stats["chunks"] += 1
+        return True
 
-    def ingest_batch_validated(self, batch, session, t_products, t_suppliers, t_warehouses, t_stock):
+    def reflect_tables(self, session):
         """
-        Inserta batch con validación de duplicados por product_id.
+        Tablas destino (products, suppliers, warehouses, product_stock_log, product_stock_latest) o None si faltan.
         
-        LÓGICA DE DUPLICADOS (ESQUEMA ACTUAL):
-        - Mismo product_id = ACTUALIZAR (precio, stock, supplier, etc.)
+        Se reflejan una sola vez por proceso y se reutilizan entre archivos; solo se
+        vuelven a reflejar si cambió la versión de migraciones (se aplicó una nueva).
+        """
+        try:
+            version = tuple(session.execute(text(SCHEMA_VERSION_SQL)).one())
+            session.rollback()  # No dejar la transacción de lectura abierta
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"   ⚠️ No se pudo leer django_migrations ({e}). Reflejando esquema...")
+            version = None
         
-        NOTA: El esquema actual usa product_id como PK simple.
-        Para soportar competencia real entre proveedores, se requiere migrar
-        a clave compuesta (product_id, supplier_id).
+        cached = Command._schema
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        
+        with Command._schema_lock:
+            cached = Command._schema
+            if cached is not None and version is not None and cached[0] == version:
+                return cached[1]  # Otro worker lo reflejó mientras esperábamos
+            tables = self.load_schema(session.get_bind())
+            if tables is not None:
+                if cached is not None:
+                    logger.info("🔄 Migración detectada: esquema de tablas destino actualizado")
+                Command._schema = (version, tables)
+            return tables
+
+    def load_schema(self, bind):
+        """Refleja solo LOADER_TABLES. Retorna las tablas en ese orden o None."""
+        meta = MetaData()
+        try:
+            meta.reflect(bind=bind, only=list(LOADER_TABLES))
+        except Exception as e:
+            # reflect(only=...) falla si falta alguna tabla
+            logger.error(f"❌ Error CRÍTICO reflejando tablas DB: {e}")
+            return None
+        return tuple(meta.tables[name] for name in LOADER_TABLES)
+
+    def checkpoint_path(self, filepath):
+        """Sidecar `<basename>.offset` junto al archivo (archive_file lo elimina al archivar)."""
+        return filepath.with_name(f"{self.batch_basename(filepath)}.offset")
+
+    def read_checkpoint(self, filepath):
+        """Última línea confirmada en DB para `filepath` (0 si no hay checkpoint)."""
+        path = self.checkpoint_path(filepath)
+        try:
+            return int(json.loads(path.read_text()).get("line", 0))
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.warning(f"   ⚠️ Checkpoint ilegible {path.name} ({e}). Procesando desde el inicio.")
+            return 0
+
+    def write_checkpoint(self, filepath, line_num):
+        """Escritura atómica del checkpoint (tmp + rename)."""
+        path = self.checkpoint_path(filepath)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"line": line_num, "updated_at": datetime.utcnow().isoformat()}))
+        os.replace(tmp, path)
+
+    def build_rows(self, batch):
+        """
+        Convierte registros del scraper en filas para warehouses, suppliers,
+        products, product_stock_log y product_raw_blobs (deduplicando product_id +
+        supplier_id en el batch).
         
-        Retorna: Número de productos procesados (insertados o actualizados)
+        Retorna: (warehouses, suppliers, products, stocks, blobs) como listas de dicts
         """
         warehouses = {}
         suppliers = {}
         products = []
         stocks = []
+        blobs = {}
         now = datetime.utcnow()
         
         # Tracking de combinaciones únicas (product_id, supplier_id)
@@ -322,6 +693,8 @@ class Command(BaseCommand):
             # 3. Product
             pid = d.get("id")
             if pid and supplier_id:  # Ambos son obligatorios
+                captured_at = self.parse_capture_timestamp(d.get("capture_timestamp")) or now
+
                 # Validar combinación única DENTRO del batch
                 # (para evitar duplicados en el mismo archivo)
                 combination_key = (pid, supplier_id)
@@ -352,8 +725,11 @@ class Command(BaseCommand):
                     "last_seen_at": now,
                     "created_at": now,  # Fix: DB column has no default
                     "updated_at": now,
-                    "raw_data": d.get("raw_json", {})
+                    "raw_data": None,
+                    "raw_blob_digest": self.pack_raw_blob(d.get("raw_json") or {}, blobs, now),
+                    "captured_at": captured_at
                 })
+                products[-1]["content_hash"] = row_hash(products[-1])
                 
                 # 4. Stock Log
                 if wh_id:
@@ -361,12 +737,63 @@ class Command(BaseCommand):
                         "product_id": pid,
                         "warehouse_id": wh_id,
                         "stock_qty": int(d.get("stock") or 0),
-                        "snapshot_at": now
+                        "snapshot_at": captured_at
                     })
         
         if skipped_duplicates_in_batch > 0:
             logger.info(f"   ℹ️ Saltados {skipped_duplicates_in_batch} duplicados dentro del batch")
         
+        return list(warehouses.values()), list(suppliers.values()), products, stocks, list(blobs.values())
+
+    @staticmethod
+    def pack_raw_blob(payload, blobs, now):
+        """Comprime el payload crudo, lo agrega a `blobs` (por digest) y retorna su digest."""
+        digest, compressed, size = ProductRawBlob.pack(payload)
+        if digest not in blobs:
+            blobs[digest] = {"digest": digest, "payload": compressed, "size_bytes": size, "created_at": now}
+        return digest
+
+    def new_raw_blobs(self, blobs, session, t_raw_blobs):
+        """
+        Blobs del chunk que todavía no están en la DB: solo esos payloads viajan y se escriben.
+        FOR KEY SHARE sobre los existentes: `raw_blobs --gc` no puede borrarlos antes del commit.
+        """
+        if not blobs:
+            return []
+        existing = set(session.execute(
+            select(t_raw_blobs.c.digest)
+            .where(t_raw_blobs.c.digest.in_([b["digest"] for b in blobs]))
+            .with_for_update(read=True, key_share=True)
+        ).scalars().all())
+        return [b for b in blobs if b["digest"] not in existing]
+
+    @staticmethod
+    def parse_capture_timestamp(value):
+        """capture_timestamp del scraper (ISO, UTC) → datetime, o None si falta o es inválido."""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+
+    def ingest_batch_validated(self, batch, session, t_products, t_suppliers, t_warehouses, t_stock, t_stock_latest,
+                               t_raw_blobs):
+        """
+        Inserta batch con validación de duplicados por product_id.
+        
+        LÓGICA DE DUPLICADOS (ESQUEMA ACTUAL):
+        - Mismo product_id = ACTUALIZAR (precio, stock, supplier, etc.)
+        
+        NOTA: El esquema actual usa product_id como PK simple.
+        Para soportar competencia real entre proveedores, se requiere migrar
+        a clave compuesta (product_id, supplier_id).
+        
+        Retorna: Número de productos procesados (insertados o actualizados),
+        o None si la transacción falló (rollback)
+        """
+        warehouses, suppliers, products, stocks, blobs = self.build_rows(batch)
+        
         # ─── EJECUCIÓN MASIVA ───
         processed_count = 0
         db_start_time = time.time()
@@ -377,7 +804,7 @@ class Command(BaseCommand):
             # Bulk Warehouses
             if warehouses:
                 logger.info(f"      ↳ Insertando/Actualizando {len(warehouses)} warehouses...")
-                stmt = insert(t_warehouses).values(list(warehouses.values()))
+                stmt = insert(t_warehouses).values(warehouses)
                 stmt = stmt.on_conflict_do_update(
                     index_elements=['warehouse_id'],
                     set_={"last_seen_at": stmt.excluded.last_seen_at}
@@ -387,19 +814,19 @@ class Command(BaseCommand):
             # Bulk Suppliers
             if suppliers:
                 logger.info(f"      ↳ Insertando/Actualizando {len(suppliers)} suppliers...")
-                stmt = insert(t_suppliers).values(list(suppliers.values()))
+                stmt = insert(t_suppliers).values(suppliers)
                 stmt = stmt.on_conflict_do_update(
                     index_elements=['supplier_id'],
-                    set_={
-                        "name": stmt.excluded.name,
-                        "store_name": stmt.excluded.store_name,
-                        "plan_name": stmt.excluded.plan_name,
-                        "is_verified": stmt.excluded.is_verified,  # ← AGREGADO: Actualizar is_verified
-                        "updated_at": stmt.excluded.updated_at
-                    }
+                    set_={c: stmt.excluded[c] for c in SUPPLIER_UPSERT_COLUMNS}
                 )
                 session.execute(stmt)
             
+            # Payloads crudos: solo los digests que la DB todavía no tiene
+            written_blobs = self.new_raw_blobs(blobs, session, t_raw_blobs)
+            if written_blobs:
+                logger.info(f"      ↳ Guardando {len(written_blobs)} payloads crudos nuevos...")
+                session.execute(insert(t_raw_blobs).values(written_blobs).on_conflict_do_nothing(index_elements=['digest']))
+            
             # Bulk Products - PK: product_id
             if products:
                 logger.info(f"      ↳ Upserting {len(products)} productos...")
@@ -409,30 +836,18 @@ class Command(BaseCommand):
                 # cambiar index_elements a ['product_id', 'supplier_id']
                 stmt = stmt.on_conflict_do_update(
                     index_elements=['product_id'],  # ← PK actual (simple)
-                    set_={
-                        "sale_price": stmt.excluded.sale_price,
-                        "suggested_price": stmt.excluded.suggested_price,
-                        "updated_at": stmt.excluded.updated_at,
-                        "last_seen_at": stmt.excluded.last_seen_at,
-                        "description": stmt.excluded.description,
-                        "url_image_s3": stmt.excluded.url_image_s3,
-                        "is_active": stmt.excluded.is_active,
-                        "sku": stmt.excluded.sku,
-                        "title": stmt.excluded.title,
-                        "product_type": stmt.excluded.product_type,
-                        "raw_data": stmt.excluded.raw_data,
-                        "supplier_id": stmt.excluded.supplier_id  # Actualizar supplier también
-                    }
+                    set_={c: stmt.excluded[c] for c in PRODUCT_UPSERT_COLUMNS},
+                    where=text(PRODUCT_UPSERT_GUARD.format(table=t_products.name))
                 )
                 result = session.execute(stmt)
-                # IMPORTANTE: Verificar REALMENTE cuántos se procesaron
-                # rowcount incluye tanto INSERT como UPDATE
-                processed_count = result.rowcount if result.rowcount else len(products)
+                # rowcount: INSERT + UPDATE con contenido distinto (los sin cambios no cuentan)
+                processed_count = result.rowcount or 0
+                self.touch_unchanged_products(products, session, t_products)
             
-            # Bulk Stock Logs (Append only - histórico)
+            # Historial de stock: solo cambios respecto de product_stock_latest
             if stocks:
-                logger.info(f"      ↳ Registrando {len(stocks)} logs de stock...")
-                session.execute(insert(t_stock).values(stocks))
+                changes = self.record_stock_changes(stocks, session, t_stock, t_stock_latest)
+                logger.info(f"      ↳ Stock: {changes} cambios de {len(stocks)} registros")
             
             commit_start = time.time()
             session.commit()
@@ -440,7 +855,8 @@ class Command(BaseCommand):
             
             # Reporte de procesamiento (confiando en rowcount de PostgreSQL)
             if products:
-                logger.info(f"      💾 Rows procesados (INSERT/UPDATE): {processed_count}/{len(products)}")
+                logger.info(f"      💾 Rows procesados (INSERT/UPDATE): {processed_count}/{len(products)} "
+                            f"({len(products) - processed_count} sin cambios)")
                 
                 # NOTA: La verificación post-insert fue deshabilitada para mejorar rendimiento
                 # PostgreSQL ya reporta correctamente el número de rows afectados en result.rowcount
@@ -449,15 +865,273 @@ class Command(BaseCommand):
         except Exception as e:
             session.rollback()
             logger.error(f"   ❌ [DB ERROR] Error en inserción masiva: {e}")
-            import traceback
             logger.error(traceback.format_exc())
-            processed_count = 0
+            processed_count = None
         
         return processed_count
 
+    def ingest_batch_copy(self, batch, session, t_products, t_suppliers, t_warehouses, t_stock, t_stock_latest,
+                          t_raw_blobs):
+        """
+        Ingesta masiva vía COPY a tablas temporales de staging.
+        
+        Por cada chunk de COPY_CHUNK_SIZE registros:
+        1. COPY de warehouses, suppliers, payloads nuevos, products y stock a stage_* (temporales, sin WAL)
+        2. INSERT ... SELECT ... ON CONFLICT set-based hacia las tablas reales
+        
+        Cada llamada es un chunk del archivo (flush_chunk) y va en su propia transacción;
+        tras el commit, flush_chunk avanza el checkpoint `.offset`. Si falla, solo se
+        revierte ese chunk y el archivo se retoma desde el último checkpoint confirmado. La memoria queda
+        acotada a COPY_CHUNK_SIZE en lugar de un INSERT gigante por tabla.
+        
+        Retorna: Número de productos procesados (insertados o actualizados),
+        o None si la transacción falló (rollback)
+        """
+        processed_count = 0
+        written_blobs = 0
+        db_start_time = time.time()
+        
+        try:
+            logger.info(f"   ⚙️ [DB] Iniciando transacción masiva (COPY, chunks de {COPY_CHUNK_SIZE})...")
+            cursor = session.connection().connection.cursor()  # Misma transacción que la sesión
+            staging = {t.name: f"stage_{t.name}" for t in (t_warehouses, t_suppliers, t_raw_blobs, t_products, t_stock)}
+            
+            for start in range(0, len(batch), COPY_CHUNK_SIZE):
+                warehouses, suppliers, products, stocks, blobs = self.build_rows(batch[start:start + COPY_CHUNK_SIZE])
+                
+                # El orden respeta las FKs: warehouses/suppliers/blobs → products → stock
+                # Warehouses/suppliers se comparten entre archivos: insertar los nuevos y actualizar
+                # solo los que cambiaron evita que los workers se serialicen por el lock de fila.
+                if warehouses:
+                    self.stage_rows(cursor, t_warehouses, staging[t_warehouses.name], warehouses)
+                    cursor.execute(self.insert_new_sql(
+                        t_warehouses, staging[t_warehouses.name], "warehouse_id", warehouses
+                    ))
+                    cursor.execute(self.update_changed_sql(
+                        t_warehouses, staging[t_warehouses.name], "warehouse_id", WAREHOUSE_UPSERT_COLUMNS,
+                        WAREHOUSE_TOUCH_GUARD
+                    ))
+                if suppliers:
+                    self.stage_rows(cursor, t_suppliers, staging[t_suppliers.name], suppliers)
+                    cursor.execute(self.insert_new_sql(
+                        t_suppliers, staging[t_suppliers.name], "supplier_id", suppliers
+                    ))
+                    cursor.execute(self.update_changed_sql(
+                        t_suppliers, staging[t_suppliers.name], "supplier_id", SUPPLIER_UPSERT_COLUMNS,
+                        SUPPLIER_CHANGE_GUARD
+                    ))
+                blobs = self.new_raw_blobs(blobs, session, t_raw_blobs)
+                if blobs:
+                    self.stage_rows(cursor, t_raw_blobs, staging[t_raw_blobs.name], blobs)
+                    cursor.execute(self.insert_new_sql(t_raw_blobs, staging[t_raw_blobs.name], "digest", blobs))
+                    written_blobs += len(blobs)
+                if products:
+                    self.stage_rows(cursor, t_products, staging[t_products.name], products)
+                    cursor.execute(self.merge_sql(
+                        t_products, staging[t_products.name], "product_id", PRODUCT_UPSERT_COLUMNS, products,
+                        where=PRODUCT_UPSERT_GUARD.format(table=t_products.name)
+                    ))
+                    processed_count += max(cursor.rowcount, 0)
+                    cursor.execute(self.update_changed_sql(
+                        t_products, staging[t_products.name], "product_id", PRODUCT_TOUCH_COLUMNS,
+                        PRODUCT_TOUCH_GUARD
+                    ))
+                stock_changes = 0
+                if stocks:
+                    self.stage_rows(cursor, t_stock, staging[t_stock.name], stocks)
+                    cursor.execute(self.stock_changes_sql(t_stock, staging[t_stock.name], t_stock_latest))
+                    stock_changes = max(cursor.rowcount, 0)
+                
+                logger.info(f"      ↳ Chunk {start // COPY_CHUNK_SIZE + 1}: {len(products)} productos, "
+                            f"{stock_changes}/{len(stocks)} cambios de stock")
+            
+            commit_start = time.time()
+            session.commit()
+            logger.info(f"   ✅ [DB] Transacción completada en {time.time() - db_start_time:.2f}s (Commit: {time.time() - commit_start:.2f}s)")
+            logger.info(f"      💾 Rows procesados (INSERT/UPDATE): {processed_count}, payloads nuevos: {written_blobs}")
+        
+        except Exception as e:
+            session.rollback()
+            logger.error(f"   ❌ [DB ERROR] Error en ingesta COPY: {e}")
+            logger.error(traceback.format_exc())
+            processed_count = None
+        
+        return processed_count
+
+    def stage_rows(self, cursor, table, stage_name, rows):
+        """
+        Carga `rows` en la tabla temporal `stage_name` (misma forma que `table` + stage_seq).
+        La tabla vive solo durante la transacción (ON COMMIT DROP) y se vacía en cada chunk.
+        """
+        columns = list(rows[0])
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {stage_name} ON COMMIT DROP AS "
+            f"SELECT {', '.join(c.name for c in table.columns)}, 0::bigint AS stage_seq "
+            f"FROM {table.name} WITH NO DATA"
+        )
+        cursor.execute(f"TRUNCATE {stage_name}")
+        copy_rows(
+            cursor, stage_name, columns + ["stage_seq"],
+            ({**row, "stage_seq": seq} for seq, row in enumerate(rows)),
+        )
+
+    @staticmethod
+    def merge_sql(table, stage_name, key, update_columns, rows, where=None):
+        """
+        INSERT ... SELECT ... ON CONFLICT desde staging. Si una clave se repite en el
+        chunk gana la última fila (DISTINCT ON + stage_seq DESC): evita el error
+        "ON CONFLICT DO UPDATE command cannot affect row a second time".
+        `where` condiciona el UPDATE (p.ej. no pisar capturas más nuevas).
+        """
+        column_list = ", ".join(rows[0])
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+        return (
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"SELECT DISTINCT ON ({key}) {column_list} FROM {stage_name} ORDER BY {key}, stage_seq DESC "
+            f"ON CONFLICT ({key}) DO UPDATE SET {updates}"
+            + (f" WHERE {where}" if where else "")
+        )
+
+    @staticmethod
+    def insert_new_sql(table, stage_name, key, rows):
+        """INSERT ... ON CONFLICT DO NOTHING desde staging: no bloquea filas que ya existen."""
+        column_list = ", ".join(rows[0])
+        return (
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"SELECT DISTINCT ON ({key}) {column_list} FROM {stage_name} ORDER BY {key}, stage_seq DESC "
+            f"ON CONFLICT ({key}) DO NOTHING"
+        )
+
+    @staticmethod
+    def update_changed_sql(table, stage_name, key, update_columns, where):
+        """
+        UPDATE ... FROM staging limitado a las filas que cumplen `where` (`t` = fila actual,
+        `s` = staging). Las filas sin cambios no se tocan ni quedan bloqueadas.
+        """
+        updates = ", ".join(f"{c} = s.{c}" for c in update_columns)
+        return (
+            f"UPDATE {table.name} AS t SET {updates} "
+            f"FROM (SELECT DISTINCT ON ({key}) * FROM {stage_name} ORDER BY {key}, stage_seq DESC) AS s "
+            f"WHERE t.{key} = s.{key} AND ({where})"
+        )
+
+    def touch_last_seen(self, product_ids, session, t_products, commit=True):
+        """
+        Actualiza last_seen_at de productos reportados como vistos sin cambios.
+        Un UPDATE por bloque de IDs, sin tocar el resto de columnas ni raw_data.
+        Con commit=False queda en la transacción abierta (la confirma la ingesta del chunk).
+
+        Retorna: True si se aplicó correctamente.
+        """
+        now = datetime.utcnow()
+        start = time.time()
+        try:
+            ids = sorted({int(pid) for pid in product_ids})
+            touched = 0
+            for i in range(0, len(ids), TOUCH_CHUNK_SIZE):
+                chunk = ids[i:i + TOUCH_CHUNK_SIZE]
+                result = session.execute(
+                    t_products.update()
+                    .where(t_products.c.product_id.in_(chunk))
+                    .values(last_seen_at=now)
+                )
+                touched += result.rowcount or 0
+            if commit:
+                session.commit()
+            logger.info(f"   👁️ [DB] last_seen_at actualizado: {touched}/{len(ids)} productos en {time.time() - start:.2f}s")
+            return True
+        except Exception as e:
+            session.rollback()
+            logger.error(f"   ❌ [DB ERROR] Error actualizando last_seen_at: {e}")
+            return False
+
+    @staticmethod
+    def stock_changes_sql(t_stock, stage_name, t_stock_latest):
+        """
+        Desde staging: actualiza product_stock_latest solo donde cambió la cantidad y
+        agrega esas filas (y los pares nuevos) a product_stock_log. rowcount = cambios.
+        """
+        columns = "product_id, warehouse_id, stock_qty, snapshot_at"
+        latest = t_stock_latest.name
+        return (
+            f"WITH incoming AS ("
+            f"SELECT DISTINCT ON (product_id, warehouse_id) {columns} FROM {stage_name} "
+            f"ORDER BY product_id, warehouse_id, snapshot_at DESC, stage_seq DESC"
+            f"), changed AS ("
+            f"INSERT INTO {latest} ({columns}) SELECT {columns} FROM incoming "
+            f"ON CONFLICT (product_id, warehouse_id) DO UPDATE "
+            f"SET stock_qty = EXCLUDED.stock_qty, snapshot_at = EXCLUDED.snapshot_at "
+            f"WHERE {STOCK_CHANGE_GUARD.format(table=latest)} "
+            f"RETURNING {columns}"
+            f") INSERT INTO {t_stock.name} ({columns}) SELECT {columns} FROM changed"
+        )
+
+    def record_stock_changes(self, stocks, session, t_stock, t_stock_latest):
+        """Ruta legacy del historial de stock (misma lógica que stock_changes_sql). Retorna los cambios."""
+        incoming = {}
+        for row in stocks:  # Último valor por (producto, bodega) del batch
+            key = (row["product_id"], row["warehouse_id"])
+            if key not in incoming or incoming[key]["snapshot_at"] <= row["snapshot_at"]:
+                incoming[key] = row
+        stmt = insert(t_stock_latest).values(list(incoming.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id", "warehouse_id"],
+            set_={"stock_qty": stmt.excluded.stock_qty, "snapshot_at": stmt.excluded.snapshot_at},
+            where=text(STOCK_CHANGE_GUARD.format(table=t_stock_latest.name)),
+        ).returning(
+            t_stock_latest.c.product_id, t_stock_latest.c.warehouse_id,
+            t_stock_latest.c.stock_qty, t_stock_latest.c.snapshot_at,
+        )
+        changed = [dict(row._mapping) for row in session.execute(stmt)]
+        if changed:
+            session.execute(insert(t_stock).values(changed))
+        return len(changed)
+
+    def ensure_stock_partitions(self):
+        """Crea las particiones mensuales de product_stock_log que falten (una vez por día)."""
+        today = datetime.utcnow().date()
+        if getattr(self, "_partitions_checked", None) == today:
+            return
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if stock_history.table_exists(cursor, stock_history.DEFAULT_PARTITION):  # Tabla ya particionada
+                created = stock_history.ensure_partitions(cursor, STOCK_PARTITION_MONTHS_AHEAD, today)
+                connection.commit()
+                if created:
+                    logger.info(f"🗂️ Particiones de stock creadas: {', '.join(created)}")
+            self._partitions_checked = today
+        except Exception as e:
+            connection.rollback()
+            logger.warning(f"⚠️ No se pudieron crear particiones de stock: {e}")
+        finally:
+            connection.close()
+
+    def touch_unchanged_products(self, products, session, t_products):
+        """
+        Ruta legacy: avanza last_seen_at/captured_at de los productos que el upsert saltó
+        por tener el mismo content_hash. executemany dentro de la transacción abierta.
+        """
+        stmt = (
+            t_products.update()
+            .where(t_products.c.product_id == bindparam("b_product_id"))
+            .where(t_products.c.content_hash == bindparam("b_content_hash"))
+            .where(t_products.c.captured_at < bindparam("b_captured_at"))
+            .values(last_seen_at=bindparam("b_last_seen_at"), captured_at=bindparam("b_captured_at"))
+        )
+        params = [{f"b_{c}": p[c] for c in ("product_id", "content_hash", "captured_at", "last_seen_at")} for p in products]
+        for i in range(0, len(params), TOUCH_CHUNK_SIZE):
+            session.execute(stmt, params[i:i + TOUCH_CHUNK_SIZE])
+
+    def build_archiver(self, workers=0):
+        return SegmentArchiver(
+            self.raw_dir / "processed", fmt=ARCHIVE_FORMAT, workers=workers,
+            level=ARCHIVE_LEVEL, threads=ARCHIVE_THREADS,
+        )
+
     def archive_file(self, filepath, success=True, stats=None, reason=None):
         """
-        Archiva el archivo procesado (comprime o mueve a carpeta processed).
+        Archiva el archivo procesado (a processed, comprimido en segundo plano) o lo mueve a failed.
         
         Args:
             filepath: Ruta del archivo a archivar
@@ -467,47 +1141,39 @@ class Command(BaseCommand):
         """
         try:
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            basename = self.batch_basename(filepath)
+            suffix = filepath.name[len(basename):]
             
             if not success:
                 # Caso ERROR: Mover a failed
-                FAILED_DIR = RAW_DIR / "failed"
+                FAILED_DIR = self.raw_dir / "failed"
                 FAILED_DIR.mkdir(parents=True, exist_ok=True)
                 
-                moved_name = f"{filepath.stem}_FAILED_{timestamp}.jsonl"
+                moved_name = f"{basename}_FAILED_{timestamp}{suffix}"
                 moved_path = FAILED_DIR / moved_name
                 shutil.move(str(filepath), str(moved_path))
                 
                 # Guardar razón del error
                 if reason:
-                    with open(moved_path.with_suffix('.error.txt'), 'w') as err_f:
+                    with open(FAILED_DIR / f"{basename}_FAILED_{timestamp}.error.txt", 'w') as err_f:
                         err_f.write(str(reason))
                 
+                self.checkpoint_path(filepath).unlink(missing_ok=True)
                 logger.error(f"   🚫 Archivo movido a FAILED: {moved_name}")
                 return
 
-            if COMPRESS_PROCESSED:
-                # Comprimir archivo en processed (ÉXITO)
-                compressed_name = f"{filepath.stem}_{timestamp}.jsonl.gz"
-                compressed_path = PROCESSED_DIR / compressed_name
-                
-                with open(filepath, 'rb') as f_in:
-                    with gzip.open(compressed_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                
-                logger.info(f"   📦 Archivo comprimido: {compressed_name}")
+            if not self.archive_processed:
+                # Reproceso de un archivo que ya vive en processed: no duplicarlo
+                filepath.unlink(missing_ok=True)
             else:
-                # Mover archivo sin comprimir (ÉXITO)
-                moved_name = f"{filepath.stem}_{timestamp}.jsonl"
-                moved_path = PROCESSED_DIR / moved_name
-                shutil.move(str(filepath), str(moved_path))
-                logger.info(f"   📁 Archivo movido: {moved_name}")
-            
-            # Eliminar archivo original
-            if filepath.exists():
-                filepath.unlink()
+                # Rename instantáneo fuera de la cola; la compresión corre en el pool del archiver
+                if self.archiver is None:
+                    self.archiver = self.build_archiver()
+                staged = self.archiver.stage(filepath, f"{basename}_{timestamp}")
+                self.archiver.submit(staged)
             
             # Eliminar archivo de offset si existe
-            offset_file = filepath.with_suffix('.offset')
+            offset_file = self.checkpoint_path(filepath)
             if offset_file.exists():
                 offset_file.unlink()
             
@@ -0,0 +1,146 @@
+"""
+Benchmark del loader con un backlog sintético: mismo set de archivos procesado
+con 1, 2, 4... workers, reportando archivos/s y productos/s y verificando que el
+resultado final no depende del orden (cada producto queda con su captura más nueva).
+
+Los archivos se generan en un directorio temporal; los productos, proveedores y
+bodegas usan IDs negativos y se borran al terminar (salvo --keep).
+Escribe en la base configurada: correrlo contra staging, no contra producción.
+
+Uso:
+  python backend/manage.py loader_benchmark
+  python backend/manage.py loader_benchmark --files 40 --records 5000 --workers 1,4,8
+"""
+import gzip
+import json
+import logging
+import pathlib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.management.commands.loader import Command as LoaderCommand
+from core.models import ImageFetchFailure, Product, Supplier, Warehouse
+
+BENCH_SUPPLIER_ID = -1
+BENCH_WAREHOUSE_ID = -1
+# El loader rechaza productos sin imagen; dominio .invalid: nunca resuelve si un vectorizer los toma
+BENCH_IMAGE_URL = "https://example.invalid/bench/{}.jpg"
+
+
+class Command(BaseCommand):
+    help = "Mide el throughput del loader con un backlog sintético y distintos números de workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--files", type=int, default=20, help="Archivos del backlog (default: 20)")
+        parser.add_argument("--records", type=int, default=2000, help="Productos por archivo (default: 2000)")
+        parser.add_argument("--workers", default="1,2,4", help="Workers a medir, separados por coma (default: 1,2,4)")
+        parser.add_argument("--keep", action="store_true", help="No borrar las filas sintéticas al terminar")
+
+    def handle(self, *args, **options):
+        worker_counts = [int(w) for w in options["workers"].split(",") if w.strip()]
+        files, records = options["files"], options["records"]
+
+        loader_logger = logging.getLogger("loader")
+        previous_level = loader_logger.level
+        loader_logger.setLevel(logging.WARNING)  # El detalle por archivo ensucia la medición
+        results = []
+        try:
+            for workers in worker_counts:
+                self.cleanup()
+                with tempfile.TemporaryDirectory(prefix="loader_bench_") as tmp:
+                    raw_dir = pathlib.Path(tmp)
+                    expected = self.generate_backlog(raw_dir, files, records)
+                    elapsed, failed = self.run_backlog(raw_dir, workers)
+                mismatches = self.verify(expected)
+                results.append((workers, elapsed, failed, mismatches))
+                self.stdout.write(
+                    f"  workers={workers}: {elapsed:.2f}s, {files / elapsed:.1f} archivos/s, "
+                    f"{files * records / elapsed:,.0f} productos/s, fallidos={failed}, "
+                    f"orden {'OK' if not mismatches else f'INCORRECTO ({mismatches})'}"
+                )
+        finally:
+            loader_logger.setLevel(previous_level)
+            if not options["keep"]:
+                self.cleanup()
+
+        if results:
+            base = results[0][1]
+            self.stdout.write("")
+            self.stdout.write(f"{'workers':>8} {'segundos':>10} {'speedup':>8} {'fallidos':>9} {'orden':>6}")
+            for workers, elapsed, failed, mismatches in results:
+                self.stdout.write(
+                    f"{workers:>8} {elapsed:>10.2f} {base / elapsed:>7.2f}x {failed:>9} "
+                    f"{'OK' if not mismatches else 'ERROR':>6}"
+                )
+
+    def generate_backlog(self, raw_dir, files, records):
+        """
+        Escribe `files` segmentos .jsonl.gz. Cada archivo se solapa a la mitad con el
+        anterior y trae capturas más nuevas con sale_price = índice del archivo + 1.
+        Retorna {product_id: sale_price esperado} (el del último archivo que lo incluye).
+        """
+        step = max(1, records // 2)
+        base = datetime.utcnow()
+        expected = {}
+        for k in range(files):
+            captured = base + timedelta(seconds=k)
+            path = raw_dir / f"raw_products_{captured:%Y%m%d_%H%M%S}.jsonl.gz"
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                for i in range(k * step, k * step + records):
+                    pid = -(i + 1)
+                    f.write(json.dumps({
+                        "id": pid,
+                        "sku": f"BENCH-{i}",
+                        "name": f"Producto benchmark {i}",
+                        "description": "Producto sintético del benchmark del loader. " * 4,
+                        "type": "SIMPLE",
+                        "sale_price": k + 1,
+                        "suggested_price": (k + 1) * 2,
+                        "supplier": {"id": BENCH_SUPPLIER_ID, "name": "Benchmark", "store_name": "Benchmark"},
+                        "warehouse_id": BENCH_WAREHOUSE_ID,
+                        "stock": i % 50,
+                        "image_url": BENCH_IMAGE_URL.format(i),
+                        "capture_timestamp": captured.isoformat(),
+                        "raw_json": {"id": pid, "benchmark": True},
+                    }) + "\n")
+                    expected[pid] = k + 1
+        return expected
+
+    def run_backlog(self, raw_dir, workers):
+        """Procesa el backlog de `raw_dir` con `workers` hilos. Retorna (segundos, archivos fallidos)."""
+        loader = LoaderCommand()
+        loader.raw_dir = raw_dir
+        loader.archive_processed = False  # Medir solo la ingesta (el archivado va en segundo plano)
+        if workers > 1:
+            loader.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-worker")
+        start = time.time()
+        try:
+            loader.process_backlog(loader.get_files_chronologically())
+        finally:
+            if loader.pool:
+                loader.pool.shutdown(wait=True)
+            loader.reset_sessions()
+        elapsed = time.time() - start
+        failed = len(list((raw_dir / "failed").glob("*.jsonl*")))
+        return elapsed, failed
+
+    def verify(self, expected):
+        """Cuenta productos cuyo sale_price no es el de su captura más nueva (o que faltan)."""
+        loaded = dict(
+            Product.objects.filter(product_id__lt=0).values_list("product_id", "sale_price")
+        )
+        return sum(
+            1 for pid, price in expected.items()
+            if loaded.get(pid) is None or int(loaded[pid]) != price
+        )
+
+    def cleanup(self):
+        """Borra las filas sintéticas (IDs negativos). El CASCADE limpia stock log y relacionados."""
+        Product.objects.filter(product_id__lt=0).delete()
+        Supplier.objects.filter(supplier_id__lt=0).delete()
+        Warehouse.objects.filter(warehouse_id__lt=0).delete()
+        ImageFetchFailure.objects.filter(url__startswith=BENCH_IMAGE_URL.format("")).delete()
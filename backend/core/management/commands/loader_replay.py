@@ -0,0 +1,143 @@
+"""
+Reproceso de segmentos archivados en processed/ a través del loader.
+
+Los archivos se eligen con processed/archive_index.jsonl (rango de capture_timestamp y
+de product_id de cada archivo), se enlazan a un directorio de trabajo dentro de RAW_DIR
+y los procesa un loader normal. Es seguro repetirlo: el upsert nunca pisa un producto
+con una captura más vieja que la que ya tiene, y el historial de stock solo agrega
+cambios posteriores al último valor conocido. Las líneas "seen" se ignoran.
+
+Archivos anteriores al índice (o de otro entorno) se agregan con --reindex.
+
+Uso:
+  python backend/manage.py loader_replay --since 2026-03-01 --until 2026-03-07
+  python backend/manage.py loader_replay --product-id 12345 --dry-run
+  python backend/manage.py loader_replay --archive raw_products_20260301_120000_20260301_120512.jsonl.zst
+  python backend/manage.py loader_replay --reindex
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loader_bot.archiver import SEGMENT_SUFFIXES, read_index, segment_format, summarize_segment
+from core.management.commands.loader import RAW_DIR, RAW_FILE_PREFIX, Command as LoaderCommand
+
+
+class Command(BaseCommand):
+    help = "Vuelve a pasar por el loader segmentos archivados en processed/ (por fecha, producto o nombre)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Archivos con capturas desde esta fecha (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Archivos con capturas hasta esta fecha inclusive (YYYY-MM-DD).")
+        parser.add_argument(
+            "--product-id", type=int, action="append", dest="product_ids",
+            help="Archivos cuyo rango de IDs incluye este producto (repetible).",
+        )
+        parser.add_argument("--archive", action="append", dest="archives", help="Nombre exacto del archivo (repetible).")
+        parser.add_argument("--workers", type=int, default=1, help="Archivos en paralelo (default: 1).")
+        parser.add_argument("--reindex", action="store_true", help="Agregar al índice los archivos de processed/ que no estén.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo listar los archivos que se reprocesarían.")
+
+    def handle(self, *args, **options):
+        loader = LoaderCommand()
+        loader.raw_dir = RAW_DIR
+        archiver = loader.build_archiver()
+        processed_dir = archiver.directory
+
+        if options["reindex"]:
+            self.reindex(archiver)
+            if not any(options[k] for k in ("since", "until", "product_ids", "archives")):
+                return
+
+        selected = self.select(read_index(processed_dir), options)
+        selected = [e for e in selected if (processed_dir / e["archive"]).exists()]
+        if not selected:
+            self.stdout.write("  Ningún archivo coincide con el filtro.")
+            return
+
+        total_records = sum(e.get("records") or 0 for e in selected)
+        self.stdout.write(f"  {len(selected)} archivo(s), {total_records} productos:")
+        for entry in selected:
+            self.stdout.write(
+                f"    {entry['archive']} ({entry.get('captured_from')} → {entry.get('captured_to')}, "
+                f"IDs {entry.get('min_product_id')}..{entry.get('max_product_id')})"
+            )
+        if options["dry_run"]:
+            return
+
+        workdir = RAW_DIR / f"replay_{datetime.utcnow():%Y%m%d_%H%M%S}"
+        workdir.mkdir(parents=True)
+        for entry in selected:
+            self.link(processed_dir / entry["archive"], workdir / entry["archive"])
+
+        loader.raw_dir = workdir
+        loader.archive_processed = False  # El original sigue en processed/
+        loader.apply_heartbeats = False
+        if options["workers"] > 1:
+            loader.pool = ThreadPoolExecutor(max_workers=options["workers"], thread_name_prefix="replay-worker")
+        try:
+            loader.process_backlog(loader.get_files_chronologically())
+        finally:
+            if loader.pool:
+                loader.pool.shutdown(wait=True)
+            loader.reset_sessions()
+
+        failed = sorted(p.name for p in (workdir / "failed").glob(f"{RAW_FILE_PREFIX}*"))
+        if failed:
+            raise CommandError(f"{len(failed)} archivo(s) fallaron; revisar {workdir / 'failed'}")
+        shutil.rmtree(workdir)
+        self.stdout.write(self.style.SUCCESS(f"  Reproceso completo: {len(selected)} archivo(s)."))
+
+    @staticmethod
+    def link(source, target):
+        """Hardlink (mismo filesystem, sin copiar); copia si no se puede."""
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def select(self, entries, options):
+        since = date.fromisoformat(options["since"]).isoformat() if options["since"] else None
+        until = (date.fromisoformat(options["until"]) + timedelta(days=1)).isoformat() if options["until"] else None
+        product_ids = options["product_ids"] or []
+        archives = set(options["archives"] or [])
+        if not (since or until or product_ids or archives):
+            raise CommandError("Indicar al menos un filtro: --since/--until, --product-id o --archive.")
+
+        selected = []
+        for entry in entries:
+            if archives and entry["archive"] not in archives:
+                continue
+            # Rango de captura que se superpone con [since, until)
+            if since and (entry.get("captured_to") or "") < since:
+                continue
+            if until and (entry.get("captured_from") or "9999") >= until:
+                continue
+            if product_ids:
+                low, high = entry.get("min_product_id"), entry.get("max_product_id")
+                if low is None or not any(low <= pid <= high for pid in product_ids):
+                    continue
+            selected.append(entry)
+        return sorted(selected, key=lambda e: e["archive"])
+
+    def reindex(self, archiver):
+        indexed = {e["archive"] for e in read_index(archiver.directory)}
+        missing = sorted(
+            p for p in archiver.directory.glob(f"{RAW_FILE_PREFIX}*")
+            if p.name.endswith(SEGMENT_SUFFIXES) and p.name not in indexed
+        )
+        for path in missing:
+            summary = summarize_segment(path)
+            archiver.append_index({
+                "archive": path.name,
+                "source": None,
+                "format": segment_format(path.name),
+                **summary.as_dict(),
+                "bytes": path.stat().st_size,
+                "source_bytes": None,
+                "archived_at": None,
+            })
+        self.stdout.write(f"  Índice: {len(missing)} archivo(s) agregados")
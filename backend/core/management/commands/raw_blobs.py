@@ -0,0 +1,97 @@
+"""
+Mantenimiento de product_raw_blobs (payload crudo de Dropi fuera de products).
+
+- --backfill: mueve products.raw_data (JSONB inline) a blobs comprimidos por lotes y
+  deja raw_data en NULL. El espacio del heap/TOAST se recupera con VACUUM (o
+  pg_repack / VACUUM FULL para devolverlo al sistema).
+- --gc: borra blobs que ya no referencia ningún producto.
+- Sin flags: muestra estadísticas.
+
+Uso:
+  python backend/manage.py raw_blobs
+  python backend/manage.py raw_blobs --backfill [--batch-size 1000]
+  python backend/manage.py raw_blobs --gc [--dry-run]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from core.models import Product, ProductRawBlob
+
+
+class Command(BaseCommand):
+    help = "Backfill, limpieza y estadísticas de product_raw_blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backfill", action="store_true", help="Mover products.raw_data a product_raw_blobs.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Productos por lote (default: 1000).")
+        parser.add_argument("--gc", action="store_true", help="Borrar blobs sin productos que los referencien.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se haría.")
+
+    def handle(self, *args, **options):
+        if options["backfill"]:
+            self.backfill(options["batch_size"], options["dry_run"])
+        if options["gc"]:
+            self.gc(options["dry_run"])
+        self.stats()
+
+    def backfill(self, batch_size, dry_run):
+        pending = Product.objects.filter(raw_data__isnull=False, raw_blob__isnull=True)
+        total = pending.count()
+        self.stdout.write(f"  Productos con raw_data inline: {total}")
+        if dry_run or not total:
+            return
+
+        moved, last_id, started = 0, None, time.time()
+        while True:
+            batch_qs = pending.order_by("product_id").only("product_id", "raw_data")
+            if last_id is not None:
+                batch_qs = batch_qs.filter(product_id__gt=last_id)
+            batch = list(batch_qs[:batch_size])
+            if not batch:
+                break
+
+            blobs = {}
+            for product in batch:
+                digest, compressed, size = ProductRawBlob.pack(product.raw_data)
+                blobs.setdefault(digest, ProductRawBlob(digest=digest, payload=compressed, size_bytes=size))
+                product.raw_blob_id = digest
+                product.raw_data = None
+            with transaction.atomic():
+                ProductRawBlob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+                Product.objects.bulk_update(batch, ["raw_blob", "raw_data"])
+
+            moved += len(batch)
+            last_id = batch[-1].product_id
+            self.stdout.write(f"  {moved}/{total} productos ({moved / (time.time() - started):.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"  Backfill completo: {moved} productos. Correr VACUUM (ANALYZE) products para reutilizar el espacio."
+        ))
+
+    def gc(self, dry_run):
+        orphans = ProductRawBlob.objects.exclude(
+            digest__in=Product.objects.filter(raw_blob__isnull=False).values("raw_blob")
+        )
+        if dry_run:
+            self.stdout.write(f"  Blobs huérfanos a borrar: {orphans.count()}")
+            return
+        deleted, _ = orphans.delete()
+        self.stdout.write(f"  Blobs huérfanos borrados: {deleted}")
+
+    def stats(self):
+        blobs = ProductRawBlob.objects.count()
+        raw_bytes = ProductRawBlob.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+        referenced = Product.objects.filter(raw_blob__isnull=False).count()
+        inline = Product.objects.filter(raw_data__isnull=False).count()
+        self.stdout.write(f"  Blobs: {blobs} (JSON sin comprimir: {raw_bytes / 1e6:.1f} MB)")
+        self.stdout.write(f"  Productos con blob: {referenced} | con raw_data inline: {inline}")
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_total_relation_size('product_raw_blobs'), pg_total_relation_size('products')"
+                )
+                blob_size, products_size = cursor.fetchone()
+            self.stdout.write(f"  Tamaño en disco: product_raw_blobs {blob_size / 1e6:.1f} MB | products {products_size / 1e6:.1f} MB")
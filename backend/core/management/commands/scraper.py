@@ -22,6 +22,12 @@ from datetime import datetime
 from urllib.parse import quote
 import pathlib
 
+from core.scraper_bot.cdp_capture import CATALOG_API_PATH, CatalogCapture, extract_products
+from core.scraper_bot.crawl_cursor import CatalogCursor
+from core.scraper_bot.api_harvester import CatalogHarvester
+from core.scraper_bot.fingerprint_index import FingerprintIndex, seen_record
+from core.scraper_bot.segment_writer import SegmentWriter
+
 # ─────── Cargar variables de entorno ───────
 load_dotenv()
 
@@ -31,6 +37,35 @@ HEADLESS    = os.getenv("HEADLESS", "True").lower() in ("1", "true", "yes")
 RAW_DIR_PATH = pathlib.Path(os.getenv("RAW_DIR", "raw_data"))
 RAW_DIR_PATH.mkdir(parents=True, exist_ok=True)
 
+# Captura del catálogo:
+#   "cdp" → suscripción a eventos de red vía DevTools (streaming, cola acotada)
+#   "log" → polling legacy de driver.get_log("performance")
+CAPTURE_MODE = os.getenv("SCRAPER_CAPTURE_MODE", "cdp").lower()
+CAPTURE_QUEUE_SIZE = int(os.getenv("SCRAPER_CAPTURE_QUEUE_SIZE", "200"))  # páginas
+
+# Estado persistente del scraper (cursor del crawl, huellas). Fuera del glob *.jsonl del loader.
+STATE_DIR = pathlib.Path(os.getenv("SCRAPER_STATE_DIR", RAW_DIR_PATH / "scraper_state"))
+CURSOR_PATH = STATE_DIR / "catalog_cursor.json"
+RESUME_FROM_CURSOR = os.getenv("SCRAPER_RESUME", "True").lower() in ("1", "true", "yes")
+MAINTENANCE_EVERY = 1000  # Productos por sesión de Chrome antes del reinicio preventivo
+
+# Estrategia de recorrido:
+#   "scroll" → scroll + "Mostrar más productos" en la UI (captura pasiva)
+#   "api"    → tras el login, paginar /api/products/v4/index directo con la sesión del navegador
+STRATEGY = os.getenv("SCRAPER_STRATEGY", "scroll").lower()
+HARVEST_CONCURRENCY = int(os.getenv("SCRAPER_HARVEST_CONCURRENCY", "4"))
+HARVEST_RATE = float(os.getenv("SCRAPER_HARVEST_RATE", "4"))  # peticiones por segundo
+
+# Detección de cambios: solo se emiten productos nuevos o modificados; los que siguen
+# iguales van en líneas "seen" (heartbeat para last_seen_at).
+FINGERPRINTS_ENABLED = os.getenv("SCRAPER_FINGERPRINTS", "True").lower() in ("1", "true", "yes")
+FINGERPRINT_PATH = STATE_DIR / "fingerprints.sqlite3"
+FINGERPRINT_MAX_AGE_HOURS = float(os.getenv("SCRAPER_FINGERPRINT_MAX_AGE_HOURS", "24"))  # reemisión forzada
+
+# Segmentos de raw_data: gzip con nombre temporal, renombrado atómico al rotar
+SEGMENT_MAX_SECONDS = int(os.getenv("SCRAPER_SEGMENT_MAX_SECONDS", "300"))  # 5 minutos
+SEGMENT_MAX_MB = int(os.getenv("SCRAPER_SEGMENT_MAX_MB", "64"))  # sin comprimir
+
 # ─────── Configuración de Logs (Centralizada) ───────
 # Creamos carpeta logs dentro del contenedor (montada a host)
 LOG_DIR = pathlib.Path("/app/logs")
@@ -63,7 +98,9 @@ def build_driver() -> webdriver.Chrome:
     else:
         logger.info("🔍 MODO VISIBLE ACTIVADO - Navegador visible")
     opts.add_argument("--window-size=1920,1080")
-    opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if CAPTURE_MODE == "log":
+        # Solo el modo legacy necesita el log de performance (crece hasta reiniciar Chrome)
+        opts.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     
     # Docker friendly options
     opts.add_argument("--no-sandbox")
@@ -120,7 +157,8 @@ def login(driver: webdriver.Chrome, timeout: int = 60) -> bool:
         wait.until(lambda d: d.execute_script("return !!localStorage.getItem('DROPI_token')") or "/dashboard" in d.current_url)
         logger.info(f"   ✅ Validación exitosa - URL actual: {driver.current_url}")
         
-        driver.get_log("performance") # Limpiar logs
+        if CAPTURE_MODE == "log":
+            driver.get_log("performance") # Limpiar logs
         logger.info("✅ Login exitoso - Esperando 20s para que cargue completamente...")
         logger.info("   ⏳ Esperando... (ventana de carga de Dropi)")
         time.sleep(20)  # Aumentado a 20s para Docker (era 15s)
@@ -207,30 +245,63 @@ def navigate_to_catalog(driver: webdriver.Chrome, wait_time: int = 10) -> None:
 
 
 
-def grab_new_products(driver: WebDriver, seen: set) -> list:
-    new = []
+def grab_new_pages(driver: WebDriver) -> list:
+    """Modo legacy ("log"): páginas del catálogo leídas del log de performance."""
+    pages = []
+    catalog_requests = {}
     logs = driver.get_log("performance")
     for entry in logs: 
         try:
             msg = json.loads(entry["message"])["message"]
+            params = msg.get("params", {})
+
+            if msg.get("method") == "Network.requestWillBeSent":
+                req = params.get("request", {})
+                if CATALOG_API_PATH in req.get("url", ""):
+                    catalog_requests[params["requestId"]] = {
+                        "url": req.get("url"),
+                        "method": req.get("method", "GET"),
+                        "headers": req.get("headers") or {},
+                        "post_data": req.get("postData"),
+                    }
+                continue
+
             if msg.get("method") != "Network.responseReceived": continue
             
-            url = msg["params"]["response"]["url"]
-            if "/api/products/v4/index" not in url: continue
+            url = params["response"]["url"]
+            if CATALOG_API_PATH not in url: continue
 
-            request_id = msg["params"]["requestId"]
+            request_id = params["requestId"]
             body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})["body"]
             payload = json.loads(body)
-            objs = payload.get("objects") or payload.get("data", {}).get("objects", [])
-            
-            for p in objs:
-                pid = p.get("id")
-                if pid and pid not in seen:
-                    seen.add(pid)
-                    new.append(p)
+            pages.append({"request": catalog_requests.get(request_id), "products": extract_products(payload)})
         except:
             continue
-    return new
+    return pages
+
+def request_next_page(driver: WebDriver, cursor: CatalogCursor) -> tuple:
+    """
+    Pide desde la propia pestaña (fetch con la sesión del usuario) la página en
+    `cursor.next_offset`. La captura ve esa respuesta como cualquier otra del catálogo.
+
+    Returns:
+        (offset, cantidad de productos) — cantidad None si la petición falló.
+    """
+    offset = cursor.next_offset
+    driver.set_script_timeout(60)
+    result = driver.execute_async_script("""
+        const req = arguments[0];
+        const done = arguments[arguments.length - 1];
+        fetch(req.url, {method: req.method, headers: req.headers, body: req.body, credentials: 'include'})
+            .then(r => r.ok
+                ? r.json().then(j => done({status: r.status, count: (j.objects || (j.data && j.data.objects) || []).length}))
+                : done({status: r.status, count: null}))
+            .catch(e => done({status: 0, count: null, error: String(e)}));
+    """, cursor.next_request())
+    if not result or result.get("count") is None:
+        logger.warning(f"⚠️ Página offset {offset} falló (status {result and result.get('status')})")
+        return offset, None
+    return offset, result["count"]
 
 def scroll_to_bottom(driver: WebDriver) -> None:
     driver.execute_script("window.scrollBy(0, document.body.scrollHeight);")
@@ -254,17 +325,45 @@ def click_show_more(driver: WebDriver) -> bool:
 
 class Command(BaseCommand):
     help = 'Scraper de Dropi (Daemon)'
+    fingerprints = None
+    cursor = None
     
-    def generate_batch_filename(self):
-        """Genera nombre de archivo con timestamp para fácil lectura y ordenamiento"""
-        fname = f"raw_products_{datetime.utcnow():%Y%m%d_%H%M%S}.jsonl"
-        return RAW_DIR_PATH / fname
+    def build_writer(self):
+        """Escritor de segmentos raw_products_*.jsonl.gz (el nombre lleva timestamp para ordenar)."""
+        return SegmentWriter(
+            RAW_DIR_PATH,
+            prefix="raw_products",
+            max_seconds=SEGMENT_MAX_SECONDS,
+            max_bytes=SEGMENT_MAX_MB * 1024 * 1024,
+            on_publish=self.on_segment_published,
+        )
+
+    def on_segment_published(self, path, records):
+        """
+        El segmento ya es visible para el loader: recién ahora se confirma el estado
+        que asume esos registros escritos (huellas y cursor del crawl).
+        """
+        if self.fingerprints:
+            self.fingerprints.commit()
+        if self.cursor:
+            self.cursor.save()
 
     def handle(self, *args, **options):
         logger.info("🚀 SCRAPER DAEMON INICIADO (Modo Infinito)")
         
+        # Cursor del crawl: sobrevive a los reinicios de Chrome y del contenedor
+        cursor = CatalogCursor.load(CURSOR_PATH) if RESUME_FROM_CURSOR else None
+        if cursor is None and STRATEGY == "api":
+            cursor = CatalogCursor(CURSOR_PATH)  # La cosecha necesita la plantilla (solo en memoria)
+        if FINGERPRINTS_ENABLED:
+            self.fingerprints = FingerprintIndex(FINGERPRINT_PATH, max_age=FINGERPRINT_MAX_AGE_HOURS * 3600)
+            logger.info(f"🧬 Índice de huellas: {self.fingerprints.count()} productos conocidos")
+        self.cursor = cursor
+        writer = self.build_writer()
+        
         while True:
             driver = None
+            capture = None
             try:
                 logger.info("🔄 Iniciando ciclo de scraping...")
                 driver = build_driver()
@@ -272,6 +371,7 @@ class Command(BaseCommand):
 
                 if not login(driver):
                     raise Exception("Login fallido")
+                capture = self.start_capture(driver)
 
                 # Intentar navegar al catálogo con retry
                 navigation_success = False
@@ -285,6 +385,9 @@ class Command(BaseCommand):
                         if attempt == 1:
                             logger.warning(f"⚠️ Primer intento falló. Reintentando con 30s de espera...")
                             # Cerrar sesión y volver a intentar
+                            if capture:
+                                capture.stop()
+                                capture = None
                             try:
                                 driver.quit()
                             except:
@@ -294,6 +397,7 @@ class Command(BaseCommand):
                             driver.execute_cdp_cmd("Network.enable", {})
                             if not login(driver):
                                 raise Exception("Login fallido en retry")
+                            capture = self.start_capture(driver)
                         else:
                             logger.error(f"❌ Navegación falló después de {attempt} intentos")
                             raise nav_error
@@ -301,72 +405,73 @@ class Command(BaseCommand):
                 if not navigation_success:
                     raise Exception("No se pudo navegar al catálogo")
                 
-                seen = set()
+                # IDs ya emitidos en este recorrido (persistidos en el cursor)
+                seen = cursor.emitted if cursor else set()
+                session_count = 0
                 consecutive_no_button = 0
-                
-                # Batch control vars
-                BATCH_TIME_LIMIT = 300  # 5 minutos
-                
-                # Variables para control de archivo
-                current_batch_file = None
-                batch_file_handle = None
-                batch_start_time = None
-                batch_count = 0
+                resume_failed = False
 
                 while True:  # Main Scraping Loop (Chrome session active)
                     # 1. Scraping Logic (capturar productos)
-                    nuevos = grab_new_products(driver, seen)
+                    if capture:
+                        if not capture.is_alive():
+                            raise Exception("Captura CDP detenida (session deleted?)")
+                        pages = capture.drain_pages()
+                    else:
+                        pages = grab_new_pages(driver)
+                    nuevos = self.collect_new_products(pages, seen, cursor)
+                    
+                    records, emitted = self.build_records(nuevos)
                     
-                    if nuevos:
-                        # Si es el primer producto del batch, abrir nuevo archivo e iniciar cronómetro
-                        if batch_file_handle is None:
-                            current_batch_file = self.generate_batch_filename()
-                            batch_file_handle = open(current_batch_file, 'a', encoding='utf-8')
-                            batch_start_time = time.time()
-                            batch_count = 0
-                            logger.info(f"📂 Nuevo archivo abierto: {current_batch_file.name}")
-                        
-                        # Escribir productos al archivo
-                        for p in nuevos:
-                            record = self.process_product(p)
-                            batch_file_handle.write(json.dumps(record, ensure_ascii=False) + '\n')
-                            batch_file_handle.flush()
-                            batch_count += 1
-                        
-                        logger.info(f"📦 +{len(nuevos)} productos (Lote: {batch_count} | Total: {len(seen)})")
-                        
-                        # 2. Check Rotation Conditions (solo si hay archivo abierto)
-                        if batch_start_time is not None:
-                            elapsed = time.time() - batch_start_time
-                            if elapsed > BATCH_TIME_LIMIT:
-                                logger.info(f"⏱️ Rotando archivo por tiempo ({int(elapsed)}s, {batch_count} productos)...")
-                                # Cerrar archivo actual
-                                if batch_file_handle:
-                                    batch_file_handle.close()
-                                    logger.info(f"✅ Archivo cerrado: {current_batch_file.name}")
-                                # Resetear variables para el próximo batch
-                                batch_file_handle = None
-                                batch_start_time = None
-                                current_batch_file = None
-                                batch_count = 0
+                    if records:
+                        # Productos (y heartbeat de los que no cambiaron) al segmento abierto
+                        writer.write(records)
+                        session_count += len(nuevos)
+                        logger.info(
+                            f"📦 +{len(nuevos)} productos ({emitted} nuevos/modificados) "
+                            f"(Segmento: {writer.current_records} | Total: {len(seen)})"
+                        )
+                    
+                    # 2. Rotación por tiempo aunque no lleguen productos nuevos
+                    writer.maybe_rotate()
 
                     # 3. Navigation
-                    scroll_to_bottom(driver)
-                    found = False
-                    for _ in range(3):
-                        if click_show_more(driver):
-                            found = True
-                            break
-                        time.sleep(1)
+                    if STRATEGY == "api" and cursor.has_template() and cursor.live_headers:
+                        # Ya conocemos la petición del catálogo: cosechar por API el resto
+                        if self.harvest_catalog(driver, cursor, seen, writer):
+                            logger.info("🏁 Fin del catálogo (cosecha API). Reiniciando recorrido...")
+                            cursor.reset()
+                            cursor.save()
+                            raise Exception("End of catalog")  # Force restart driver (nuevo token)
+                        raise Exception("Cosecha API incompleta")
+                    elif cursor and cursor.can_resume() and cursor.live_headers and not resume_failed:
+                        # Reanudar: pedir la siguiente página directamente (sin re-scroll desde arriba)
+                        offset, count = request_next_page(driver, cursor)
+                        if count is None:
+                            logger.warning("⚠️ No se pudo reanudar desde el cursor. Continuando con scroll...")
+                            resume_failed = True
+                        elif count == 0:
+                            logger.info(f"🏁 Fin del catálogo (offset {offset}). Reiniciando recorrido...")
+                            cursor.reset()
+                            cursor.save()
+                            raise Exception("End of catalog")  # Force restart driver
+                        else:
+                            cursor.advance(offset, count)
+                        found = True
+                    else:
+                        scroll_to_bottom(driver)
+                        found = False
+                        for _ in range(3):
+                            if click_show_more(driver):
+                                found = True
+                                break
+                            time.sleep(1)
                     
                     if not found:
                         consecutive_no_button += 1
                         if consecutive_no_button >= 5:
                             logger.info("🛑 Fin del catálogo o error. Reiniciando sesión...")
                             # Cerrar archivo si está abierto
-                            if batch_file_handle:
-                                batch_file_handle.close()
-                                logger.info(f"✅ Archivo cerrado antes de reiniciar: {current_batch_file.name}")
                             raise Exception("End of catalog or navigation stuck")  # Force restart driver
                     else:
                         consecutive_no_button = 0
@@ -374,12 +479,8 @@ class Command(BaseCommand):
                     time.sleep(1)
                     
                     # Check for Driver Restart (Long running maintenance)
-                    if len(seen) % 1000 == 0 and len(seen) > 0:
-                        logger.info(f"🔄 Reiniciando Chrome (mantenimiento preventivo - {len(seen)} productos)...")
-                        # Cerrar archivo si está abierto
-                        if batch_file_handle:
-                            batch_file_handle.close()
-                            logger.info(f"✅ Archivo cerrado antes de mantenimiento: {current_batch_file.name}")
+                    if session_count >= MAINTENANCE_EVERY:
+                        logger.info(f"🔄 Reiniciando Chrome (mantenimiento preventivo - {session_count} productos en la sesión)...")
                         break  # Break Main Loop -> Rebuild Driver
 
             except KeyboardInterrupt:
@@ -398,6 +499,17 @@ class Command(BaseCommand):
                 logger.info("🔄 Reiniciando en 60 segundos...")
                 time.sleep(60)
             finally:
+                # Publicar el segmento abierto antes de reiniciar (confirma huellas y cursor)
+                try:
+                    writer.close()
+                    if cursor:
+                        cursor.save()
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo cerrar el segmento o guardar el cursor: {e}")
+                if self.fingerprints:
+                    self.fingerprints.discard()  # Huellas de registros que no llegaron a publicarse
+                if capture:
+                    capture.stop()
                 if driver:
                     try:
                         driver.quit()
@@ -406,6 +518,82 @@ class Command(BaseCommand):
                         logger.warning(f"⚠️ Error al cerrar driver: {e}")
                     driver = None
 
+    def harvest_catalog(self, driver, cursor, seen, writer):
+        """
+        Estrategia "api": pagina el catálogo con un cliente HTTP propio reutilizando
+        el token (headers capturados) y las cookies de la sesión de Chrome.
+        Escribe los mismos registros que process_product en el segmento abierto de `writer`.
+
+        Returns:
+            True si se recorrió el catálogo completo.
+        """
+        def on_page(offset, products):
+            nuevos = []
+            for p in products:
+                pid = p.get("id")
+                if pid and pid not in seen:
+                    seen.add(pid)
+                    nuevos.append(p)
+            records, emitted = self.build_records(nuevos)
+            cursor.advance(offset, len(products))  # Antes de escribir: una rotación guarda el cursor
+            writer.write(records)
+            logger.info(
+                f"📦 Página offset {offset}: +{len(nuevos)} productos ({emitted} nuevos/modificados) "
+                f"(Total: {len(seen)})"
+            )
+
+        harvester = CatalogHarvester(
+            cursor,
+            cookies=driver.get_cookies(),
+            concurrency=HARVEST_CONCURRENCY,
+            rate=HARVEST_RATE,
+        )
+        try:
+            return harvester.run(on_page)
+        finally:
+            harvester.close()
+
+    def collect_new_products(self, pages, seen, cursor=None):
+        """
+        Productos aún no emitidos de las páginas capturadas.
+        Cada página también avanza el cursor del crawl (offset y filtros observados).
+        """
+        new = []
+        for page in pages:
+            if cursor:
+                cursor.observe_page(page)
+            for p in page["products"]:
+                pid = p.get("id")
+                if pid and pid not in seen:
+                    seen.add(pid)
+                    new.append(p)
+        return new
+
+    def build_records(self, products):
+        """
+        Registros JSONL para los productos capturados.
+
+        Con el índice de huellas activo solo se emiten completos los productos nuevos
+        o modificados; los que no cambiaron se agrupan en un único registro "seen".
+
+        Returns:
+            (registros, cantidad de productos emitidos completos)
+        """
+        records = [self.process_product(p) for p in products]
+        unchanged = []
+        if self.fingerprints:
+            records, unchanged = self.fingerprints.diff(records)
+        emitted = len(records)
+        if unchanged:
+            records.append(seen_record(unchanged, datetime.utcnow().isoformat()))
+        return records, emitted
+
+    def start_capture(self, driver):
+        """Inicia la captura CDP del catálogo (None en modo legacy "log")."""
+        if CAPTURE_MODE != "cdp":
+            return None
+        return CatalogCapture.for_driver(driver, max_queue=CAPTURE_QUEUE_SIZE).start()
+
     def process_product(self, p):
         # Lógica de extracción simplificada
         img_url = None
@@ -16,12 +16,20 @@ TABLES_TO_SHOW = [
     "core.OrderReport",
     "core.WorkflowProgress",
     "core.ReportBatch",
+    "core.ProductEmbeddingQueue",
+    "core.ProductClassificationQueue",
     "core.ProductEmbedding",
+    "core.ImageUrlCache",
+    "core.ImageFetchFailure",
+    "core.ImageEmbedding",
     "core.ProductClusterMembership",
     "core.UniqueProductCluster",
     "core.ProductCategory",
+    "core.ProductStockDaily",
+    "core.ProductStockLatest",
     "core.ProductStockLog",
     "core.Product",
+    "core.ProductRawBlob",
     "core.User",
 ]
 
@@ -0,0 +1,131 @@
+"""
+Mantenimiento del historial de stock (product_stock_log particionada por mes).
+
+- Crea las particiones de los próximos meses (el loader también lo hace al arrancar).
+- Aplica la retención: los meses más viejos que STOCK_HISTORY_RETENTION_MONTHS se
+  resumen por día en product_stock_daily y su partición se borra.
+- Migra la tabla previa a la partición (product_stock_log_legacy) mes a mes, guardando
+  solo los cambios de cantidad, y completa product_stock_latest.
+
+Pensado para correr una vez por día (cron o scheduler).
+
+Uso:
+  python backend/manage.py stock_history
+  python backend/manage.py stock_history --dry-run
+  python backend/manage.py stock_history --import-legacy [--from-month 2025-06]
+  python backend/manage.py stock_history --drop-legacy
+"""
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.loader_bot import stock_history
+
+RETENTION_MONTHS = int(os.getenv("STOCK_HISTORY_RETENTION_MONTHS", "12"))
+MONTHS_AHEAD = int(os.getenv("STOCK_PARTITION_MONTHS_AHEAD", "2"))
+
+
+class Command(BaseCommand):
+    help = "Particiones, retención y migración legacy del historial de stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-months",
+            type=int,
+            default=RETENTION_MONTHS,
+            help=f"Meses con detalle en product_stock_log (default: {RETENTION_MONTHS}).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo mostrar qué particiones se crearían o borrarían.",
+        )
+        parser.add_argument(
+            "--import-legacy",
+            action="store_true",
+            help="Compactar product_stock_log_legacy (solo cambios) hacia las particiones.",
+        )
+        parser.add_argument(
+            "--from-month",
+            help="Con --import-legacy: retomar desde este mes (YYYY-MM).",
+        )
+        parser.add_argument(
+            "--drop-legacy",
+            action="store_true",
+            help="Borrar product_stock_log_legacy (después de --import-legacy).",
+        )
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if not stock_history.table_exists(cursor, stock_history.DEFAULT_PARTITION):
+                raise CommandError("product_stock_log no está particionada: aplicar la migración 0022 primero.")
+
+            if options["import_legacy"]:
+                self.import_legacy(cursor, options["retention_months"], options["from_month"])
+            if options["drop_legacy"]:
+                self.drop_legacy(cursor, options["dry_run"])
+            self.maintain(cursor, options["retention_months"], options["dry_run"])
+
+    def maintain(self, cursor, retention_months, dry_run):
+        today = date.today()
+        if dry_run:
+            current = stock_history.month_start(today)
+            missing = [
+                stock_history.partition_name(stock_history.add_months(current, n))
+                for n in range(MONTHS_AHEAD + 1)
+                if not stock_history.table_exists(cursor, stock_history.partition_name(stock_history.add_months(current, n)))
+            ]
+            self.stdout.write(self.style.WARNING("DRY RUN: no se modifica nada."))
+            self.stdout.write(f"  Particiones a crear: {', '.join(missing) or 'ninguna'}")
+            expired = stock_history.expire_partitions(cursor, retention_months, today, dry_run=True)
+            self.stdout.write(f"  Particiones a resumir y borrar: {', '.join(expired) or 'ninguna'}")
+            return
+
+        with transaction.atomic():
+            created = stock_history.ensure_partitions(cursor, MONTHS_AHEAD, today)
+        self.stdout.write(f"  Particiones creadas: {', '.join(created) or 'ninguna'}")
+
+        with transaction.atomic():
+            expired = stock_history.expire_partitions(cursor, retention_months, today)
+        cutoff = stock_history.retention_cutoff(retention_months, today)
+        self.stdout.write(
+            f"  Retención ({retention_months} meses, desde {cutoff:%Y-%m}): "
+            f"{', '.join(expired) or 'ninguna partición'} resumida(s) en {stock_history.STOCK_DAILY_TABLE}"
+        )
+        self.stdout.write(self.style.SUCCESS("Historial de stock al día."))
+
+    def import_legacy(self, cursor, retention_months, from_month):
+        if not stock_history.table_exists(cursor, stock_history.LEGACY_TABLE):
+            self.stdout.write("  No hay tabla legacy para migrar.")
+            return
+        cutoff = stock_history.retention_cutoff(retention_months)
+        months = stock_history.legacy_months(cursor)
+        if from_month:
+            start = date.fromisoformat(f"{from_month}-01")
+            months = [m for m in months if m >= start]
+
+        # Un mes por transacción: si se corta, se retoma con --from-month
+        for month in months:
+            started = time.time()
+            with transaction.atomic():
+                written = stock_history.import_legacy_month(cursor, month, cutoff)
+            target = "detalle" if month >= cutoff else "resumen diario"
+            self.stdout.write(f"  {month:%Y-%m}: {written} filas → {target} ({time.time() - started:.1f}s)")
+
+        with transaction.atomic():
+            seeded = stock_history.seed_latest_from_legacy(cursor)
+        self.stdout.write(f"  product_stock_latest: {seeded} pares completados desde legacy")
+        self.stdout.write(self.style.SUCCESS("Migración legacy completa. Verificar y luego correr --drop-legacy."))
+
+    def drop_legacy(self, cursor, dry_run):
+        if not stock_history.table_exists(cursor, stock_history.LEGACY_TABLE):
+            self.stdout.write("  No hay tabla legacy.")
+            return
+        if dry_run:
+            self.stdout.write(f"  Se borraría {stock_history.LEGACY_TABLE}")
+            return
+        cursor.execute(f"DROP TABLE {stock_history.LEGACY_TABLE}")
+        self.stdout.write(self.style.SUCCESS(f"  {stock_history.LEGACY_TABLE} borrada."))
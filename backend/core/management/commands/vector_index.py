@@ -0,0 +1,96 @@
+"""
+Estado y mantenimiento de los índices de búsqueda visual (product_embeddings).
+
+- Estado (sin opciones): tamaño, validez y uso de cada índice, cobertura de embedding_bits
+  y versión de pgvector (el iterative scan de las búsquedas filtradas requiere >= 0.8).
+- --reindex: reconstruye un índice CONCURRENTLY (p. ej. si un CREATE INDEX CONCURRENTLY
+  se cortó y lo dejó inválido: Postgres lo mantiene en cada escritura pero no lo usa).
+- --backfill-bits: completa embedding_bits en filas con vector y sin cuantización.
+
+Uso:
+  python backend/manage.py vector_index
+  python backend/manage.py vector_index --reindex idx_emb_visual
+  python backend/manage.py vector_index --backfill-bits --batch 20000
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+INDEXES = ('idx_emb_visual', 'emb_bits_hnsw_idx', 'products_concept_idx')
+
+SQL_INDEX_STATUS = """
+    SELECT c.relname, pg_relation_size(c.oid), i.indisvalid, COALESCE(s.idx_scan, 0)
+    FROM pg_class c
+    JOIN pg_index i ON i.indexrelid = c.oid
+    LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = c.oid
+    WHERE c.relname = ANY(%s)
+    ORDER BY c.relname;
+"""
+SQL_COVERAGE = """
+    SELECT COUNT(*) FILTER (WHERE embedding_visual IS NOT NULL),
+           COUNT(*) FILTER (WHERE embedding_visual IS NOT NULL AND embedding_bits IS NULL)
+    FROM product_embeddings;
+"""
+SQL_BACKFILL = """
+    UPDATE product_embeddings
+    SET embedding_bits = binary_quantize(embedding_visual)::bit(1152)
+    WHERE product_id >= %s AND product_id < %s
+      AND embedding_visual IS NOT NULL AND embedding_bits IS NULL;
+"""
+
+
+class Command(BaseCommand):
+    help = "Estado y mantenimiento de los índices HNSW de product_embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reindex", choices=INDEXES, help="Reconstruir este índice CONCURRENTLY.")
+        parser.add_argument("--backfill-bits", action="store_true", help="Completar embedding_bits faltantes.")
+        parser.add_argument("--batch", type=int, default=20000, help="Rango de product_id por transacción del backfill (default: 20000).")
+
+    def handle(self, *args, **options):
+        if options["backfill_bits"]:
+            self.backfill(options["batch"])
+        if options["reindex"]:
+            self.stdout.write(f"  Reconstruyendo {options['reindex']} (CONCURRENTLY)...")
+            with connection.cursor() as cursor:
+                cursor.execute(f"REINDEX INDEX CONCURRENTLY {options['reindex']};")
+        self.status()
+
+    def status(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+            row = cursor.fetchone()
+            if row is None:
+                raise CommandError("La extensión vector (pgvector) no está instalada en la base.")
+            version = row[0]
+            cursor.execute(SQL_INDEX_STATUS, (list(INDEXES),))
+            indexes = {name: (size, valid, scans) for name, size, valid, scans in cursor.fetchall()}
+            cursor.execute(SQL_COVERAGE)
+            vectors, missing_bits = cursor.fetchone()
+
+        major_minor = tuple(int(p) for p in version.split(".")[:2])
+        self.stdout.write(f"  pgvector {version}" + (
+            "" if major_minor >= (0, 8) else "  ⚠️ < 0.8, sin iterative scan: las búsquedas filtradas solo fijan ef_search y pueden devolver menos resultados"
+        ))
+        for name in INDEXES:
+            if name not in indexes:
+                self.stdout.write(self.style.WARNING(f"  {name}: NO EXISTE (correr migrate)"))
+                continue
+            size, valid, scans = indexes[name]
+            line = f"  {name}: {size / 1024 ** 2:.0f} MB, {scans} scans"
+            if valid:
+                self.stdout.write(line)
+            else:
+                self.stdout.write(self.style.ERROR(f"{line}, INVÁLIDO (usar --reindex {name})"))
+        self.stdout.write(f"  Embeddings: {vectors} | sin embedding_bits: {missing_bits}")
+
+    def backfill(self, batch):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT MIN(product_id), MAX(product_id) FROM product_embeddings;")
+            low, high = cursor.fetchone()
+            if low is None:
+                return
+            updated = 0
+            for start in range(low, high + 1, batch):
+                cursor.execute(SQL_BACKFILL, (start, start + batch))  # autocommit: una transacción por rango
+                updated += cursor.rowcount
+        self.stdout.write(f"  embedding_bits completado en {updated} filas")
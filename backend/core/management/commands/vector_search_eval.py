@@ -0,0 +1,276 @@
+"""
+Evaluación de recall y latencia de las estrategias de búsqueda visual (VectorSearchService).
+
+Para cada forma de consulta usada en el código toma N productos de consulta, calcula el
+top-k exacto (ground truth) y corre cada estrategia configurada:
+
+- goldmine: top 50 sin filtros (GoldMineService.search_by_visual_similarity, Gold Mine).
+- classifier: top 5 excluyendo el propio producto (vecinos de contexto del classifier).
+- clusterizer: top 5 del mismo taxonomy_concept y ya agrupados (candidatos del clusterizer).
+
+Reporta en JSON recall@k, latencia p50/p95 y buffers (hit/read de shared buffers, con
+EXPLAIN ANALYZE sobre una muestra de las consultas).
+
+Con --synthetic N no toca las tablas reales: crea el esquema vector_eval con tablas de la
+misma forma, N embeddings sintéticos (mezcla de gaussianas normalizada: grupos de productos
+parecidos, como las fotos repetidas entre proveedores) y sus índices, y evalúa ahí.
+
+Uso:
+  python backend/manage.py vector_search_eval --synthetic 200000 --queries 200
+  python backend/manage.py vector_search_eval --synthetic 200000 --reuse --ef-search 40,100,200 --oversample 4,10
+  python backend/manage.py vector_search_eval --queries 100 --shapes goldmine,clusterizer --output eval.json
+  python backend/manage.py vector_search_eval --drop-synthetic
+"""
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from core.models import EMBED_DIM
+from core.services.vector_search_service import SETTINGS_PREFIXES, VectorSearchService, supports_iterative_scan
+from core.vectorizer_bot.embedding_writer import binary_copy_buffer
+
+SCHEMA = "vector_eval"
+SHAPES = {
+    "goldmine": {"limit": 50},
+    "classifier": {"limit": 5, "exclude_self": True},
+    "clusterizer": {"limit": 5, "exclude_self": True, "concept": True, "clustered_only": True},
+}
+SYNTHETIC_CHUNK = 10000
+
+SQL_SAMPLE = """
+    SELECT pe.product_id, pe.embedding_visual::text, p.taxonomy_concept
+    FROM product_embeddings pe JOIN products p ON p.product_id = pe.product_id
+    WHERE pe.embedding_visual IS NOT NULL AND pe.embedding_bits IS NOT NULL
+    ORDER BY random() LIMIT %s
+"""
+SQL_SYNTHETIC_SCHEMA = f"""
+    CREATE SCHEMA {SCHEMA};
+    CREATE TABLE {SCHEMA}.products (product_id bigint PRIMARY KEY, title text, taxonomy_concept varchar(255));
+    CREATE TABLE {SCHEMA}.product_embeddings (
+        product_id bigint PRIMARY KEY, embedding_visual vector({EMBED_DIM}), embedding_bits bit({EMBED_DIM}),
+        processed_at timestamp DEFAULT now()
+    );
+    CREATE TABLE {SCHEMA}.product_cluster_membership (product_id bigint PRIMARY KEY, cluster_id bigint);
+"""
+SQL_SYNTHETIC_INDEXES = f"""
+    UPDATE {SCHEMA}.product_embeddings SET embedding_bits = binary_quantize(embedding_visual)::bit({EMBED_DIM});
+    CREATE INDEX ON {SCHEMA}.products (taxonomy_concept);
+    CREATE INDEX idx_emb_visual ON {SCHEMA}.product_embeddings
+        USING hnsw (embedding_visual vector_cosine_ops) WITH (m = %(m)s, ef_construction = %(ef_construction)s);
+    CREATE INDEX emb_bits_hnsw_idx ON {SCHEMA}.product_embeddings
+        USING hnsw (embedding_bits bit_hamming_ops) WITH (m = %(m)s, ef_construction = %(ef_construction)s);
+    ANALYZE {SCHEMA}.products, {SCHEMA}.product_embeddings, {SCHEMA}.product_cluster_membership;
+"""
+
+
+def synthetic_embeddings(n, groups, noise=0.35, seed=0, chunk=SYNTHETIC_CHUNK, dim=EMBED_DIM):
+    """
+    Lotes (ids, grupo, vectores L2-normalizados) de una mezcla de `groups` gaussianas:
+    cada producto es el centro de su grupo más ruido, así hay vecinos cercanos de verdad.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((groups, dim), dtype=np.float32)
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        group = rng.integers(0, groups, size)
+        vectors = centers[group] + noise * rng.standard_normal((size, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield np.arange(start + 1, start + size + 1), group, vectors
+
+
+def recall_at_k(truth, found):
+    """Fracción del top-k exacto que devolvió la estrategia (1.0 si el exacto vino vacío)."""
+    truth = set(truth)
+    return len(truth & set(found)) / len(truth) if truth else 1.0
+
+
+def plan_buffers(plan):
+    """Buffers de shared memory (hit = ya en caché, read = a disco/SO) de un EXPLAIN (BUFFERS, FORMAT JSON)."""
+    root = plan[0]["Plan"] if isinstance(plan, list) else plan["Plan"]
+    return {"shared_hit": root.get("Shared Hit Blocks", 0), "shared_read": root.get("Shared Read Blocks", 0)}
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {"p50": round(float(np.percentile(ms, 50)), 2), "p95": round(float(np.percentile(ms, 95)), 2),
+            "mean": round(float(ms.mean()), 2)}
+
+
+class Command(BaseCommand):
+    help = "Mide recall@k, latencia y buffers de las estrategias de búsqueda visual (exacta, HNSW, binaria)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=100, help="Productos de consulta (default: 100).")
+        parser.add_argument("--shapes", default=",".join(SHAPES), help=f"Formas de consulta (default: {','.join(SHAPES)}).")
+        parser.add_argument("--strategies", default="hnsw,binary", help="Estrategias a comparar contra exact (default: hnsw,binary).")
+        parser.add_argument("--ef-search", default="40,100,200", help="Valores de hnsw.ef_search (default: 40,100,200).")
+        parser.add_argument("--oversample", default="10", help="Valores de oversample del modo binary (default: 10).")
+        parser.add_argument("--explain", type=int, default=20, help="Consultas por estrategia medidas con EXPLAIN ANALYZE (default: 20).")
+        parser.add_argument("--synthetic", type=int, help="Generar N embeddings sintéticos en el esquema vector_eval.")
+        parser.add_argument("--groups", type=int, default=0, help="Grupos de la mezcla sintética (default: N/20).")
+        parser.add_argument("--concepts", type=int, default=200, help="taxonomy_concept sintéticos (default: 200).")
+        parser.add_argument("--m", type=int, default=16, help="HNSW m de los índices sintéticos (default: 16).")
+        parser.add_argument("--ef-construction", type=int, default=64, help="HNSW ef_construction sintético (default: 64).")
+        parser.add_argument("--reuse", action="store_true", help="Usar el esquema vector_eval existente sin regenerarlo.")
+        parser.add_argument("--drop-synthetic", action="store_true", help="Borrar el esquema vector_eval y salir.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Archivo JSON de salida (default: stdout).")
+
+    def handle(self, *args, **options):
+        if options["drop_synthetic"]:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            self.stderr.write(f"  Esquema {SCHEMA} borrado")
+            return
+
+        shapes = [s for s in options["shapes"].split(",") if s]
+        unknown = set(shapes) - set(SHAPES)
+        if unknown:
+            raise CommandError(f"Formas desconocidas: {', '.join(sorted(unknown))} (opciones: {', '.join(SHAPES)})")
+
+        dataset = {"source": "production"}
+        with connection.cursor() as cursor:
+            if options["synthetic"] or options["reuse"]:
+                if not options["reuse"]:
+                    self.build_synthetic(cursor, options)
+                # Las consultas de VectorSearchService no califican el esquema: resuelven a vector_eval
+                cursor.execute(f"SET search_path TO {SCHEMA}, public;")
+                dataset = {"source": "synthetic", "schema": SCHEMA}
+            try:
+                cursor.execute("SELECT COUNT(*) FROM product_embeddings WHERE embedding_visual IS NOT NULL;")
+                dataset["rows"] = cursor.fetchone()[0]
+                cursor.execute(SQL_SAMPLE, (options["queries"],))
+                queries = cursor.fetchall()
+                if not queries:
+                    raise CommandError("No hay embeddings para consultar (¿falta --synthetic?).")
+                results = [
+                    result
+                    for shape in shapes
+                    for result in self.evaluate_shape(cursor, shape, queries, options)
+                ]
+            finally:
+                cursor.execute("RESET search_path;")
+
+        report = {"dataset": {**dataset, "queries": len(queries)}, "results": results}
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output)
+            self.stderr.write(f"  Reporte en {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def build_synthetic(self, cursor, options):
+        n = options["synthetic"]
+        groups = options["groups"] or max(n // 20, 1)
+        self.stderr.write(f"  Generando {n} embeddings sintéticos ({groups} grupos) en {SCHEMA}...")
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cursor.execute(SQL_SYNTHETIC_SCHEMA)
+        raw = cursor.cursor if hasattr(cursor, "cursor") else cursor  # copy_expert es de psycopg2
+        for ids, group, vectors in synthetic_embeddings(n, groups, seed=options["seed"]):
+            concepts = group % options["concepts"]
+            execute_values(
+                raw, f"INSERT INTO {SCHEMA}.products (product_id, title, taxonomy_concept) VALUES %s",
+                [(int(pid), f"Producto {pid}", f"Concepto {c}") for pid, c in zip(ids, concepts)], page_size=1000,
+            )
+            # La mitad de los productos ya está en un cluster (el clusterizer solo compara contra esos)
+            execute_values(
+                raw, f"INSERT INTO {SCHEMA}.product_cluster_membership (product_id, cluster_id) VALUES %s",
+                [(int(pid), int(g)) for pid, g in zip(ids, group) if pid % 2 == 0], page_size=1000,
+            )
+            raw.copy_expert(
+                f"COPY {SCHEMA}.product_embeddings (product_id, embedding_visual) FROM STDIN WITH (FORMAT binary)",
+                binary_copy_buffer(zip(ids.tolist(), vectors)),
+            )
+        self.stderr.write("  Construyendo índices...")
+        cursor.execute(SQL_SYNTHETIC_INDEXES, {"m": options["m"], "ef_construction": options["ef_construction"]})
+
+    def strategies(self, options):
+        """[(nombre, kwargs de VectorSearchService.nearest)] a comparar contra el exacto."""
+        wanted = [s for s in options["strategies"].split(",") if s]
+        ef_values = [int(v) for v in options["ef_search"].split(",") if v]
+        oversamples = [int(v) for v in options["oversample"].split(",") if v]
+        configs = []
+        for strategy in wanted:
+            if strategy == "hnsw":
+                configs += [(f"hnsw ef={ef}", {"mode": "hnsw", "ef_search": ef}) for ef in ef_values]
+            elif strategy == "binary":
+                configs += [
+                    (f"binary x{o} ef={ef}", {"mode": "binary", "oversample": o, "ef_search": ef})
+                    for o in oversamples for ef in ef_values
+                ]
+            elif strategy == "exact":
+                configs.append(("exact", {"mode": "exact"}))
+            else:
+                raise CommandError(f"Estrategia desconocida: {strategy} (opciones: exact, hnsw, binary)")
+        return configs
+
+    def evaluate_shape(self, cursor, shape, queries, options):
+        spec = SHAPES[shape]
+        k = spec["limit"]
+        cases = []
+        for pid, vector, concept in queries:
+            if spec.get("concept") and not concept:
+                continue
+            cases.append((vector, {
+                "limit": k,
+                "exclude_id": pid if spec.get("exclude_self") else None,
+                "concept": concept if spec.get("concept") else None,
+                "clustered_only": spec.get("clustered_only", False),
+            }))
+        self.stderr.write(f"  {shape}: {len(cases)} consultas, top {k}")
+
+        exact_results, exact_times = self.run(cursor, cases, {"mode": "exact"})
+        truth = [[pid for pid, _ in rows] for rows in exact_results]
+        results = [{
+            "shape": shape, "strategy": "exact", "k": k, "recall_at_k": 1.0,
+            "latency_ms": latency_summary(exact_times),
+            "buffers": self.buffers(cursor, cases, {"mode": "exact"}, options["explain"]),
+        }]
+        for name, params in self.strategies(options):
+            found, seconds = self.run(cursor, cases, params)
+            recall = float(np.mean([recall_at_k(t, [pid for pid, _ in rows]) for t, rows in zip(truth, found)]))
+            results.append({
+                "shape": shape, "strategy": name, "params": params, "k": k,
+                "recall_at_k": round(recall, 4),
+                "latency_ms": latency_summary(seconds),
+                "buffers": self.buffers(cursor, cases, params, options["explain"]),
+            })
+            self.stderr.write(f"    {name}: recall@{k} {recall:.3f}, p50 {results[-1]['latency_ms']['p50']} ms")
+        return results
+
+    @staticmethod
+    def run(cursor, cases, params):
+        """Corre cada consulta una vez (tras un calentamiento) y mide la latencia de punta a punta."""
+        if cases:
+            VectorSearchService.nearest(cursor, cases[0][0], **cases[0][1], **params)
+        rows, seconds = [], []
+        for vector, query in cases:
+            started = time.perf_counter()
+            rows.append(VectorSearchService.nearest(cursor, vector, **query, **params))
+            seconds.append(time.perf_counter() - started)
+        return rows, seconds
+
+    @staticmethod
+    def buffers(cursor, cases, params, sample):
+        """Promedio de shared buffers por consulta, con EXPLAIN (ANALYZE, BUFFERS) sobre las primeras `sample`."""
+        totals = []
+        iterative_scan = supports_iterative_scan(cursor)
+        for vector, query in cases[:sample]:
+            sql, sql_params = VectorSearchService.build_query(**query, **params, iterative_scan=iterative_scan)
+            sql_params["vector"] = vector
+            with transaction.atomic():  # Los set_config locales valen para el EXPLAIN siguiente
+                prefix = next((p for p in SETTINGS_PREFIXES if sql.startswith(p)), None)
+                if prefix:
+                    cursor.execute(prefix, sql_params)
+                    sql = sql[len(prefix):]
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, sql_params)
+                plan = cursor.fetchone()[0]
+            totals.append(plan_buffers(json.loads(plan) if isinstance(plan, str) else plan))
+        if not totals:
+            return None
+        return {key: round(float(np.mean([t[key] for t in totals])), 1) for key in totals[0]}
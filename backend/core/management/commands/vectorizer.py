@@ -4,20 +4,27 @@ Módulo de Vectorización (Django Command).
 
 import os
 import time
-import requests
+from datetime import datetime, timezone
 import logging
 import pathlib
+import socket
 import sys
 from io import BytesIO
 import torch
 from PIL import Image
-from transformers import AutoProcessor, SiglipModel
+from transformers import AutoProcessor
 import psycopg2
-from psycopg2.extensions import register_adapter, AsIs
-import numpy as np
 from django.core.management.base import BaseCommand
 from dotenv import load_dotenv
 
+from pgvector.psycopg2 import register_vector
+
+from core.vectorizer_bot import embedding_cache, embedding_writer, image_fetcher
+from core.vectorizer_bot.image_fetcher import ImageFetcher
+from core.vectorizer_bot.inference import load_backend
+from core.vectorizer_bot.pipeline import Pipeline
+from core.vectorizer_bot.preprocess import ImagePreprocessor, PreprocessConfig
+
 load_dotenv()
 
 # ─────── Configuración de Logs ───────
@@ -36,11 +43,6 @@ ch = logging.StreamHandler(sys.stdout)
 ch.setFormatter(formatter)
 logger.addHandler(ch)
 
-def addapt_numpy_array(numpy_array):
-    return AsIs(list(numpy_array))
-
-register_adapter(np.ndarray, addapt_numpy_array)
-
 # Configuración DB
 user = os.getenv("POSTGRES_USER", "droptools_admin")
 # SECURITY: Never hardcode passwords. Ensure ENV var is set.
@@ -57,6 +59,112 @@ if not pwd:
 
 MODEL_NAME = "google/siglip-so400m-patch14-384" # 384px - Estado del Arte (1152 dims)
 
+# Pipeline: cola DB → descarga (I/O) → preprocesado (decode + resize) → inferencia → escritura.
+# Cada etapa tiene su cola acotada: descargas e inferencia se solapan en lugar de alternarse.
+FETCH_BATCH = int(os.getenv("VECTORIZER_FETCH_BATCH", "200"))  # productos por consulta a la cola
+DOWNLOAD_WORKERS = int(os.getenv("VECTORIZER_DOWNLOAD_WORKERS", "16"))
+PREPROCESS_WORKERS = int(os.getenv("VECTORIZER_PREPROCESS_WORKERS", "2"))  # procesos de decode + resize (0 = en hilo)
+INFERENCE_BATCH = int(os.getenv("VECTORIZER_INFERENCE_BATCH", "32"))  # lote máximo (dinámico)
+INFERENCE_MAX_WAIT = float(os.getenv("VECTORIZER_INFERENCE_MAX_WAIT", "1.0"))  # s esperando completar lote
+WRITE_BATCH = int(os.getenv("VECTORIZER_WRITE_BATCH", "128"))  # filas por commit
+WRITE_MAX_WAIT = float(os.getenv("VECTORIZER_WRITE_MAX_WAIT", "2.0"))
+QUEUE_SIZE = int(os.getenv("VECTORIZER_QUEUE_SIZE", "256"))  # ítems por cola entre etapas
+# Buffers compartidos de 3×384×384 float32 (1.7 MB c/u) entre preproceso e inferencia: /dev/shm debe alcanzar
+PREPROCESS_SLOTS = max(int(os.getenv("VECTORIZER_PREPROCESS_SLOTS", "0")) or 2 * INFERENCE_BATCH, INFERENCE_BATCH + 2 * PREPROCESS_WORKERS)
+REPORT_SECONDS = int(os.getenv("VECTORIZER_REPORT_SECONDS", "60"))
+TORCH_THREADS = int(os.getenv("VECTORIZER_TORCH_THREADS", "0"))  # 0 = default de torch
+
+# Backend de inferencia: torch (fp32) | onnx | onnx-int8 (ONNX Runtime, requiere vectorizer_validate)
+BACKEND = os.getenv("VECTORIZER_BACKEND", "torch").lower()
+ONNX_DIR = pathlib.Path(os.getenv("VECTORIZER_ONNX_DIR", "/app/cache_huggingface/onnx"))
+ORT_THREADS = int(os.getenv("VECTORIZER_ORT_THREADS", "0"))  # 0 = un hilo por core
+IDLE_SLEEP = 30  # s sin productos pendientes
+
+# Caché de embeddings (image_embeddings / image_url_cache): fotos repetidas entre productos
+# no se descargan (acierto por URL) ni pasan por el modelo (acierto por hash de los bytes)
+CACHE_ENABLED = os.getenv("VECTORIZER_CACHE", "True").lower() in ("1", "true", "yes")
+URL_CACHE_MAX_AGE_DAYS = int(os.getenv("VECTORIZER_URL_CACHE_MAX_AGE_DAYS", "30"))
+CACHE_LOOKUP_BATCH = 64
+
+# Descargas: cliente compartido (keep-alive, HTTP/2 si hay httpx+h2) y backoff por URL en image_fetch_failures
+FETCH_TIMEOUT = float(os.getenv("VECTORIZER_FETCH_TIMEOUT", "10"))
+MAX_IMAGE_BYTES = int(float(os.getenv("VECTORIZER_MAX_IMAGE_MB", "15")) * 1024 * 1024)
+HTTP2_ENABLED = os.getenv("VECTORIZER_HTTP2", "True").lower() in ("1", "true", "yes")
+FETCH_BACKOFF_BASE = int(os.getenv("VECTORIZER_FETCH_BACKOFF_BASE", "900"))  # s tras el primer fallo (se duplica)
+FETCH_BACKOFF_MAX = int(os.getenv("VECTORIZER_FETCH_BACKOFF_MAX", "86400"))
+FETCH_GIVE_UP = int(os.getenv("VECTORIZER_FETCH_GIVE_UP", "8"))  # fallos antes de abandonar la URL
+FETCH_GIVE_UP_PERMANENT = int(os.getenv("VECTORIZER_FETCH_GIVE_UP_PERMANENT", "3"))  # ídem con 404/410/...
+
+# Cola: product_embedding_queue (la llena un trigger en products). Cada worker toma filas con
+# SKIP LOCKED y las marca con un lease en not_before: varias réplicas no se pisan y lo que
+# tomó un worker caído vuelve a la cola cuando vence el lease.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.getenv("VECTORIZER_LEASE_SECONDS", "900"))
+RETRY_COOLDOWN = 900  # s antes de reintentar un producto fallido (por algo que no sea la descarga)
+MAX_ATTEMPTS = int(os.getenv("VECTORIZER_MAX_ATTEMPTS", "5"))  # fallos seguidos antes de descartarlo
+
+SQL_CLAIM = """
+    UPDATE product_embedding_queue q
+    SET not_before = NOW() + make_interval(secs => %(lease)s), claimed_by = %(worker)s, claimed_at = NOW()
+    FROM (
+        SELECT product_id FROM product_embedding_queue
+        WHERE not_before <= NOW()
+        ORDER BY not_before
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ) c
+    WHERE q.product_id = c.product_id
+    RETURNING q.product_id, (SELECT url_image_s3 FROM products p WHERE p.product_id = q.product_id), q.enqueued_at;
+"""
+# Solo se borra si nadie lo volvió a encolar mientras tanto (imagen cambiada a mitad de proceso)
+SQL_DONE = """
+    DELETE FROM product_embedding_queue q
+    USING (SELECT unnest(%s::bigint[]) AS product_id, unnest(%s::timestamptz[]) AS enqueued_at) d
+    WHERE q.product_id = d.product_id AND q.enqueued_at = d.enqueued_at;
+"""
+# Fallos de descarga: el reintento lo decide el backoff de la URL (NULL si se abandonó)
+SQL_RETRY = """
+    UPDATE product_embedding_queue q
+    SET attempts = q.attempts + 1, claimed_by = NULL,
+        not_before = CASE WHEN d.url_failed THEN d.retry_after
+                          WHEN q.attempts + 1 >= %(max_attempts)s THEN NULL
+                          ELSE NOW() + make_interval(secs => %(cooldown)s) END
+    FROM (
+        SELECT unnest(%(ids)s::bigint[]) AS product_id, unnest(%(enqueued)s::timestamptz[]) AS enqueued_at,
+               unnest(%(url_failed)s::boolean[]) AS url_failed, unnest(%(retry_after)s::timestamptz[]) AS retry_after
+    ) d
+    WHERE q.product_id = d.product_id AND q.enqueued_at = d.enqueued_at;
+"""
+SQL_RELEASE = """
+    UPDATE product_embedding_queue SET not_before = NOW(), claimed_by = NULL
+    WHERE claimed_by = %s AND not_before > NOW();
+"""
+
+
+class WorkItem:
+    """Producto en tránsito por el pipeline."""
+
+    __slots__ = (
+        "product_id", "url", "enqueued_at", "data", "image_hash", "pixels", "vector", "cache_hit", "error",
+        "fetch_error", "fetch_status", "url_failures", "retry_after",
+    )
+
+    def __init__(self, product_id, url, enqueued_at=None):
+        self.product_id = product_id
+        self.url = url
+        self.enqueued_at = enqueued_at  # versión de la fila de la cola que se tomó
+        self.data = None  # bytes de la imagen
+        self.image_hash = None  # clave de caché (hash de los bytes)
+        self.pixels = None  # slot del preprocesador con el tensor [3, H, W] listo para el modelo
+        self.vector = None
+        self.cache_hit = None  # "url" | "image" si el vector salió de la caché
+        self.error = None
+        self.fetch_error = None  # tipo de fallo de la descarga ("http_404", "timeout", ...)
+        self.fetch_status = None
+        self.url_failures = 0  # fallos previos registrados para la URL
+        self.retry_after = None  # próximo intento de la URL si falló la descarga (None = abandonada)
+
+
 class Vectorizer:
     def __init__(self):
         try:
@@ -69,9 +177,15 @@ class Vectorizer:
             logger.info(f"   Cache HuggingFace: {hf_cache}")
             
             # Usamos AutoProcessor para manejar automáticamente el resize a 384x384
-            self.model = SiglipModel.from_pretrained(MODEL_NAME).to(self.device)
             self.processor = AutoProcessor.from_pretrained(MODEL_NAME)
-            logger.info("✅ Modelo SigLIP cargado y listo para alta resolución.")
+            self.preprocessor = ImagePreprocessor(
+                PreprocessConfig.from_processor(self.processor), workers=PREPROCESS_WORKERS, slots=PREPROCESS_SLOTS,
+            )
+            self.backend = load_backend(
+                BACKEND, MODEL_NAME, ONNX_DIR, device=self.device,
+                threads=TORCH_THREADS if BACKEND == "torch" else ORT_THREADS,
+            )
+            logger.info(f"✅ Modelo SigLIP cargado y listo para alta resolución (backend: {self.backend.name}).")
             
         except ImportError as e:
             logger.error(f"❌ FALLO CRÍTICO: Dependencia faltante")
@@ -85,9 +199,14 @@ class Vectorizer:
             logger.error(f"   Modelo: {MODEL_NAME}")
             logger.error(f"   Device: {self.device if hasattr(self, 'device') else 'No definido'}")
             raise
+        
+        self._conns = {}  # Conexión por etapa (cada etapa con DB corre en un solo hilo)
+        self.fetcher = ImageFetcher(
+            pool_size=DOWNLOAD_WORKERS, timeout=FETCH_TIMEOUT, max_bytes=MAX_IMAGE_BYTES, http2=HTTP2_ENABLED,
+        )
 
     def get_db_connection(self):
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             dbname=str(dbname), 
             user=str(user), 
             password=str(pwd), 
@@ -95,13 +214,30 @@ class Vectorizer:
             port=str(port),
             client_encoding='UTF8'
         )
+        register_vector(conn)  # vector ↔ numpy (lecturas de la caché)
+        return conn
+
+    def stage_connection(self, stage):
+        conn = self._conns.get(stage)
+        if conn is None or conn.closed:
+            conn = self._conns[stage] = self.get_db_connection()
+        return conn
+
+    def drop_connection(self, stage):
+        conn = self._conns.pop(stage, None)
+        if conn is not None:
+            conn.close()
+
+    def download_image(self, url):
+        """Bytes de la imagen o None si falla."""
+        return self.fetcher.fetch(url).data
 
     def fetch_image(self, url):
+        data = self.download_image(url)
+        if data is None:
+            return None
         try:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
-            return image
+            return Image.open(BytesIO(data)).convert("RGB")
         except Exception:
             return None
 
@@ -115,135 +251,256 @@ class Vectorizer:
         Retorna: numpy array de shape [N, 1152]
         """
         # SigLIP AutoProcessor maneja el resize y normalización
-        inputs = self.processor(images=images, return_tensors="pt", padding=True).to(self.device)
-        
-        with torch.no_grad():
-            # SigLIP: get_image_features retorna los embeddings ya proyectados
-            image_features = self.model.get_image_features(**inputs)
-        
-        # Normalización L2 (Importante para búsqueda por coseno)
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
-        return image_features.cpu().numpy()
+        inputs = self.processor(images=images, return_tensors="pt", padding=True)
+        return self.embed_pixels(inputs["pixel_values"])
+
+    def preprocess(self, image):
+        """Imagen PIL → tensor [3, 384, 384] normalizado (lo que espera el modelo)."""
+        return self.processor(images=[image], return_tensors="pt")["pixel_values"][0]
+
+    def embed_pixels(self, pixel_values):
+        """Tensor [N, 3, H, W] → embeddings L2-normalizados (numpy [N, 1152]) con el backend activo."""
+        return self.backend.embed(pixel_values)
+
+    # ─────── Etapas del pipeline ───────
+
+    def queue_source(self):
+        """Fuente: toma lotes de la cola con SKIP LOCKED (lease de LEASE_SECONDS)."""
+        conn = self.get_db_connection()
+        try:
+            while True:
+                with conn.cursor() as cur:
+                    cur.execute(SQL_CLAIM, {"lease": LEASE_SECONDS, "worker": WORKER_ID, "limit": FETCH_BATCH})
+                    rows = cur.fetchall()
+                conn.commit()  # Claim confirmado al instante: los locks de fila no se sostienen
+                
+                if not rows:
+                    logger.info(f"💤 Todo al día. Durmiendo {IDLE_SLEEP}s...")
+                    time.sleep(IDLE_SLEEP)
+                    continue
+                
+                for pid, url, enqueued_at in rows:
+                    item = WorkItem(pid, url, enqueued_at)
+                    if not url:
+                        item.error = "no_image"  # La imagen se borró después de encolarlo
+                    yield item
+        finally:
+            conn.close()
+
+    def release_claims(self):
+        """Devuelve a la cola lo tomado por este worker que no llegó a escribirse (apagado ordenado)."""
+        try:
+            conn = self.get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(SQL_RELEASE, (WORKER_ID,))
+                released = cur.rowcount
+            conn.commit()
+            conn.close()
+            if released:
+                logger.info(f"↩️ {released} productos devueltos a la cola")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron liberar los claims (vencen en {LEASE_SECONDS}s): {e}")
+
+    def url_filter_stage(self, items):
+        """Saltea las URLs en backoff o abandonadas (sin gastar una descarga que va a fallar)."""
+        try:
+            conn = self.stage_connection("filtro_urls")
+            with conn.cursor() as cur:
+                known = image_fetcher.lookup_failures(cur, [it.url for it in items if not it.error and it.vector is None])
+            conn.rollback()
+        except Exception as e:
+            logger.warning(f"⚠️ Registro de URLs fallidas no disponible: {e}")
+            self.drop_connection("filtro_urls")
+            return items
+        now = datetime.now(timezone.utc)
+        for it in items:
+            if it.error or it.vector is not None or it.url not in known:
+                continue
+            it.url_failures, it.retry_after = known[it.url]
+            if it.retry_after is None or it.retry_after > now:
+                it.error = "url_backoff"
+        return items
+
+    def url_cache_stage(self, items):
+        """Acierto por URL: el vector ya existe y no hace falta ni descargar la imagen."""
+        try:
+            conn = self.stage_connection("cache_url")
+            with conn.cursor() as cur:
+                hits = embedding_cache.lookup_urls(cur, [it.url for it in items if not it.error], MODEL_NAME, URL_CACHE_MAX_AGE_DAYS)
+            conn.rollback()
+        except Exception as e:
+            logger.warning(f"⚠️ Caché por URL no disponible: {e}")
+            self.drop_connection("cache_url")
+            return items
+        for it in items:
+            if it.url in hits and not it.error:
+                it.image_hash, it.vector = hits[it.url]
+                it.cache_hit = "url"
+        return items
+
+    def download_stage(self, item):
+        if item.error or item.vector is not None:
+            return item
+        result = self.fetcher.fetch(item.url)
+        item.data = result.data
+        if item.data is None:
+            item.error = "download"
+            item.fetch_error, item.fetch_status = result.error or "error", result.status
+        else:
+            item.image_hash = embedding_cache.content_hash(item.data)
+        return item
+
+    def image_cache_stage(self, items):
+        """Acierto por contenido: la misma foto ya se vectorizó con otra URL."""
+        pending = [it for it in items if it.image_hash and it.vector is None]
+        if not pending:
+            return items
+        try:
+            conn = self.stage_connection("cache_imagen")
+            with conn.cursor() as cur:
+                hits = embedding_cache.lookup_images(cur, [it.image_hash for it in pending], MODEL_NAME)
+            conn.rollback()
+        except Exception as e:
+            logger.warning(f"⚠️ Caché por imagen no disponible: {e}")
+            self.drop_connection("cache_imagen")
+            return items
+        for it in pending:
+            if it.image_hash in hits:
+                it.vector = hits[it.image_hash]
+                it.cache_hit = "image"
+                it.data = None
+        return items
+
+    def preprocess_stage(self, item):
+        if item.error or item.vector is not None:
+            return item
+        try:
+            item.pixels = self.preprocessor.preprocess(item.data)
+        except Exception:
+            item.error = "decode"
+        item.data = None  # Liberar los bytes: ya no se necesitan
+        return item
+
+    def inference_stage(self, items):
+        ready = [it for it in items if not it.error and it.vector is None and it.pixels is not None]
+        try:
+            if ready:
+                vectors = self.embed_pixels(self.preprocessor.stack(it.pixels for it in ready))
+                for it, vec in zip(ready, vectors):
+                    it.vector = vec
+        except Exception as e:
+            logger.error(f"Error en batch IA: {e}")
+            for it in ready:
+                it.error = "inference"
+        finally:
+            for it in items:
+                if it.pixels is not None:
+                    self.preprocessor.release(it.pixels)
+                    it.pixels = None
+        return items
+
+    def write_stage(self, items):
+        """Upsert de un lote (embeddings y fallidos) y su salida de la cola, en una sola transacción."""
+        embedded = [it for it in items if it.vector is not None]
+        failed = [it for it in items if it.vector is None]
+        computed = [it for it in embedded if not it.cache_hit]
+        fetch_failed = [it for it in failed if it.fetch_error]
+        try:
+            conn = self.stage_connection("escritura")
+            with conn.cursor() as cur:
+                if fetch_failed:
+                    retry_after = image_fetcher.record_failures(
+                        cur, [(it.url, it.fetch_error, it.fetch_status) for it in fetch_failed],
+                        base=FETCH_BACKOFF_BASE, cap=FETCH_BACKOFF_MAX,
+                        give_up=FETCH_GIVE_UP, give_up_permanent=FETCH_GIVE_UP_PERMANENT,
+                    )
+                    for it in fetch_failed:
+                        it.retry_after = retry_after.get(it.url)
+                        it.url_failures += 1
+                recovered = [it.url for it in embedded if it.url_failures and it.cache_hit != "url"]
+                if recovered:
+                    image_fetcher.clear_failures(cur, recovered)
+                if embedded:
+                    embedding_writer.write_embeddings(cur, [(it.product_id, it.vector) for it in embedded])
+                    cur.execute(SQL_DONE, ([it.product_id for it in embedded], [it.enqueued_at for it in embedded]))
+                    if CACHE_ENABLED:
+                        embedding_cache.store(
+                            cur, MODEL_NAME,
+                            images=[(it.image_hash, it.vector) for it in computed if it.image_hash],
+                            urls=[(it.url, it.image_hash) for it in embedded if it.cache_hit != "url"],
+                        )
+                        embedding_cache.touch(cur, [it.image_hash for it in embedded if it.cache_hit])
+                if failed:
+                    embedding_writer.mark_failed(cur, [it.product_id for it in failed])
+                    cur.execute(SQL_RETRY, {
+                        "ids": [it.product_id for it in failed],
+                        "enqueued": [it.enqueued_at for it in failed],
+                        "max_attempts": MAX_ATTEMPTS,
+                        "cooldown": RETRY_COOLDOWN,
+                        "url_failed": [bool(it.fetch_error) or it.error == "url_backoff" for it in failed],
+                        "retry_after": [it.retry_after for it in failed],
+                    })
+            conn.commit()
+            cached = len(embedded) - len(computed)
+            logger.info(
+                f"✅ Vectorizados {len(embedded)} productos"
+                + (f" (♻️ {cached} desde caché)" if cached else "")
+                + (f" | ⚠️ {len(failed)} fallidos o sin imagen" if failed else "")
+            )
+            abandoned = sum(1 for it in fetch_failed if it.retry_after is None)
+            if abandoned:
+                logger.info(f"🚫 {abandoned} URLs abandonadas tras fallos repetidos (vuelven si cambia la imagen)")
+        except Exception as e:
+            # El lease vence y otro worker (o este) los vuelve a tomar
+            logger.error(f"❌ Error guardando lote: {e}")
+            self.drop_connection("escritura")
+        return None
+
+    def build_pipeline(self):
+        pipeline = Pipeline("vectorizer", report_every=REPORT_SECONDS, log=logger)
+        pipeline.source("cola", self.queue_source)
+        if CACHE_ENABLED:
+            pipeline.stage("cache_url", self.url_cache_stage, maxsize=QUEUE_SIZE,
+                           batch_size=CACHE_LOOKUP_BATCH, max_wait=0.2)
+        pipeline.stage("filtro_urls", self.url_filter_stage, maxsize=QUEUE_SIZE,
+                       batch_size=CACHE_LOOKUP_BATCH, max_wait=0.2)
+        pipeline.stage("descarga", self.download_stage, workers=DOWNLOAD_WORKERS, maxsize=QUEUE_SIZE)
+        if CACHE_ENABLED:
+            pipeline.stage("cache_imagen", self.image_cache_stage, maxsize=QUEUE_SIZE,
+                           batch_size=CACHE_LOOKUP_BATCH, max_wait=0.2)
+        # Hilos que alimentan el pool de procesos: el doble, para que ningún proceso quede esperando trabajo
+        pipeline.stage("preproceso", self.preprocess_stage, workers=max(2 * PREPROCESS_WORKERS, 1), maxsize=QUEUE_SIZE)
+        pipeline.stage("inferencia", self.inference_stage, maxsize=QUEUE_SIZE,
+                       batch_size=INFERENCE_BATCH, max_wait=INFERENCE_MAX_WAIT)
+        pipeline.stage("escritura", self.write_stage, maxsize=QUEUE_SIZE,
+                       batch_size=WRITE_BATCH, max_wait=WRITE_MAX_WAIT)
+        return pipeline
 
     def run(self):
         logger.info("🚀 Vectorizer daemon iniciado")
         logger.info(f"   Device: {self.device}")
-        logger.info(f"   Modelo: {MODEL_NAME}")
+        logger.info(f"   Modelo: {MODEL_NAME} ({self.backend.name})")
         logger.info(f"   Cache HF: {os.getenv('HF_HOME', 'No configurado')}")
+        logger.info(
+            f"   Pipeline: {DOWNLOAD_WORKERS} descargas, {PREPROCESS_WORKERS} procesos de preproceso "
+            f"({PREPROCESS_SLOTS} buffers), "
+            f"lotes de inferencia ≤{INFERENCE_BATCH}, escritura ≤{WRITE_BATCH}"
+        )
+        logger.info(f"   Worker: {WORKER_ID} (lease {LEASE_SECONDS}s)")
+        logger.info(f"   Descargas: {self.fetcher.protocol}, pool de {DOWNLOAD_WORKERS} conexiones")
         
-        while True:
-            conn = None
-            try:
-                conn = self.get_db_connection()
-                cur = conn.cursor()
-
-                sql_queue = """
-                    SELECT p.product_id, p.url_image_s3 
-                    FROM products p
-                    LEFT JOIN product_embeddings pe ON p.product_id = pe.product_id
-                    WHERE p.url_image_s3 IS NOT NULL 
-                    AND p.url_image_s3 != ''
-                    AND (
-                        pe.product_id IS NULL 
-                        OR (
-                            pe.embedding_visual IS NULL 
-                            AND p.updated_at > pe.processed_at
-                            -- COOLDOWN: If it failed recently (processed_at is new but embedding is null), 
-                            -- don't retry immediately even if product updated. Wait 15 mins.
-                            AND pe.processed_at < (NOW() - INTERVAL '15 minutes')
-                        )
-                    )
-                    LIMIT 50;
-                """
-                cur.execute(sql_queue)
-                rows = cur.fetchall()
-
-                if not rows:
-                    logger.info("💤 Todo al día. Durmiendo 30s...")
-                    time.sleep(30)
-                    if conn: conn.close()
-                    continue
-
-                logger.info(f"🔨 Procesando lote de {len(rows)} imágenes (Modo Batch)...")
-                
-                # --- OPTIMIZACIÓN PARALELA ---
-                from concurrent.futures import ThreadPoolExecutor
-                
-                # 1. Descarga Paralela de Imágenes (I/O Bound)
-                images_map = {} # { product_id: PIL.Image }
-                failed_ids = []
-                
-                def download_task(row):
-                    pid, url = row
-                    img = self.fetch_image(url)
-                    return pid, img
-
-                with ThreadPoolExecutor(max_workers=20) as executor:
-                    futures = [executor.submit(download_task, r) for r in rows]
-                    for f in futures:
-                        pid, img = f.result()
-                        if img:
-                            images_map[pid] = img
-                        else:
-                            failed_ids.append(pid)
-                
-                # 2. Procesamiento Batch IA (GPU/CPU Bound)
-                if images_map:
-                    # Crear listas ordenadas para el batch
-                    valid_pids = list(images_map.keys())
-                    valid_images = list(images_map.values())
-                    
-                    try:
-                        # Inferencia en Batch (Mucho más rápido que 1 a 1)
-                        # Nota: Se asume que 100 imágenes caben en VRAM. Si falla, reduce el LIMIT del SQL.
-                        vectors = self.generate_embedding_batch(valid_images) # Nueva función batch
-                        
-                        # 3. Guardado en DB
-                        sql_upsert = """
-                            INSERT INTO product_embeddings (product_id, embedding_visual, processed_at)
-                            VALUES (%s, %s, NOW())
-                            ON CONFLICT (product_id) 
-                            DO UPDATE SET embedding_visual = EXCLUDED.embedding_visual, processed_at = NOW();
-                        """
-                        
-                        # Preparar datos para executemany (o loop rápido)
-                        upsert_data = []
-                        for i, pid in enumerate(valid_pids):
-                            vec_list = vectors[i].tolist()
-                            upsert_data.append((pid, vec_list))
-                            
-                        # Usamos loop con execute por seguridad con el adaptador pgvector manual,
-                        # executemany a veces da problemas con listas complejas si no está bien configurado el adapter.
-                        for pid, vec in upsert_data:
-                            cur.execute(sql_upsert, (pid, vec))
-                            
-                        logger.info(f"✅ Vectorizados {len(valid_pids)} productos en paralelo.")
-                        
-                    except Exception as e:
-                        logger.error(f"Error en batch IA: {e}")
-                        # Fallback a dummy para no bloquear
-                        failed_ids.extend(valid_pids)
-
-                # 4. Marcar fallidos para no reintentar inmediatamente (o marcar como procesados sin vector)
-                if failed_ids:
-                     sql_upsert_dummy = """
-                        INSERT INTO product_embeddings (product_id, processed_at)
-                        VALUES (%s, NOW())
-                        ON CONFLICT (product_id) DO UPDATE SET processed_at = NOW();
-                    """
-                     # Batch update for failed
-                     for pid in failed_ids:
-                         cur.execute(sql_upsert_dummy, (pid,))
-                     logger.info(f"⚠️ Marcados {len(failed_ids)} fallidos o sin imagen.")
-
-                conn.commit()
-                cur.close()
-                conn.close()
-
-            except Exception as e:
-                logger.error(f"❌ Error en ciclo vectorizer: {e}")
-                time.sleep(10)
-                if conn: conn.close()
+        self.release_claims()  # Claims de una ejecución anterior de este mismo worker (reinicio del contenedor)
+        pipeline = self.build_pipeline().start()
+        try:
+            pipeline.wait()
+        except KeyboardInterrupt:
+            logger.info("⏹️ Deteniendo vectorizer (Ctrl+C)...")
+        finally:
+            pipeline.stop()
+            self.preprocessor.close()
+            self.fetcher.close()
+            self.release_claims()
+            logger.info("📊 " + " | ".join(pipeline.report()))
 
 class Command(BaseCommand):
     help = 'AI Vectorizer Daemon'
@@ -0,0 +1,122 @@
+"""
+Exporta y valida los backends ONNX del vectorizer contra SigLIP fp32 (PyTorch).
+
+Toma una muestra de imágenes reales de products, calcula los embeddings con fp32 y con
+el backend candidato y compara: coseno por imagen y solapamiento de los 10 vecinos más
+cercanos dentro de la muestra. Si pasa los umbrales, deja la aprobación en
+VECTORIZER_ONNX_DIR/validation.json; el vectorizer solo usa un backend ONNX aprobado
+(y atado a ese archivo exacto: reexportar obliga a revalidar).
+
+Uso:
+  python backend/manage.py vectorizer_validate --export
+  python backend/manage.py vectorizer_validate --backend onnx-int8 --sample 200
+  python backend/manage.py vectorizer_validate --backend onnx --min-mean 0.999
+"""
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.vectorizer_bot import inference
+from core.vectorizer_bot.image_fetcher import ImageFetcher
+from core.vectorizer_bot.preprocess import PreprocessConfig, decode, to_pixels
+
+SAMPLE_SQL = """
+    SELECT product_id, url_image_s3 FROM products
+    WHERE url_image_s3 IS NOT NULL AND url_image_s3 <> ''
+    ORDER BY random() LIMIT %s
+"""
+
+
+class Command(BaseCommand):
+    help = "Exporta SigLIP a ONNX (fp32/int8) y valida un backend contra fp32 antes de activarlo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--export", action="store_true", help="Exportar el modelo a ONNX y cuantizar a int8.")
+        parser.add_argument("--backend", choices=[b for b in inference.BACKENDS if b != "torch"], default="onnx-int8",
+                            help="Backend a validar (default: onnx-int8).")
+        parser.add_argument("--sample", type=int, default=200, help="Imágenes de la muestra (default: 200).")
+        parser.add_argument("--batch-size", type=int, default=16, help="Imágenes por lote de inferencia (default: 16).")
+        parser.add_argument("--min-mean", type=float, default=0.995, help="Coseno medio mínimo (default: 0.995).")
+        parser.add_argument("--min-p1", type=float, default=0.98, help="Coseno mínimo del percentil 1 (default: 0.98).")
+        parser.add_argument("--min-overlap", type=float, default=0.9, help="Solapamiento mínimo de vecinos top-10 (default: 0.9).")
+
+    def handle(self, *args, **options):
+        from transformers import AutoProcessor
+
+        from core.management.commands.vectorizer import MODEL_NAME, ONNX_DIR, ORT_THREADS, TORCH_THREADS
+
+        if options["export"]:
+            self.stdout.write(f"  Exportando {MODEL_NAME} a {ONNX_DIR}...")
+            for path in inference.export_onnx(MODEL_NAME, ONNX_DIR):
+                self.stdout.write(f"    {path.name}: {path.stat().st_size / 1e6:.0f} MB")
+
+        backend = options["backend"]
+        path = inference.onnx_path(ONNX_DIR, backend)
+        if not path.exists():
+            raise CommandError(f"No existe {path}: correr con --export primero.")
+
+        processor = AutoProcessor.from_pretrained(MODEL_NAME)
+        pixels = self.sample_pixels(processor, options["sample"])
+        if len(pixels) < 2:
+            raise CommandError("Muestra insuficiente (no se pudieron descargar imágenes).")
+        self.stdout.write(f"  Muestra: {len(pixels)} imágenes")
+
+        reference_backend = inference.TorchBackend(MODEL_NAME, "cpu", TORCH_THREADS)
+        candidate_backend = inference.OnnxBackend(backend, path, ORT_THREADS)
+        reference, ref_seconds = self.embed_all(reference_backend, pixels, options["batch_size"])
+        candidate, cand_seconds = self.embed_all(candidate_backend, pixels, options["batch_size"])
+
+        result = inference.compare_embeddings(reference, candidate)
+        result.update({
+            "torch_ms_per_image": 1000 * ref_seconds / len(pixels),
+            "candidate_ms_per_image": 1000 * cand_seconds / len(pixels),
+            "thresholds": {k: options[k] for k in ("min_mean", "min_p1", "min_overlap")},
+            "validated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        result["passed"] = (
+            result["mean_cosine"] >= options["min_mean"]
+            and result["p1_cosine"] >= options["min_p1"]
+            and (result["neighbor_overlap"] is None or result["neighbor_overlap"] >= options["min_overlap"])
+        )
+        inference.write_validation(ONNX_DIR, backend, result)
+
+        self.stdout.write(
+            f"  Coseno vs fp32: media {result['mean_cosine']:.5f} | p1 {result['p1_cosine']:.5f} | mín {result['min_cosine']:.5f}"
+        )
+        if result["neighbor_overlap"] is not None:
+            self.stdout.write(f"  Vecinos top-{result['k']} compartidos: {result['neighbor_overlap']:.1%}")
+        self.stdout.write(
+            f"  Velocidad: torch {result['torch_ms_per_image']:.0f} ms/img | {backend} {result['candidate_ms_per_image']:.0f} ms/img "
+            f"({ref_seconds / max(cand_seconds, 1e-9):.2f}x)"
+        )
+        if not result["passed"]:
+            raise CommandError(f"{backend} NO aprobado: el vectorizer seguirá usando torch.")
+        self.stdout.write(self.style.SUCCESS(f"  {backend} aprobado. Activar con VECTORIZER_BACKEND={backend}."))
+
+    def sample_pixels(self, processor, sample):
+        with connection.cursor() as cursor:
+            cursor.execute(SAMPLE_SQL, [sample])
+            rows = cursor.fetchall()
+        # Mismo camino que el vectorizer (descarga y preproceso), así se valida lo que ve el modelo en producción
+        config = PreprocessConfig.from_processor(processor)
+        fetcher = ImageFetcher()
+        pixels = []
+        try:
+            for _, url in rows:
+                result = fetcher.fetch(url)
+                if result.data is None:
+                    continue
+                try:
+                    pixels.append(to_pixels(decode(result.data, config), config))
+                except Exception:
+                    continue
+        finally:
+            fetcher.close()
+        return np.stack(pixels) if pixels else np.empty((0,))
+
+    @staticmethod
+    def embed_all(backend, pixels, batch_size):
+        backend.embed(pixels[:1])  # Calentamiento (inicialización perezosa, caches)
+        started = time.perf_counter()
+        vectors = [backend.embed(pixels[i:i + batch_size]) for i in range(0, len(pixels), batch_size)]
+        return np.concatenate(vectors), time.perf_counter() - started
@@ -0,0 +1,18 @@
+# Generated manually: orden seguro entre archivos cargados en paralelo por el loader
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_normalize_orderreport_not_found_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='captured_at',
+            field=models.DateTimeField(blank=True, null=True, help_text='Momento en que el scraper capturó los datos guardados. El loader no sobrescribe con capturas más viejas.'),
+        ),
+    ]
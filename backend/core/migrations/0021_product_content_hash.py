@@ -0,0 +1,18 @@
+# Generated manually: el loader solo reescribe productos cuyo contenido cambió
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_product_captured_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, null=True, help_text='Hash del contenido cargado por el loader. Si no cambia, el upsert no reescribe la fila.'),
+        ),
+    ]
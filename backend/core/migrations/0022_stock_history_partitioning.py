@@ -0,0 +1,121 @@
+# Generated manually: historial de stock solo con cambios, particionado por mes
+#
+# - product_stock_latest: último stock por (producto, bodega); el loader compara contra él.
+# - product_stock_daily: resumen diario de los meses que salen de la retención.
+# - product_stock_log pasa a ser una tabla particionada por rango (snapshot_at, mensual).
+#   La tabla anterior queda como product_stock_log_legacy sin copiar datos (la migración
+#   no reescribe cientos de millones de filas); se compacta con
+#   `manage.py stock_history --import-legacy` y se borra con `--drop-legacy`.
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MONTHS_AHEAD = 2
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_stock_log(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relname = 'product_stock_log';
+        """)
+        row = cursor.fetchone()
+        if row is None or row[0] == 'p':
+            return  # tabla inexistente o ya particionada
+
+        cursor.execute("ALTER TABLE product_stock_log RENAME TO product_stock_log_legacy;")
+
+        # Mismos tipos que la tabla existente (el esquema real puede venir de init.sql)
+        cursor.execute("""
+            CREATE TABLE product_stock_log (LIKE product_stock_log_legacy INCLUDING DEFAULTS)
+            PARTITION BY RANGE (snapshot_at);
+        """)
+        cursor.execute("ALTER TABLE product_stock_log ALTER COLUMN snapshot_at SET NOT NULL;")
+        # Secuencia propia (la de la legacy se borra con ella) que sigue después de sus ids
+        cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM product_stock_log_legacy;")
+        cursor.execute(f"CREATE SEQUENCE product_stock_log_part_id_seq START WITH {cursor.fetchone()[0]};")
+        cursor.execute("""
+            ALTER TABLE product_stock_log
+                ALTER COLUMN id SET DEFAULT nextval('product_stock_log_part_id_seq'),
+                ALTER COLUMN id SET NOT NULL;
+        """)
+        cursor.execute("ALTER SEQUENCE product_stock_log_part_id_seq OWNED BY product_stock_log.id;")
+        cursor.execute("""
+            ALTER TABLE product_stock_log
+                ADD CONSTRAINT product_stock_log_part_pkey PRIMARY KEY (id, snapshot_at),
+                ADD CONSTRAINT product_stock_log_part_product_fk FOREIGN KEY (product_id)
+                    REFERENCES products (product_id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+                ADD CONSTRAINT product_stock_log_part_warehouse_fk FOREIGN KEY (warehouse_id)
+                    REFERENCES warehouses (warehouse_id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED;
+        """)
+        # Consultas de velocidad de stock: por producto/bodega y rango de fechas (con poda de particiones)
+        cursor.execute("""
+            CREATE INDEX stock_log_part_product_snapshot_idx
+            ON product_stock_log (product_id, warehouse_id, snapshot_at DESC);
+        """)
+
+        current = date.today().replace(day=1)
+        for n in range(MONTHS_AHEAD + 1):
+            month = add_months(current, n)
+            cursor.execute(
+                f"CREATE TABLE product_stock_log_p{month:%Y%m} PARTITION OF product_stock_log "
+                f"FOR VALUES FROM (%s) TO (%s);",
+                [month.isoformat(), add_months(month, 1).isoformat()],
+            )
+        cursor.execute("CREATE TABLE product_stock_log_default PARTITION OF product_stock_log DEFAULT;")
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_product_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStockLatest',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('stock_qty', models.IntegerField()),
+                ('snapshot_at', models.DateTimeField(help_text='Captura en la que el stock tomó este valor (último cambio)')),
+                ('product', models.ForeignKey(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, to='core.product')),
+                ('warehouse', models.ForeignKey(db_column='warehouse_id', on_delete=django.db.models.deletion.CASCADE, to='core.warehouse')),
+            ],
+            options={
+                'db_table': 'product_stock_latest',
+                'constraints': [models.UniqueConstraint(fields=('product', 'warehouse'), name='uniq_stock_latest_product_warehouse')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductStockDaily',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('open_qty', models.IntegerField()),
+                ('close_qty', models.IntegerField()),
+                ('min_qty', models.IntegerField()),
+                ('max_qty', models.IntegerField()),
+                ('changes', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, to='core.product')),
+                ('warehouse', models.ForeignKey(db_column='warehouse_id', on_delete=django.db.models.deletion.CASCADE, to='core.warehouse')),
+            ],
+            options={
+                'db_table': 'product_stock_daily',
+                'constraints': [models.UniqueConstraint(fields=('product', 'warehouse', 'day'), name='uniq_stock_daily_product_warehouse_day')],
+            },
+        ),
+        migrations.RunPython(partition_stock_log, noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated manually: payload crudo de Dropi fuera del heap de products
+#
+# product_raw_blobs guarda cada raw_json distinto una sola vez (zlib, direccionado por
+# hash). products.raw_data queda como legado: el loader lo deja en NULL al reescribir
+# una fila y `manage.py raw_blobs --backfill` migra el resto.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def payload_storage_external(apps, schema_editor):
+    # El payload ya viene comprimido: que TOAST no intente comprimirlo de nuevo
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE product_raw_blobs ALTER COLUMN payload SET STORAGE EXTERNAL;")
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_stock_history_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRawBlob',
+            fields=[
+                ('digest', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('payload', models.BinaryField()),
+                ('size_bytes', models.IntegerField(help_text='Tamaño del JSON sin comprimir')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'product_raw_blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='raw_blob',
+            field=models.ForeignKey(blank=True, db_column='raw_blob_digest', help_text='Payload crudo comprimido (compartido entre productos con el mismo contenido)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.productrawblob'),
+        ),
+        migrations.RunPython(payload_storage_external, noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated manually: cola de vectorización con claims (varios vectorizers en paralelo)
+#
+# - product_embedding_queue: productos pendientes; los workers la toman con
+#   FOR UPDATE SKIP LOCKED y un lease en not_before. Índice parcial sobre las filas activas.
+# - Trigger en products: encola al insertar un producto con imagen o al cambiar url_image_s3.
+# - Se siembra una vez con los productos con imagen y sin embedding (el anti-join que el
+#   vectorizer hacía en cada ciclo).
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ENQUEUE_FUNCTION = """
+CREATE OR REPLACE FUNCTION enqueue_product_embedding() RETURNS trigger AS $$
+BEGIN
+    IF NEW.url_image_s3 IS NOT NULL AND NEW.url_image_s3 <> ''
+       AND (TG_OP = 'INSERT' OR NEW.url_image_s3 IS DISTINCT FROM OLD.url_image_s3) THEN
+        INSERT INTO product_embedding_queue (product_id, enqueued_at, not_before, attempts)
+        VALUES (NEW.product_id, NOW(), NOW(), 0)
+        ON CONFLICT (product_id) DO UPDATE
+            SET enqueued_at = EXCLUDED.enqueued_at, not_before = EXCLUDED.not_before, attempts = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def create_queue_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(ENQUEUE_FUNCTION)
+        cursor.execute("""
+            CREATE TRIGGER products_enqueue_embedding
+            AFTER INSERT OR UPDATE OF url_image_s3 ON products
+            FOR EACH ROW EXECUTE FUNCTION enqueue_product_embedding();
+        """)
+        cursor.execute("""
+            INSERT INTO product_embedding_queue (product_id, enqueued_at, not_before, attempts)
+            SELECT p.product_id, NOW(), NOW(), 0
+            FROM products p
+            LEFT JOIN product_embeddings pe ON pe.product_id = p.product_id
+            WHERE p.url_image_s3 IS NOT NULL AND p.url_image_s3 <> '' AND pe.embedding_visual IS NULL
+            ON CONFLICT (product_id) DO NOTHING;
+        """)
+
+
+def drop_queue_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS products_enqueue_embedding ON products;")
+        cursor.execute("DROP FUNCTION IF EXISTS enqueue_product_embedding();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_product_raw_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductEmbeddingQueue',
+            fields=[
+                ('product', models.OneToOneField(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.product')),
+                ('enqueued_at', models.DateTimeField(help_text='Último cambio de imagen que encoló el producto')),
+                ('not_before', models.DateTimeField(blank=True, help_text='Disponible desde (lease o reintento); NULL = descartado', null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'product_embedding_queue',
+                'indexes': [models.Index(condition=models.Q(('not_before__isnull', False)), fields=['not_before'], name='emb_queue_ready_idx')],
+            },
+        ),
+        migrations.RunPython(create_queue_trigger, drop_queue_trigger),
+    ]
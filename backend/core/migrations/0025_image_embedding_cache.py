@@ -0,0 +1,44 @@
+# Generated manually: caché de embeddings por contenido de imagen y por URL
+#
+# - image_embeddings: un vector por imagen distinta (hash de los bytes) y modelo.
+# - image_url_cache: URL → imagen; un acierto evita la descarga.
+# Se llenan solas desde el vectorizer; `manage.py embedding_cache --prune` desaloja por LRU.
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_product_embedding_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageEmbedding',
+            fields=[
+                ('image_hash', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('model', models.CharField(help_text='Modelo que generó el vector', max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=1152)),
+                ('created_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField(db_index=True, help_text='Último acierto (resolución diaria, para desalojo LRU)')),
+            ],
+            options={
+                'db_table': 'image_embeddings',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageUrlCache',
+            fields=[
+                ('url_hash', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('url', models.TextField()),
+                ('image', models.ForeignKey(db_column='image_hash', on_delete=django.db.models.deletion.CASCADE, related_name='urls', to='core.imageembedding')),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'image_url_cache',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated manually: registro de URLs de imagen que fallan al descargarse
+#
+# El vectorizer registra cada fallo con backoff exponencial (retry_after) y abandona la
+# URL (retry_after NULL) tras demasiados intentos; un acierto borra la fila.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_image_embedding_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFetchFailure',
+            fields=[
+                ('url_hash', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('url', models.TextField()),
+                ('failures', models.IntegerField(default=1)),
+                ('last_error', models.CharField(max_length=30)),
+                ('last_status', models.IntegerField(blank=True, null=True)),
+                ('first_failed_at', models.DateTimeField()),
+                ('last_failed_at', models.DateTimeField()),
+                ('retry_after', models.DateTimeField(blank=True, help_text='Próximo intento permitido; NULL = abandonada', null=True)),
+            ],
+            options={
+                'db_table': 'image_fetch_failures',
+            },
+        ),
+    ]
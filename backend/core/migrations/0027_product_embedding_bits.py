@@ -0,0 +1,54 @@
+# Generated manually: nivel compacto (cuantización binaria) de los embeddings visuales
+#
+# - product_embeddings.embedding_bits: binary_quantize(embedding_visual), bit(1152).
+#   Columna normal (agregarla no reescribe la tabla); el vectorizer la escribe junto al vector.
+# - Backfill por lotes de product_id, cada uno en su propia transacción (sin bloquear la
+#   tabla entera mientras corre).
+# - Índice HNSW con bit_hamming_ops, creado CONCURRENTLY después del backfill (construirlo
+#   de una vez es mucho más rápido que insertar fila por fila en el grafo).
+
+import pgvector.django.bit
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+BACKFILL_BATCH = 20000
+
+
+def backfill_embedding_bits(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(product_id), MAX(product_id) FROM product_embeddings;")
+        low, high = cursor.fetchone()
+        if low is None:
+            return
+        for start in range(low, high + 1, BACKFILL_BATCH):
+            cursor.execute("""
+                UPDATE product_embeddings
+                SET embedding_bits = binary_quantize(embedding_visual)::bit(1152)
+                WHERE product_id >= %s AND product_id < %s
+                  AND embedding_visual IS NOT NULL AND embedding_bits IS NULL;
+            """, (start, start + BACKFILL_BATCH))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # Backfill por lotes e índice CONCURRENTLY
+
+    dependencies = [
+        ('core', '0026_image_fetch_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productembedding',
+            name='embedding_bits',
+            field=pgvector.django.bit.BitField(blank=True, length=1152, null=True),
+        ),
+        migrations.RunPython(backfill_embedding_bits, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='productembedding',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_bits'], m=16, name='emb_bits_hnsw_idx', opclasses=['bit_hamming_ops']),
+        ),
+    ]
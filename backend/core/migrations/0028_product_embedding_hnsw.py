@@ -0,0 +1,47 @@
+# Generated manually: índices para la búsqueda visual aproximada (VectorSearchService)
+#
+# - idx_emb_visual: HNSW (coseno) sobre embedding_visual. init.sql ya lo crea en bases
+#   nuevas; en las que no lo tienen se construye CONCURRENTLY (sin bloquear escrituras).
+#   Revertir la migración no lo borra (quedarían sin índice ANN las bases creadas con init.sql).
+# - products_concept_idx: los conceptos chicos se resuelven por este índice y orden exacto
+#   en vez de recorrer el HNSW descartando filas de otros conceptos.
+
+import pgvector.django.indexes
+from django.db import migrations, models
+
+CREATE_HNSW = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_emb_visual ON product_embeddings
+USING hnsw (embedding_visual vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+"""
+CREATE_CONCEPT = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS products_concept_idx ON products (taxonomy_concept);
+"""
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY
+
+    dependencies = [
+        ('core', '0027_product_embedding_bits'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='productembedding',
+                    index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_visual'], m=16, name='idx_emb_visual', opclasses=['vector_cosine_ops']),
+                ),
+                migrations.AddIndex(
+                    model_name='product',
+                    index=models.Index(fields=['taxonomy_concept'], name='products_concept_idx'),
+                ),
+            ],
+            database_operations=[
+                # Sin reverse: en la mayoría de las bases el índice viene de init.sql, no de esta migración
+                migrations.RunSQL(CREATE_HNSW, migrations.RunSQL.noop),
+                migrations.RunSQL(CREATE_CONCEPT, "DROP INDEX CONCURRENTLY IF EXISTS products_concept_idx;"),
+            ],
+        ),
+    ]
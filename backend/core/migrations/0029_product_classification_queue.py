@@ -0,0 +1,79 @@
+# Generated manually: cola de clasificación con claims (varios classifiers en paralelo)
+#
+# - product_classification_queue: productos activos sin taxonomy_concept; los classifiers la
+#   toman con FOR UPDATE SKIP LOCKED y un lease en not_before (como product_embedding_queue).
+# - Trigger en products: encola al insertar un producto activo sin concepto, al borrarle el
+#   concepto (reclasificación) o al reactivarlo sin concepto.
+# - Se siembra una vez con los productos activos sin concepto (lo que el classifier buscaba
+#   en cada ciclo con SELECT ... WHERE taxonomy_concept IS NULL).
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ENQUEUE_FUNCTION = """
+CREATE OR REPLACE FUNCTION enqueue_product_classification() RETURNS trigger AS $$
+BEGIN
+    IF NEW.taxonomy_concept IS NULL AND NEW.is_active
+       AND (TG_OP = 'INSERT' OR OLD.taxonomy_concept IS NOT NULL OR NOT OLD.is_active) THEN
+        INSERT INTO product_classification_queue (product_id, enqueued_at, not_before, attempts)
+        VALUES (NEW.product_id, NOW(), NOW(), 0)
+        ON CONFLICT (product_id) DO UPDATE
+            SET enqueued_at = EXCLUDED.enqueued_at, not_before = EXCLUDED.not_before, attempts = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def create_queue_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(ENQUEUE_FUNCTION)
+        cursor.execute("""
+            CREATE TRIGGER products_enqueue_classification
+            AFTER INSERT OR UPDATE OF taxonomy_concept, is_active ON products
+            FOR EACH ROW EXECUTE FUNCTION enqueue_product_classification();
+        """)
+        cursor.execute("""
+            INSERT INTO product_classification_queue (product_id, enqueued_at, not_before, attempts)
+            SELECT p.product_id, COALESCE(p.created_at, NOW()), NOW(), 0
+            FROM products p
+            WHERE p.taxonomy_concept IS NULL AND p.is_active
+            ON CONFLICT (product_id) DO NOTHING;
+        """)
+
+
+def drop_queue_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS products_enqueue_classification ON products;")
+        cursor.execute("DROP FUNCTION IF EXISTS enqueue_product_classification();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_product_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductClassificationQueue',
+            fields=[
+                ('product', models.OneToOneField(db_column='product_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.product')),
+                ('enqueued_at', models.DateTimeField(help_text='Momento en que se pidió la clasificación')),
+                ('not_before', models.DateTimeField(blank=True, help_text='Disponible desde (lease o reintento); NULL = descartado', null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('claimed_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'product_classification_queue',
+                'indexes': [models.Index(condition=models.Q(('not_before__isnull', False)), fields=['not_before'], name='cls_queue_ready_idx')],
+            },
+        ),
+        migrations.RunPython(create_queue_trigger, drop_queue_trigger),
+    ]
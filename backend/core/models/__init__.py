@@ -12,9 +12,17 @@ from .warehouse import Warehouse, Supplier
 # Products
 from .product import (
     Product,
+    ProductRawBlob,
     ProductCategory,
     ProductStockLog,
+    ProductStockLatest,
+    ProductStockDaily,
     ProductEmbedding,
+    ProductEmbeddingQueue,
+    ProductClassificationQueue,
+    ImageEmbedding,
+    ImageUrlCache,
+    ImageFetchFailure,
 )
 
 # Categories
@@ -91,9 +99,17 @@ __all__ = [
     'Supplier',
     # Products
     'Product',
+    'ProductRawBlob',
     'ProductCategory',
     'ProductStockLog',
+    'ProductStockLatest',
+    'ProductStockDaily',
     'ProductEmbedding',
+    'ProductEmbeddingQueue',
+    'ProductClassificationQueue',
+    'ImageEmbedding',
+    'ImageUrlCache',
+    'ImageFetchFailure',
     # Categories
     'Category',
     'MarketplaceFeedback',
@@ -1,8 +1,42 @@
+import json
+import zlib
+from hashlib import blake2b
+
 from django.db import models
+from pgvector.django import BitField, HnswIndex
 from .base import VectorField, EMBED_DIM
 from .warehouse import Supplier, Warehouse
 from .category import Category
 
+RAW_BLOB_COMPRESSLEVEL = 6
+
+
+class ProductRawBlob(models.Model):
+    """
+    Payload crudo de Dropi (raw_json del scraper), guardado una sola vez por contenido.
+    digest = blake2b-128 del JSON canónico; payload = JSON comprimido con zlib.
+    """
+    digest = models.CharField(max_length=32, primary_key=True)
+    payload = models.BinaryField()
+    size_bytes = models.IntegerField(help_text='Tamaño del JSON sin comprimir')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'product_raw_blobs'
+
+    @staticmethod
+    def pack(data):
+        """payload → (digest, bytes comprimidos, tamaño sin comprimir)."""
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        return blake2b(raw, digest_size=16).hexdigest(), zlib.compress(raw, RAW_BLOB_COMPRESSLEVEL), len(raw)
+
+    @property
+    def data(self):
+        return json.loads(zlib.decompress(bytes(self.payload)))
+
+    def __str__(self):
+        return f"RawBlob {self.digest} ({self.size_bytes} bytes)"
+
 
 class Product(models.Model):
     # Clave compuesta: (product_id, supplier_id)
@@ -35,7 +69,18 @@ class Product(models.Model):
     # Metadata de Rastreo (V2)
     source_platform = models.CharField(max_length=50, default='dropi', null=True, blank=True)
     last_seen_at = models.DateTimeField(null=True, blank=True)
-    raw_data = models.JSONField(default=dict, null=True, blank=True)
+    captured_at = models.DateTimeField(null=True, blank=True, help_text='Momento en que el scraper capturó los datos guardados. El loader no sobrescribe con capturas más viejas.')
+    raw_data = models.JSONField(default=dict, null=True, blank=True)  # Legacy: el loader ahora usa raw_blob
+    raw_blob = models.ForeignKey(
+        ProductRawBlob,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='raw_blob_digest',
+        related_name='+',
+        help_text='Payload crudo comprimido (compartido entre productos con el mismo contenido)'
+    )
+    content_hash = models.CharField(max_length=32, null=True, blank=True, help_text='Hash del contenido cargado por el loader. Si no cambia, el upsert no reescribe la fila.')
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -50,8 +95,16 @@ class Product(models.Model):
             models.Index(fields=['-profit_margin', '-created_at']),
             models.Index(fields=['product_id']),  # Para búsquedas por producto
             models.Index(fields=['supplier']),     # Para búsquedas por proveedor
+            models.Index(fields=['taxonomy_concept'], name='products_concept_idx'),  # Búsqueda visual filtrada por concepto
         ]
 
+    @property
+    def raw_payload(self):
+        """Payload crudo de Dropi. Se lee y descomprime solo al acceder (filas viejas: raw_data inline)."""
+        if self.raw_blob_id:
+            return self.raw_blob.data
+        return self.raw_data
+
     def __str__(self):
         supplier_name = self.supplier.store_name if self.supplier else 'N/A'
         return f"{self.title[:50]} (Proveedor: {supplier_name})"
@@ -74,9 +127,45 @@ class ProductStockLog(models.Model):
     snapshot_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # Particionada por mes sobre snapshot_at (migración 0022; particiones: comando stock_history).
+        # Solo guarda cambios de cantidad: el último valor vive en product_stock_latest.
         db_table = 'product_stock_log'
 
 
+class ProductStockLatest(models.Model):
+    """Último stock conocido por (producto, bodega). El loader compara contra esta tabla."""
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_column='product_id')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, db_column='warehouse_id')
+    stock_qty = models.IntegerField()
+    snapshot_at = models.DateTimeField(help_text='Captura en la que el stock tomó este valor (último cambio)')
+
+    class Meta:
+        db_table = 'product_stock_latest'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'warehouse'], name='uniq_stock_latest_product_warehouse'),
+        ]
+
+
+class ProductStockDaily(models.Model):
+    """Resumen diario del historial de stock que ya salió de la retención de product_stock_log."""
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_column='product_id')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, db_column='warehouse_id')
+    day = models.DateField()
+    open_qty = models.IntegerField()
+    close_qty = models.IntegerField()
+    min_qty = models.IntegerField()
+    max_qty = models.IntegerField()
+    changes = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_stock_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'warehouse', 'day'], name='uniq_stock_daily_product_warehouse_day'),
+        ]
+
+
 class ProductEmbedding(models.Model):
     product = models.OneToOneField(
         Product, 
@@ -87,9 +176,119 @@ class ProductEmbedding(models.Model):
 
     # Vector Visual (Use Config Contract)
     embedding_visual = VectorField(dimensions=EMBED_DIM, null=True, blank=True)
+    # Nivel compacto: binary_quantize(embedding_visual), 1 bit por dimensión (144 bytes en vez de 4.6 KB).
+    # Lo escribe el vectorizer junto al vector; VectorSearchService preselecciona por Hamming y re-rankea con el completo
+    embedding_bits = BitField(length=EMBED_DIM, null=True, blank=True)
 
     processed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'product_embeddings'
         # managed = True
+        indexes = [
+            HnswIndex(name='idx_emb_visual', fields=['embedding_visual'], m=16, ef_construction=64,
+                      opclasses=['vector_cosine_ops']),
+            HnswIndex(name='emb_bits_hnsw_idx', fields=['embedding_bits'], m=16, ef_construction=64,
+                      opclasses=['bit_hamming_ops']),
+        ]
+
+
+class ProductEmbeddingQueue(models.Model):
+    """
+    Cola de productos pendientes de vectorizar (la llena un trigger sobre products).
+
+    Los vectorizers toman filas con FOR UPDATE SKIP LOCKED y las marcan con un lease:
+    `not_before` pasa a NOW() + lease, así una fila tomada por un worker caído vuelve a
+    estar disponible sola. Tras demasiados fallos `not_before` queda en NULL (fuera de la
+    cola) hasta que cambie la imagen del producto.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        db_column='product_id',
+        primary_key=True
+    )
+    enqueued_at = models.DateTimeField(help_text='Último cambio de imagen que encoló el producto')
+    not_before = models.DateTimeField(null=True, blank=True, help_text='Disponible desde (lease o reintento); NULL = descartado')
+    attempts = models.IntegerField(default=0)
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'product_embedding_queue'
+        indexes = [
+            models.Index(fields=['not_before'], name='emb_queue_ready_idx', condition=models.Q(not_before__isnull=False)),
+        ]
+
+
+class ProductClassificationQueue(models.Model):
+    """
+    Cola de productos activos sin taxonomy_concept (la llena un trigger sobre products).
+
+    Mismo esquema de claims que ProductEmbeddingQueue: cada classifier toma filas con
+    FOR UPDATE SKIP LOCKED y un lease en `not_before`, así cada producto pasa por el LLM
+    una sola vez aunque corran varias réplicas. Tras demasiados fallos `not_before` queda
+    en NULL hasta que se vuelva a pedir su clasificación (taxonomy_concept a NULL).
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        db_column='product_id',
+        primary_key=True
+    )
+    enqueued_at = models.DateTimeField(help_text='Momento en que se pidió la clasificación')
+    not_before = models.DateTimeField(null=True, blank=True, help_text='Disponible desde (lease o reintento); NULL = descartado')
+    attempts = models.IntegerField(default=0)
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'product_classification_queue'
+        indexes = [
+            models.Index(fields=['not_before'], name='cls_queue_ready_idx', condition=models.Q(not_before__isnull=False)),
+        ]
+
+
+class ImageEmbedding(models.Model):
+    """
+    Caché de embeddings por contenido: un vector por imagen distinta (blake2b-128 de los
+    bytes), compartido por todos los productos que usan esa foto.
+    """
+    image_hash = models.CharField(max_length=32, primary_key=True)
+    model = models.CharField(max_length=100, help_text='Modelo que generó el vector')
+    embedding = VectorField(dimensions=EMBED_DIM)
+    created_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(db_index=True, help_text='Último acierto (resolución diaria, para desalojo LRU)')
+
+    class Meta:
+        db_table = 'image_embeddings'
+
+
+class ImageUrlCache(models.Model):
+    """URL de imagen → imagen ya vectorizada (un acierto evita la descarga)."""
+    url_hash = models.CharField(max_length=32, primary_key=True)
+    url = models.TextField()
+    image = models.ForeignKey(ImageEmbedding, on_delete=models.CASCADE, db_column='image_hash', related_name='urls')
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'image_url_cache'
+
+
+class ImageFetchFailure(models.Model):
+    """
+    URL de imagen que no se pudo descargar, con su próximo reintento (backoff exponencial).
+    `retry_after` NULL = abandonada; un producto con esa URL no se vuelve a intentar hasta
+    que cambie su imagen.
+    """
+    url_hash = models.CharField(max_length=32, primary_key=True)
+    url = models.TextField()
+    failures = models.IntegerField(default=1)
+    last_error = models.CharField(max_length=30)
+    last_status = models.IntegerField(null=True, blank=True)
+    first_failed_at = models.DateTimeField()
+    last_failed_at = models.DateTimeField()
+    retry_after = models.DateTimeField(null=True, blank=True, help_text='Próximo intento permitido; NULL = abandonada')
+
+    class Meta:
+        db_table = 'image_fetch_failures'
@@ -0,0 +1,33 @@
+"""
+Scraper Bot - Componentes del scraper del catálogo de Dropi
+
+Este paquete agrupa las piezas reutilizables del comando `scraper`
+(core/management/commands/scraper.py), que sigue siendo el orquestador del daemon.
+
+Módulos:
+- cdp_capture: Captura en streaming de las respuestas del catálogo vía eventos CDP
+- crawl_cursor: Cursor persistente del crawl (offset, filtros e IDs emitidos)
+- api_harvester: Cosecha paginada del catálogo por API con la sesión del navegador
+- fingerprint_index: Huellas de contenido por producto (solo se emiten cambios)
+- segment_writer: Segmentos JSONL comprimidos con publicación atómica para el loader
+"""
+
+from .cdp_capture import CatalogCapture, extract_products, resolve_page_websocket_url
+from .crawl_cursor import CatalogCursor, IdBitmap
+from .api_harvester import CatalogHarvester, RateLimiter
+from .fingerprint_index import FingerprintIndex, content_hash, seen_record
+from .segment_writer import SegmentWriter
+
+__all__ = [
+    'CatalogCapture',
+    'extract_products',
+    'resolve_page_websocket_url',
+    'CatalogCursor',
+    'IdBitmap',
+    'CatalogHarvester',
+    'RateLimiter',
+    'FingerprintIndex',
+    'content_hash',
+    'seen_record',
+    'SegmentWriter',
+]
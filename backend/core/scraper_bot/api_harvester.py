@@ -0,0 +1,168 @@
+"""
+Cosecha directa del catálogo por API con la sesión del navegador.
+
+Después de login() y navigate_to_catalog() el scraper solo necesita el JSON de
+/api/products/v4/index. En lugar de scroll + clic + sleeps, este módulo pagina ese
+endpoint con un cliente HTTP con pool de conexiones, reutilizando el token y las
+cookies de la sesión de Chrome, con concurrencia acotada y límite de peticiones
+por segundo. La petición plantilla (URL, filtros, clave de paginación) sale del
+cursor del crawl.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cdp_capture import extract_products
+
+logger = logging.getLogger("scraper.harvester")
+
+# Headers de la petición capturada que no tiene sentido reenviar desde requests
+SKIP_HEADERS = {"content-length", "host", "connection", "accept-encoding", "cookie"}
+
+
+class RateLimiter:
+    """Token bucket thread-safe: como máximo `rate` peticiones por segundo (0 = sin límite)."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class CatalogHarvester:
+    """
+    Pagina el catálogo desde `cursor.next_offset` hasta la primera página vacía.
+
+    Las páginas se piden en paralelo (hasta `concurrency` en vuelo) pero se entregan
+    a `on_page(offset, products)` en orden de offset, para que el cursor solo avance
+    sobre páginas contiguas ya escritas.
+    """
+
+    def __init__(self, cursor, cookies=None, concurrency=4, rate=4.0, timeout=30, session=None):
+        self.cursor = cursor
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.session = session or self._build_session(self.concurrency)
+        self.session.headers.update({
+            k: v for k, v in cursor.live_headers.items()
+            if k.lower() not in SKIP_HEADERS and not k.startswith(":")
+        })
+        for c in cookies or []:
+            self.session.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+        self.stats = {"pages": 0, "products": 0, "seconds": 0.0}
+
+    @staticmethod
+    def _build_session(pool_size):
+        session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,  # El catálogo se pide por POST: reintentar cualquier método
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def fetch_page(self, offset):
+        """Productos de la página que empieza en `offset` (lanza excepción si la API falla)."""
+        req = self.cursor.request_for(offset)
+        self.limiter.acquire()
+        resp = self.session.request(req["method"], req["url"], data=req["body"], timeout=self.timeout)
+        resp.raise_for_status()
+        return extract_products(resp.json())
+
+    def run(self, on_page, max_pages=None):
+        """
+        Cosecha páginas hasta el final del catálogo (o `max_pages`).
+
+        Returns:
+            True si se llegó al final del catálogo (página vacía o incompleta).
+        """
+        step = self.cursor.page_step()
+        workers = self.concurrency if step else 1  # sin tamaño de página conocido: secuencial
+        next_submit = next_emit = self.cursor.next_offset
+        end_offset = math.inf
+        submitted = 0
+        results = {}
+        in_flight = {}
+        started = time.time()
+
+        logger.info(f"🌾 Cosecha API desde offset {next_submit} ({workers} en paralelo, {self.limiter.rate}/s)")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="catalog-harvest") as pool:
+            try:
+                while True:
+                    while (
+                        len(in_flight) < workers
+                        and next_submit < end_offset
+                        and (max_pages is None or submitted < max_pages)
+                        and (step or not in_flight)
+                    ):
+                        in_flight[pool.submit(self.fetch_page, next_submit)] = next_submit
+                        submitted += 1
+                        if step:
+                            next_submit += step
+
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        offset = in_flight.pop(fut)
+                        products = fut.result()
+                        results[offset] = products
+                        if not products:
+                            end_offset = min(end_offset, offset)
+                        elif step and step > 1 and len(products) < step:
+                            end_offset = min(end_offset, offset + step)
+                        if not step:
+                            next_submit = offset + len(products) if products else end_offset
+
+                    # Entregar en orden solo las páginas contiguas
+                    while next_emit in results and next_emit < end_offset:
+                        products = results.pop(next_emit)
+                        on_page(next_emit, products)
+                        self.stats["pages"] += 1
+                        self.stats["products"] += len(products)
+                        next_emit += step or len(products)
+            except BaseException:
+                for fut in in_flight:
+                    fut.cancel()
+                raise
+            finally:
+                self.stats["seconds"] = time.time() - started
+
+        elapsed = max(self.stats["seconds"], 1e-6)
+        logger.info(
+            f"🌾 Cosecha: {self.stats['pages']} páginas, {self.stats['products']} productos "
+            f"en {elapsed:.1f}s ({self.stats['products'] / elapsed:.1f} productos/s)"
+        )
+        return next_emit >= end_offset
@@ -0,0 +1,227 @@
+"""
+Captura en streaming de las respuestas del catálogo de Dropi vía CDP.
+
+En lugar de releer todo el buffer de `driver.get_log("performance")` en cada vuelta
+(y pedir cada body con un round trip síncrono desde el loop principal), abrimos una
+conexión propia al DevTools de la pestaña y escuchamos solo los eventos de red del
+endpoint del catálogo. Cada respuesta llega al loop del scraper como una "página"
+({"request": {...}, "products": [...]}) por una cola acotada; la petición original
+(URL, método, headers y body) es la que usa el cursor del crawl para reanudar.
+"""
+import base64
+import itertools
+import json
+import logging
+import queue
+import threading
+import urllib.request
+
+import websocket
+
+logger = logging.getLogger("scraper.cdp")
+
+CATALOG_API_PATH = "/api/products/v4/index"
+
+# Chrome descarta bodies viejos si su buffer de red se llena; reservamos espacio
+# suficiente para que un body siga disponible cuando llega loadingFinished.
+NETWORK_BUFFER = {"maxTotalBufferSize": 100_000_000, "maxResourceBufferSize": 20_000_000}
+
+
+def extract_products(payload):
+    """Devuelve la lista de productos de una respuesta de /api/products/v4/index."""
+    if not isinstance(payload, dict):
+        return []
+    return payload.get("objects") or (payload.get("data") or {}).get("objects") or []
+
+
+def resolve_page_websocket_url(driver):
+    """
+    Obtiene el webSocketDebuggerUrl de la pestaña del driver.
+
+    chromedriver expone la dirección de DevTools en la capability
+    `goog:chromeOptions.debuggerAddress`; Chrome acepta varios clientes CDP a la vez.
+    """
+    address = (driver.capabilities.get("goog:chromeOptions") or {}).get("debuggerAddress")
+    if not address:
+        raise RuntimeError("El driver no expone debuggerAddress (¿no es Chrome/Chromium?)")
+
+    with urllib.request.urlopen(f"http://{address}/json", timeout=10) as resp:
+        targets = json.loads(resp.read().decode("utf-8"))
+
+    for target in targets:
+        if target.get("type") == "page" and target.get("webSocketDebuggerUrl"):
+            return target["webSocketDebuggerUrl"]
+    raise RuntimeError(f"No se encontró una pestaña con DevTools en {address}")
+
+
+class CatalogCapture:
+    """
+    Suscriptor CDP de las respuestas del catálogo.
+
+    Un hilo lector escucha Network.requestWillBeSent / responseReceived /
+    loadingFinished, pide el body solo de las respuestas del catálogo (sin bloquear
+    el loop del scraper) y encola una página por respuesta. La cola es acotada: si
+    el escritor se atrasa, el lector espera en lugar de acumular memoria.
+    """
+
+    def __init__(self, ws_url, url_filter=CATALOG_API_PATH, max_queue=200, connect=None):
+        self.ws_url = ws_url
+        self.url_filter = url_filter
+        self.pages = queue.Queue(maxsize=max_queue)
+        self._connect = connect or self._default_connect
+        self._ws = None
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._requests = {}  # requestId -> petición del catálogo (url, method, headers, post_data)
+        self._tracked = {}   # requestId -> url de respuestas del catálogo aún cargando
+        self._pending = {}   # id de comando CDP -> (comando, requestId) en vuelo
+        self._running = False
+        self._thread = None
+        self.stats = {"responses": 0, "products": 0, "errors": 0}
+
+    @classmethod
+    def for_driver(cls, driver, **kwargs):
+        """Crea una captura conectada a la pestaña activa del driver."""
+        return cls(resolve_page_websocket_url(driver), **kwargs)
+
+    @staticmethod
+    def _default_connect(url):
+        # suppress_origin: Chrome >= 111 rechaza websockets con Origin ajeno
+        # salvo que se lance con --remote-allow-origins.
+        return websocket.create_connection(url, timeout=1, suppress_origin=True)
+
+    # ─────── Ciclo de vida ───────
+
+    def start(self):
+        self._ws = self._connect(self.ws_url)
+        self._running = True
+        self._send("Network.enable", NETWORK_BUFFER)
+        self._thread = threading.Thread(target=self._read_loop, name="cdp-catalog-capture", daemon=True)
+        self._thread.start()
+        logger.info("📡 Captura CDP iniciada (filtro: %s)", self.url_filter)
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self._ws = None
+
+    def is_alive(self):
+        return self._running and self._thread is not None and self._thread.is_alive()
+
+    # ─────── Consumo ───────
+
+    def drain_pages(self, max_pages=None):
+        """Saca de la cola las páginas disponibles sin bloquear."""
+        pages = []
+        while max_pages is None or len(pages) < max_pages:
+            try:
+                pages.append(self.pages.get_nowait())
+            except queue.Empty:
+                break
+        return pages
+
+    # ─────── Protocolo CDP ───────
+
+    def _send(self, method, params=None):
+        msg_id = next(self._ids)
+        payload = json.dumps({"id": msg_id, "method": method, "params": params or {}})
+        with self._send_lock:
+            self._ws.send(payload)
+        return msg_id
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                raw = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception as e:
+                if self._running:
+                    logger.warning(f"⚠️ Conexión CDP cerrada: {e}")
+                self._running = False
+                break
+
+            if not raw:
+                continue
+            try:
+                self._handle_message(json.loads(raw))
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.debug(f"Mensaje CDP ignorado: {e}")
+
+    def _handle_message(self, msg):
+        # Respuesta a uno de nuestros comandos (getRequestPostData / getResponseBody)
+        if "id" in msg:
+            command, request_id = self._pending.pop(msg["id"], (None, None))
+            if command is None:
+                return
+            if "error" in msg:
+                self.stats["errors"] += 1
+                logger.debug(f"{command} falló para {request_id}: {msg['error']}")
+                self._requests.pop(request_id, None)
+            elif command == "Network.getRequestPostData":
+                request = self._requests.get(request_id)
+                if request is not None:
+                    request["post_data"] = (msg.get("result") or {}).get("postData")
+            else:
+                self._handle_body(self._requests.pop(request_id, None), msg.get("result") or {})
+            return
+
+        method = msg.get("method")
+        params = msg.get("params") or {}
+        request_id = params.get("requestId")
+
+        if method == "Network.requestWillBeSent":
+            request = params.get("request") or {}
+            if self.url_filter in request.get("url", "") and request.get("method") != "OPTIONS":
+                self._requests[request_id] = {
+                    "url": request.get("url"),
+                    "method": request.get("method", "GET"),
+                    "headers": request.get("headers") or {},
+                    "post_data": request.get("postData"),
+                }
+                if request.get("hasPostData") and request.get("postData") is None:
+                    cmd_id = self._send("Network.getRequestPostData", {"requestId": request_id})
+                    self._pending[cmd_id] = ("Network.getRequestPostData", request_id)
+
+        elif method == "Network.responseReceived":
+            url = (params.get("response") or {}).get("url", "")
+            if self.url_filter in url:
+                self._tracked[request_id] = url
+
+        elif method == "Network.loadingFinished":
+            if request_id in self._tracked:
+                self._tracked.pop(request_id)
+                cmd_id = self._send("Network.getResponseBody", {"requestId": request_id})
+                self._pending[cmd_id] = ("Network.getResponseBody", request_id)
+
+        elif method == "Network.loadingFailed":
+            self._tracked.pop(request_id, None)
+            self._requests.pop(request_id, None)
+
+    def _handle_body(self, request, result):
+        body = result.get("body") or ""
+        if result.get("base64Encoded"):
+            body = base64.b64decode(body).decode("utf-8", errors="replace")
+
+        products = extract_products(json.loads(body))
+        self.stats["responses"] += 1
+        self._enqueue({"request": request, "products": products})
+
+    def _enqueue(self, page):
+        # put con timeout para poder salir si se detiene la captura con la cola llena
+        while self._running:
+            try:
+                self.pages.put(page, timeout=0.5)
+                self.stats["products"] += len(page["products"])
+                return
+            except queue.Full:
+                continue
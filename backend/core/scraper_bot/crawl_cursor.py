@@ -0,0 +1,259 @@
+"""
+Cursor persistente del crawl del catálogo.
+
+Guarda en disco dónde quedó el recorrido de /api/products/v4/index: la petición
+plantilla (URL, método y filtros activos), el offset de la próxima página y el
+conjunto de IDs ya emitidos. Tras reiniciar Chrome el scraper pide directamente la
+página siguiente en lugar de volver a hacer clic en "Mostrar más productos" desde
+el principio del catálogo.
+"""
+import json
+import logging
+import os
+import pathlib
+import time
+import zlib
+from base64 import b64decode, b64encode
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger("scraper.cursor")
+
+# Claves de paginación conocidas (la primera que aparezca en la petición gana).
+# Las de PAGE_NUMBER_KEYS cuentan páginas; el resto cuenta productos.
+OFFSET_KEYS = ("startData", "offset", "start", "skip", "page")
+PAGE_NUMBER_KEYS = ("page",)
+PAGE_SIZE_KEYS = ("pageSize", "page_size", "limit", "per_page", "size")
+
+
+class IdBitmap:
+    """
+    Conjunto compacto de IDs enteros positivos: 1 bit por ID.
+    Un catálogo de ~3M IDs ocupa ~375 KB en memoria y bastante menos comprimido.
+    """
+
+    def __init__(self, data=b""):
+        self._bits = bytearray(data)
+        self._count = int.from_bytes(self._bits, "little").bit_count() if self._bits else 0
+
+    @staticmethod
+    def _as_int(pid):
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            return None
+        return pid if pid >= 0 else None
+
+    def add(self, pid):
+        """Agrega el ID. Retorna True si era nuevo."""
+        pid = self._as_int(pid)
+        if pid is None:
+            return False
+        byte, bit = divmod(pid, 8)
+        if byte >= len(self._bits):
+            self._bits.extend(b"\x00" * (byte + 1 - len(self._bits)))
+        mask = 1 << bit
+        if self._bits[byte] & mask:
+            return False
+        self._bits[byte] |= mask
+        self._count += 1
+        return True
+
+    def __contains__(self, pid):
+        pid = self._as_int(pid)
+        if pid is None:
+            return False
+        byte, bit = divmod(pid, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._bits = bytearray()
+        self._count = 0
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self._bits), 6)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(data)) if data else cls()
+
+
+class CatalogCursor:
+    """
+    Posición del crawl del catálogo (persistida como JSON en `path`).
+
+    - url / method / params: petición plantilla observada en el navegador; `params`
+      son los filtros activos (body o query sin la clave de paginación).
+    - offset_key / page_size / next_offset: cómo y desde dónde pedir la siguiente página.
+    - emitted: IDs ya escritos a raw_data en este recorrido del catálogo.
+
+    Los headers de la sesión (token incluido) solo se guardan en memoria.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.url = None
+        self.method = "POST"
+        self.location = "body"  # "body" (JSON) o "query" (GET)
+        self.params = {}
+        self.offset_key = None
+        self.page_size = None
+        self.next_offset = 0
+        self.emitted = IdBitmap()
+        self.live_headers = {}
+        self.updated_at = None
+        self._last_save = 0.0
+
+    # ─────── Persistencia ───────
+
+    @classmethod
+    def load(cls, path):
+        cursor = cls(path)
+        if not cursor.path.exists():
+            return cursor
+        try:
+            data = json.loads(cursor.path.read_text(encoding="utf-8"))
+            cursor.url = data.get("url")
+            cursor.method = data.get("method", "POST")
+            cursor.location = data.get("location", "body")
+            cursor.params = data.get("params") or {}
+            cursor.offset_key = data.get("offset_key")
+            cursor.page_size = data.get("page_size")
+            cursor.next_offset = int(data.get("next_offset") or 0)
+            cursor.emitted = IdBitmap.from_bytes(b64decode(data.get("emitted") or ""))
+            cursor.updated_at = data.get("updated_at")
+            logger.info(
+                f"🧭 Cursor cargado: offset {cursor.next_offset} | {len(cursor.emitted)} IDs emitidos"
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Cursor ilegible ({e}). Empezando desde el principio del catálogo.")
+            cursor = cls(path)
+        return cursor
+
+    def save(self, min_interval=0):
+        """Escritura atómica (tmp + rename). Con min_interval > 0 se limita la frecuencia."""
+        now = time.time()
+        if min_interval and now - self._last_save < min_interval:
+            return False
+        self.updated_at = datetime.utcnow().isoformat()
+        data = {
+            "url": self.url,
+            "method": self.method,
+            "location": self.location,
+            "params": self.params,
+            "offset_key": self.offset_key,
+            "page_size": self.page_size,
+            "next_offset": self.next_offset,
+            "emitted": b64encode(self.emitted.to_bytes()).decode("ascii"),
+            "updated_at": self.updated_at,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._last_save = now
+        return True
+
+    def reset(self):
+        """Fin de un recorrido completo: se vuelve a empezar desde arriba (se conserva la plantilla)."""
+        self.next_offset = 0
+        self.emitted.clear()
+
+    # ─────── Estado ───────
+
+    def has_template(self):
+        return bool(self.url and self.offset_key)
+
+    def can_resume(self):
+        return self.has_template() and self.next_offset > 0
+
+    def _parse_request(self, request):
+        """Separa una petición observada en (location, params, offset_key, offset, page_size)."""
+        if request.get("post_data"):
+            location = "body"
+            params = json.loads(request["post_data"])
+            if not isinstance(params, dict):
+                return None
+        else:
+            location = "query"
+            params = dict(parse_qsl(urlsplit(request.get("url") or "").query))
+
+        offset_key = next((k for k in OFFSET_KEYS if k in params), None)
+        if offset_key is None:
+            return None
+        try:
+            offset = int(params.pop(offset_key))
+        except (TypeError, ValueError):
+            return None
+
+        page_size = next((params[k] for k in PAGE_SIZE_KEYS if k in params), None)
+        return location, params, offset_key, offset, page_size
+
+    def observe_page(self, page):
+        """
+        Actualiza el cursor con una página capturada ({"request": ..., "products": [...]}).
+        Idempotente: volver a observar la misma página no retrocede el offset.
+        """
+        request = page.get("request")
+        if not request:
+            return
+        try:
+            parsed = self._parse_request(request)
+        except Exception:
+            parsed = None
+        if parsed is None:
+            return
+
+        location, params, offset_key, offset, page_size = parsed
+        if self.params and params != self.params:
+            logger.info("🧭 Filtros del catálogo cambiaron. Reiniciando cursor desde el principio.")
+            self.reset()
+
+        self.url = request.get("url")
+        if location == "query":
+            self.url = urlunsplit(urlsplit(self.url)._replace(query=""))
+        self.method = request.get("method") or "POST"
+        self.location = location
+        self.params = params
+        self.offset_key = offset_key
+        self.page_size = page_size
+        self.live_headers = {
+            k: v for k, v in (request.get("headers") or {}).items() if k.lower() != "content-length"
+        }
+        self.advance(offset, len(page.get("products") or []))
+
+    def advance(self, offset, count):
+        """Marca como recorrida la página que empieza en `offset` y trajo `count` productos."""
+        if count <= 0:
+            return
+        step = 1 if self.offset_key in PAGE_NUMBER_KEYS else count
+        self.next_offset = max(self.next_offset, offset + step)
+
+    # ─────── Próxima petición ───────
+
+    def page_step(self):
+        """Distancia entre offsets de páginas consecutivas (None si no se conoce el tamaño de página)."""
+        if self.offset_key in PAGE_NUMBER_KEYS:
+            return 1
+        try:
+            return int(self.page_size) or None
+        except (TypeError, ValueError):
+            return None
+
+    def next_request(self):
+        """Petición (url, method, headers, body) para la página en `next_offset`."""
+        return self.request_for(self.next_offset)
+
+    def request_for(self, offset):
+        """Petición (url, method, headers, body) para la página que empieza en `offset`."""
+        params = dict(self.params)
+        params[self.offset_key] = offset
+        url, body = self.url, None
+        if self.location == "query":
+            url = f"{self.url}?{urlencode(params)}"
+        else:
+            body = json.dumps(params)
+        return {"url": url, "method": self.method, "headers": dict(self.live_headers), "body": body}
@@ -0,0 +1,131 @@
+"""
+Índice persistente de huellas de contenido del catálogo.
+
+Guarda en SQLite `product_id → hash` de los campos que extrae process_product
+(sin capture_timestamp ni raw_json). El scraper solo emite a raw_data los productos
+nuevos o que cambiaron; los que siguen iguales se reportan en una línea liviana
+"seen" para que el loader actualice last_seen_at sin volver a hacer upsert.
+"""
+import json
+import pathlib
+import sqlite3
+import time
+from hashlib import blake2b
+
+# Campos del registro que no forman parte del contenido del producto
+VOLATILE_FIELDS = ("capture_timestamp", "raw_json")
+
+# Tipo de registro de las líneas de heartbeat en los JSONL de raw_data
+SEEN_RECORD_TYPE = "seen"
+
+
+def content_hash(record):
+    """Hash estable (16 bytes) del contenido de un registro de process_product."""
+    content = {k: v for k, v in record.items() if k not in VOLATILE_FIELDS}
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+def seen_record(ids, capture_timestamp):
+    """Línea de heartbeat: productos vistos sin cambios en esta captura."""
+    return {"record_type": SEEN_RECORD_TYPE, "ids": list(ids), "capture_timestamp": capture_timestamp}
+
+
+class FingerprintIndex:
+    """
+    Índice `product_id → (hash, emitted_at)` en SQLite.
+
+    Uso en dos pasos para no perder cambios si el proceso muere a mitad de escritura:
+    `diff()` decide qué emitir y deja las huellas pendientes; `commit()` las persiste
+    solo después de que los registros quedaron escritos en el JSONL.
+
+    Con max_age > 0 un producto sin cambios se vuelve a emitir completo cuando su
+    última emisión es más vieja que max_age segundos (refresca raw_data en la DB).
+    """
+
+    def __init__(self, path, max_age=0):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " product_id INTEGER PRIMARY KEY,"
+            " digest BLOB NOT NULL,"
+            " emitted_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._pending = {}
+        self.stats = {"new": 0, "changed": 0, "unchanged": 0, "refreshed": 0}
+
+    def count(self):
+        """Productos con huella registrada."""
+        return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def _stored(self, ids):
+        stored = {}
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT product_id, digest, emitted_at FROM fingerprints "
+                f"WHERE product_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            stored.update((pid, (digest, emitted_at)) for pid, digest, emitted_at in rows)
+        return stored
+
+    def diff(self, records):
+        """
+        Separa registros de process_product en (a_emitir, ids_sin_cambios).
+        Los registros sin id entero se emiten siempre (el loader los valida).
+        """
+        now = time.time()
+        keyed = {}
+        emit = []
+        for record in records:
+            try:
+                keyed[int(record.get("id"))] = record
+            except (TypeError, ValueError):
+                emit.append(record)
+
+        stored = self._stored(keyed)
+        unchanged = []
+        for pid, record in keyed.items():
+            digest = content_hash(record)
+            previous = stored.get(pid)
+            if previous is None:
+                self.stats["new"] += 1
+            elif bytes(previous[0]) != digest:
+                self.stats["changed"] += 1
+            elif self.max_age and now - previous[1] > self.max_age:
+                self.stats["refreshed"] += 1
+            else:
+                self.stats["unchanged"] += 1
+                unchanged.append(pid)
+                continue
+            emit.append(record)
+            self._pending[pid] = (digest, now)
+        return emit, unchanged
+
+    def commit(self):
+        """Persiste las huellas de los registros ya escritos."""
+        if not self._pending:
+            return
+        self._conn.executemany(
+            "INSERT INTO fingerprints (product_id, digest, emitted_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(product_id) DO UPDATE SET digest = excluded.digest, emitted_at = excluded.emitted_at",
+            [(pid, digest, ts) for pid, (digest, ts) in self._pending.items()],
+        )
+        self._conn.commit()
+        self._pending.clear()
+
+    def discard(self):
+        """Olvida huellas pendientes (la escritura falló: se reemitirán en la próxima pasada)."""
+        self._pending.clear()
+
+    def close(self):
+        self._pending.clear()
+        self._conn.close()
@@ -0,0 +1,168 @@
+"""
+Escritor de segmentos JSONL comprimidos para raw_data.
+
+Los registros se serializan con orjson (json estándar si no está instalado) y se
+acumulan en un buffer en memoria; el buffer se vuelca a un gzip con nombre temporal
+(`.raw_products_*.jsonl.gz.part`) y, al rotar por tiempo o tamaño, el segmento se
+renombra atómicamente a `raw_products_*.jsonl.gz`. El loader solo ve archivos
+completos: nunca lee un JSONL que todavía se está escribiendo.
+"""
+import gzip
+import json
+import logging
+import os
+import pathlib
+import time
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("scraper.segments")
+
+SEGMENT_SUFFIX = ".jsonl.gz"
+PART_SUFFIX = ".part"
+
+
+def dumps_line(record):
+    """Registro → línea JSONL en bytes (UTF-8, sin escapar acentos)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass  # p.ej. enteros de más de 64 bits: se delega a json
+    return (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+class SegmentWriter:
+    """
+    Escribe registros en segmentos `<prefix>_<YYYYmmdd_HHMMSS>.jsonl.gz` bajo `directory`.
+
+    - Rota cuando el segmento abierto supera `max_seconds` o `max_bytes` (sin comprimir).
+    - `on_publish(path, records)` se llama después de cada renombrado: es el momento
+      de persistir estado que dependa de que los registros ya estén en disco.
+    - Los `.part` huérfanos (proceso muerto a mitad de segmento) se descartan al iniciar:
+      su contenido se vuelve a emitir porque el estado asociado nunca se confirmó.
+    """
+
+    def __init__(self, directory, prefix="raw_products", max_seconds=300, max_bytes=64 * 1024 * 1024,
+                 buffer_bytes=256 * 1024, compresslevel=6, on_publish=None):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.buffer_bytes = buffer_bytes
+        self.compresslevel = compresslevel
+        self.on_publish = on_publish
+
+        self._buffer = bytearray()
+        self._file = None
+        self._part = None
+        self._final = None
+        self._opened_at = None
+        self._records = 0
+        self._bytes = 0
+        self.stats = {"segments": 0, "records": 0, "bytes": 0}
+        self.discard_orphans()
+
+    # ─────── Ciclo de vida del segmento ───────
+
+    def discard_orphans(self):
+        for part in self.directory.glob(f".{self.prefix}_*{SEGMENT_SUFFIX}{PART_SUFFIX}"):
+            logger.warning(f"🗑️ Segmento incompleto descartado: {part.name}")
+            part.unlink(missing_ok=True)
+
+    def _final_path(self):
+        stamp = f"{datetime.utcnow():%Y%m%d_%H%M%S}"
+        path = self.directory / f"{self.prefix}_{stamp}{SEGMENT_SUFFIX}"
+        n = 1
+        while path.exists() or (self.directory / f".{path.name}{PART_SUFFIX}").exists():
+            path = self.directory / f"{self.prefix}_{stamp}_{n}{SEGMENT_SUFFIX}"
+            n += 1
+        return path
+
+    def _open(self):
+        self._final = self._final_path()
+        self._part = self.directory / f".{self._final.name}{PART_SUFFIX}"
+        self._file = gzip.open(self._part, "wb", compresslevel=self.compresslevel)
+        self._opened_at = time.time()
+        self._records = 0
+        self._bytes = 0
+        logger.info(f"📂 Nuevo segmento abierto: {self._final.name}")
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    @property
+    def current_name(self):
+        return self._final.name if self._final else None
+
+    @property
+    def current_records(self):
+        return self._records
+
+    # ─────── Escritura ───────
+
+    def write(self, records):
+        """Agrega registros al segmento abierto (lo abre si hace falta). Retorna cuántos escribió."""
+        count = 0
+        for record in records:
+            if self._file is None:
+                self._open()
+            line = dumps_line(record)
+            self._buffer += line
+            self._bytes += len(line)
+            self._records += 1
+            count += 1
+            if len(self._buffer) >= self.buffer_bytes:
+                self._flush_buffer()
+        self.maybe_rotate()
+        return count
+
+    def _flush_buffer(self):
+        if self._buffer and self._file is not None:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def maybe_rotate(self):
+        """Publica el segmento si venció por tiempo o tamaño. Retorna la ruta publicada (o None)."""
+        if self._file is None:
+            return None
+        elapsed = time.time() - self._opened_at
+        if self._bytes >= self.max_bytes:
+            logger.info(f"📏 Rotando segmento por tamaño ({self._bytes / 1e6:.1f} MB, {self._records} registros)...")
+        elif elapsed >= self.max_seconds:
+            logger.info(f"⏱️ Rotando segmento por tiempo ({int(elapsed)}s, {self._records} registros)...")
+        else:
+            return None
+        return self.publish()
+
+    def publish(self):
+        """Cierra el segmento abierto y lo renombra a su nombre final (visible para el loader)."""
+        if self._file is None:
+            return None
+        self._flush_buffer()
+        self._file.close()
+        with open(self._part, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(self._part, self._final)
+
+        published, records = self._final, self._records
+        self.stats["segments"] += 1
+        self.stats["records"] += records
+        self.stats["bytes"] += self._bytes
+        self._file = self._part = self._final = self._opened_at = None
+        self._records = self._bytes = 0
+        logger.info(f"✅ Segmento publicado: {published.name} ({records} registros)")
+
+        if self.on_publish:
+            self.on_publish(published, records)
+        return published
+
+    def close(self):
+        """Publica lo pendiente. Los registros ya entregados a write() nunca se pierden con un cierre ordenado."""
+        return self.publish()
@@ -7,6 +7,7 @@ Business logic layer separado de las views
 from .gold_mine_service import GoldMineService
 from .cluster_service import ClusterService
 from .dashboard_service import DashboardService
+from .vector_search_service import VectorSearchService
 from .proxy_allocator_service import (
     assign_proxy_to_user,
     get_proxy_config_for_user,
@@ -26,6 +27,7 @@ __all__ = [
     'GoldMineService',
     'ClusterService',
     'DashboardService',
+    'VectorSearchService',
     'assign_proxy_to_user',
     'get_proxy_config_for_user',
     'update_last_used',
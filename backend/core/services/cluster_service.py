@@ -96,6 +96,7 @@ class ClusterService:
         """
         from django.db import connection
         from ..models import ProductEmbedding
+        from .vector_search_service import VectorSearchService
         
         # Obtener embedding del producto
         try:
@@ -106,23 +107,9 @@ class ClusterService:
             return []
         
         # Buscar candidatos similares visualmente
-        sql = """
-            SELECT 
-                pe.product_id,
-                (pe.embedding_visual <=> %s::vector) as visual_score,
-                p.title
-            FROM product_embeddings pe
-            JOIN products p ON p.product_id = pe.product_id
-            WHERE pe.product_id != %s
-              AND pe.embedding_visual IS NOT NULL
-            ORDER BY visual_score ASC
-            LIMIT 15
-        """
-        
         candidates = []
         with connection.cursor() as cursor:
-            cursor.execute(sql, (str(embedding.embedding_visual), product_id))
-            rows = cursor.fetchall()
+            rows = VectorSearchService.nearest(cursor, embedding.embedding_visual, 15, exclude_id=product_id, ef_search=64)
         
         # Obtener detalles completos
         if rows:
@@ -132,7 +119,7 @@ class ClusterService:
             
             product_map = {p.product_id: p for p in products}
             
-            for pid, visual_score, title in rows:
+            for pid, visual_score in rows:
                 product = product_map.get(pid)
                 if product:
                     candidates.append({
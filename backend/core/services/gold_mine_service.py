@@ -99,23 +99,13 @@ class GoldMineService:
             list: Lista de productos similares con scores
         """
         from django.db import connection
-        from ..models import ProductEmbedding, Product, ProductClusterMembership
-        
-        # Query usando pgvector para búsqueda por similaridad
-        sql = """
-            SELECT 
-                pe.product_id, 
-                (pe.embedding_visual <=> %s::vector) as distance
-            FROM product_embeddings pe
-            WHERE pe.embedding_visual IS NOT NULL
-            ORDER BY distance ASC
-            LIMIT %s
-        """
+        from ..models import Product, ProductClusterMembership
+        from .vector_search_service import VectorSearchService
         
+        # Preselección por el nivel compacto y re-rank por coseno (pgvector)
         similar_products = []
         with connection.cursor() as cursor:
-            cursor.execute(sql, (embedding_vector, limit))
-            rows = cursor.fetchall()
+            rows = VectorSearchService.nearest(cursor, embedding_vector, limit)
             similar_pids = [r[0] for r in rows]
         
         if not similar_pids:
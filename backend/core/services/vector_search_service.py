@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Vector Search Service
+Búsqueda de productos por similitud visual sobre product_embeddings.
+
+Dos niveles por producto, cada uno con su índice HNSW:
+- embedding_visual: vector completo (1152 float32, 4.6 KB), idx_emb_visual (coseno).
+- embedding_bits: su cuantización binaria (1 bit por dimensión, 144 bytes),
+  emb_bits_hnsw_idx (Hamming).
+
+Modos:
+- "binary": preselecciona `limit × oversample` candidatos por Hamming (índice chico, cabe
+  en memoria) y los ordena por coseno exacto con el vector completo.
+- "hnsw": vecinos aproximados directamente sobre idx_emb_visual.
+- "exact": coseno sobre todas las filas (sin índice ANN); referencia y fallback.
+
+`ef_search` (tamaño de la lista de candidatos del HNSW) se fija por consulta: más alto =
+más recall y más latencia. Con filtros (concepto, solo agrupados) y pgvector >= 0.8 se
+activa el iterative scan: el índice sigue entregando candidatos hasta completar `limit`
+filas que pasen el filtro, en vez de filtrar después y quedarse corto. Con versiones
+anteriores solo se fija ef_search (las búsquedas filtradas pueden traer menos filas). Los
+conceptos chicos los resuelve el planner con products_concept_idx y orden exacto.
+
+Las distancias retornadas son siempre coseno exacto. Los parámetros de HNSW se fijan con
+SET LOCAL en la misma transacción implícita de la consulta: no quedan en la conexión.
+"""
+from django.conf import settings
+
+MODES = ('exact', 'hnsw', 'binary')
+MIN_SHORTLIST = 100  # Piso de candidatos preseleccionados (k chicos pierden recall por Hamming)
+MAX_EF_SEARCH = 1000  # Máximo que acepta pgvector
+
+ITERATIVE_SCAN_VERSION = (0, 8)  # hnsw.iterative_scan / hnsw.max_scan_tuples
+
+SQL_HNSW_SETTINGS = """
+    SELECT set_config('hnsw.ef_search', %(ef_search)s, true);
+"""
+# Solo con pgvector >= 0.8: en PG15+ el prefijo hnsw. es de la extensión y una versión
+# anterior rechaza los parámetros que no conoce (la búsqueda entera fallaría)
+SQL_HNSW_ITERATIVE_SETTINGS = """
+    SELECT set_config('hnsw.ef_search', %(ef_search)s, true),
+           set_config('hnsw.iterative_scan', %(iterative_scan)s, true),
+           set_config('hnsw.max_scan_tuples', %(max_scan_tuples)s, true);
+"""
+SETTINGS_PREFIXES = (SQL_HNSW_ITERATIVE_SETTINGS, SQL_HNSW_SETTINGS)
+
+_pgvector_version = None  # Se lee una vez por proceso
+# "+ 0": el ORDER BY deja de coincidir con el índice HNSW y el planner ordena todas las filas
+SQL_EXACT = """
+    SELECT pe.product_id, pe.embedding_visual <=> %(vector)s::vector AS distance
+    FROM product_embeddings pe{joins}
+    WHERE pe.embedding_visual IS NOT NULL{filters}
+    ORDER BY (pe.embedding_visual <=> %(vector)s::vector) + 0
+    LIMIT %(limit)s
+"""
+# El iterative scan "relaxed_order" puede entregar candidatos levemente desordenados: se reordena afuera
+SQL_HNSW = """
+    WITH candidates AS MATERIALIZED (
+        SELECT pe.product_id, pe.embedding_visual <=> %(vector)s::vector AS distance
+        FROM product_embeddings pe{joins}
+        WHERE pe.embedding_visual IS NOT NULL{filters}
+        ORDER BY pe.embedding_visual <=> %(vector)s::vector
+        LIMIT %(limit)s
+    )
+    SELECT product_id, distance FROM candidates ORDER BY distance
+"""
+SQL_BINARY = """
+    WITH shortlist AS MATERIALIZED (
+        SELECT pe.product_id, pe.embedding_visual
+        FROM product_embeddings pe{joins}
+        WHERE pe.embedding_bits IS NOT NULL{filters}
+        ORDER BY pe.embedding_bits <~> binary_quantize(%(vector)s::vector)::bit(1152)
+        LIMIT %(shortlist)s
+    )
+    SELECT product_id, embedding_visual <=> %(vector)s::vector AS distance
+    FROM shortlist
+    ORDER BY distance
+    LIMIT %(limit)s
+"""
+
+
+def pgvector_version(cursor):
+    """Versión instalada de la extensión vector como tupla (0, 8, 0); None si no está."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+        row = cursor.fetchone()
+        _pgvector_version = tuple(int(p) for p in row[0].split(".") if p.isdigit()) if row else ()
+    return _pgvector_version or None
+
+
+def supports_iterative_scan(cursor):
+    version = pgvector_version(cursor)
+    return version is not None and version[:2] >= ITERATIVE_SCAN_VERSION
+
+
+class VectorSearchService:
+    """
+    Vecinos visuales de un vector: [(product_id, distancia coseno)] del más parecido al menos.
+    Las vistas y los daemons traen después los datos que necesitan de esos IDs.
+    """
+
+    @staticmethod
+    def build_query(limit=10, exclude_id=None, concept=None, clustered_only=False, mode=None, oversample=None,
+                    ef_search=None, iterative_scan=False):
+        """
+        SQL y parámetros (sin el vector) de una búsqueda; ver `nearest`.
+        `iterative_scan`: la base soporta el iterative scan (ver `supports_iterative_scan`).
+        """
+        mode = mode or getattr(settings, 'VECTOR_SEARCH_MODE', 'binary')
+        if mode not in MODES:
+            raise ValueError(f"Modo de búsqueda desconocido: {mode} (opciones: {', '.join(MODES)})")
+        oversample = oversample or getattr(settings, 'VECTOR_SEARCH_OVERSAMPLE', 10)
+        ef_search = ef_search or getattr(settings, 'VECTOR_SEARCH_EF_SEARCH', 100)
+
+        joins, filters = [], []
+        shortlist = min(max(limit * oversample, MIN_SHORTLIST), MAX_EF_SEARCH)
+        params = {'limit': limit, 'shortlist': shortlist}
+        if exclude_id is not None:
+            filters.append("pe.product_id <> %(exclude_id)s")
+            params['exclude_id'] = exclude_id
+        if concept is not None:
+            joins.append("JOIN products p ON p.product_id = pe.product_id")
+            filters.append("p.taxonomy_concept = %(concept)s")
+            params['concept'] = concept
+        if clustered_only:
+            joins.append("JOIN product_cluster_membership pcm ON pcm.product_id = pe.product_id")
+
+        template = {'exact': SQL_EXACT, 'hnsw': SQL_HNSW, 'binary': SQL_BINARY}[mode]
+        sql = template.format(
+            joins=''.join(f"\n    {j}" for j in joins),
+            filters=''.join(f"\n      AND {f}" for f in filters),
+        )
+        if mode != 'exact':
+            # El HNSW entrega como mucho ef_search filas por recorrido: nunca menos que las pedidas
+            wanted = shortlist if mode == 'binary' else limit
+            params['ef_search'] = str(min(max(ef_search, wanted), MAX_EF_SEARCH))
+            if iterative_scan and (concept is not None or clustered_only):
+                params.update({
+                    'iterative_scan': 'relaxed_order',
+                    'max_scan_tuples': str(getattr(settings, 'VECTOR_SEARCH_MAX_SCAN_TUPLES', 20000)),
+                })
+                sql = SQL_HNSW_ITERATIVE_SETTINGS + sql
+            else:
+                sql = SQL_HNSW_SETTINGS + sql
+        return sql, params
+
+    @staticmethod
+    def nearest(cursor, vector, limit=10, exclude_id=None, concept=None, clustered_only=False, mode=None,
+                oversample=None, ef_search=None):
+        """
+        Args:
+            cursor: Cursor de Django o psycopg2
+            vector: Vector de consulta (lista, numpy o texto '[...]')
+            limit: Número de resultados
+            exclude_id: Producto a excluir (el propio producto consultado)
+            concept: Restringir a un taxonomy_concept
+            clustered_only: Solo productos que ya pertenecen a un cluster
+            mode: "binary" | "hnsw" | "exact" (default: settings.VECTOR_SEARCH_MODE)
+            oversample: Candidatos preseleccionados por resultado en modo "binary"
+            ef_search: Candidatos que explora el HNSW (default: settings.VECTOR_SEARCH_EF_SEARCH)
+
+        Returns:
+            list: [(product_id, distancia)] ordenada por distancia coseno
+        """
+        if hasattr(vector, 'tolist'):
+            vector = vector.tolist()
+        if isinstance(vector, (list, tuple)):
+            vector = '[' + ','.join(str(float(x)) for x in vector) + ']'
+        mode = mode or getattr(settings, 'VECTOR_SEARCH_MODE', 'binary')
+        filtered = concept is not None or clustered_only
+        sql, params = VectorSearchService.build_query(
+            limit, exclude_id, concept, clustered_only, mode, oversample, ef_search,
+            iterative_scan=filtered and mode != 'exact' and supports_iterative_scan(cursor),
+        )
+        # Settings + búsqueda en un solo execute: una transacción implícita, el SET LOCAL muere con ella
+        cursor.execute(sql, {**params, 'vector': vector})
+        return [(pid, float(distance)) for pid, distance in cursor.fetchall()]
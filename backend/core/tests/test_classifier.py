@@ -1,10 +1,49 @@
+from unittest.mock import MagicMock, patch
 
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 from django.core.management import call_command
 
+from core.management.commands import classifier
+
 class ClassifierTest(TestCase):
     def test_classifier_logic(self):
         """
         Verifica la lógica de clasificación y creación de conceptos.
         """
         pass
+
+
+class ClassifierQueueTest(SimpleTestCase):
+    """Claims de product_classification_queue (cursor simulado, sin base de datos)"""
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.connection = MagicMock()
+        self.connection.cursor.return_value.__enter__.return_value = self.cursor
+        self.cursor.fetchone.return_value = None  # Sin vector: sin contexto visual
+
+    def test_finish_claim_deletes_or_schedules_retry(self):
+        with patch.object(classifier, 'connection', self.connection):
+            classifier.Command().finish_claim(7, 'ts', done=True)
+            self.assertEqual(self.cursor.execute.call_args[0], (classifier.SQL_DONE, (7, 'ts')))
+
+            classifier.Command().finish_claim(7, 'ts', done=False)
+            sql, params = self.cursor.execute.call_args[0]
+            self.assertEqual(sql, classifier.SQL_RETRY)
+            self.assertEqual((params['product_id'], params['max_attempts']), (7, classifier.MAX_ATTEMPTS))
+
+    def test_classification_never_overwrites_an_existing_concept(self):
+        prod = MagicMock(pk=7, product_id=7, title="Silla gamer", description="")
+        unclassified = MagicMock()
+        unclassified.update.return_value = 0  # Otra réplica ya lo clasificó
+        with patch.object(classifier, 'connection', self.connection), \
+                patch.object(classifier.Product.objects, 'filter', return_value=unclassified) as filter_mock, \
+                patch.object(classifier, 'classify_term', return_value={'concept_name': 'Silla Gamer'}):
+            self.assertTrue(classifier.Command().classify_product(prod))
+        filter_mock.assert_called_with(pk=7, taxonomy_concept__isnull=True)
+        prod.save.assert_not_called()
+
+        # Falla del LLM: queda para reintento
+        with patch.object(classifier, 'connection', self.connection), \
+                patch.object(classifier, 'classify_term', return_value=None):
+            self.assertFalse(classifier.Command().classify_product(prod))
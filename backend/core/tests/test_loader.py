@@ -1,6 +1,19 @@
+import gzip
+import json
+import tempfile
+import time
+from pathlib import Path
 
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 from django.core.management import call_command
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, LargeBinary, MetaData, Table, Text
+
+from core.loader_bot.file_watcher import RawDirWatcher
+from core.management.commands import loader
+from core.management.commands.loader import Command as LoaderCommand
 
 class LoaderTest(TestCase):
     def test_loader_handle(self):
@@ -8,3 +21,494 @@ class LoaderTest(TestCase):
         Verifica la carga de datos desde archivos JSONL simulados.
         """
         pass
+
+
+class LoaderFilesTest(SimpleTestCase):
+    """Tests para el descubrimiento y lectura de segmentos de raw_data"""
+
+    def test_only_published_scraper_segments_in_order(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            for name in (
+                "raw_products_20260102_000000.jsonl.gz",
+                "raw_products_20260101_120000_1.jsonl.gz",
+                "raw_products_20260101_120000.jsonl",  # legacy sin comprimir
+                ".raw_products_20260103_000000.jsonl.gz.part",  # en escritura
+                "shopify_candidates_20260101.jsonl",  # otro comando
+            ):
+                (raw / name).touch()
+
+            command = LoaderCommand()
+            command.raw_dir = raw
+            files = command.get_files_chronologically()
+
+        self.assertEqual([f.name for f in files], [
+            "raw_products_20260101_120000.jsonl",
+            "raw_products_20260101_120000_1.jsonl.gz",
+            "raw_products_20260102_000000.jsonl.gz",
+        ])
+
+    def test_reads_gzip_segments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "raw_products_20260101_000000.jsonl.gz"
+            with gzip.open(path, "wt", encoding="utf-8") as f:
+                f.write('{"id": 1, "name": "Café"}\n')
+            with LoaderCommand.open_batch_file(path) as f:
+                self.assertEqual(f.read(), '{"id": 1, "name": "Café"}\n')
+            self.assertEqual(LoaderCommand.batch_basename(path), "raw_products_20260101_000000")
+
+    def test_benchmark_backlog_passes_validation(self):
+        from collections import Counter
+        from core.management.commands.loader_benchmark import Command as BenchmarkCommand
+
+        with tempfile.TemporaryDirectory() as tmp:
+            expected = BenchmarkCommand().generate_backlog(Path(tmp), files=1, records=3)
+            path = next(Path(tmp).glob("*.jsonl.gz"))
+            with LoaderCommand.open_batch_file(path) as f:
+                lines = f.read().splitlines()
+
+        chunk, stats = [], Counter()
+        for num, line in enumerate(lines, 1):
+            LoaderCommand().validate_line(line, num, chunk, [], stats)
+        self.assertEqual(stats["valid_products"], 3)
+        self.assertEqual(stats["no_image"], 0)
+        self.assertEqual(sorted(r["id"] for r in chunk), sorted(expected))
+
+    def test_heartbeat_skips_malformed_ids(self):
+        from collections import Counter
+
+        chunk, seen, stats = [], [], Counter()
+        line = json.dumps({"record_type": "seen", "ids": [50, "abc", None, "51"]})
+        LoaderCommand().validate_line(line, 1, chunk, seen, stats)
+        self.assertEqual(seen, [50, 51])
+        self.assertEqual((stats["seen_unchanged"], stats["no_product_id"]), (2, 2))
+
+
+class FakeCopyCursor:
+    """Cursor psycopg2 simulado: registra SQL y el contenido de cada COPY."""
+
+    def __init__(self):
+        self.statements = []
+        self.copies = {}
+        self.rowcount = 0
+
+    def execute(self, sql):
+        self.statements.append(sql)
+        self.rowcount = 2 if sql.startswith("INSERT INTO products") else 0
+
+    def copy_expert(self, sql, buf):
+        table = sql.split()[1]
+        self.copies[table] = buf.read().splitlines()
+
+
+class LoaderCopyIngestTest(SimpleTestCase):
+    """Tests para la ingesta COPY + staging (sin base de datos real)"""
+
+    def _tables(self):
+        meta = MetaData()
+        columns = lambda *names: [Column(n, Text) for n in names]
+        return (
+            Table("products", meta, Column("product_id", BigInteger), *columns(
+                "supplier_id", "sku", "title", "description", "sale_price", "suggested_price",
+                "product_type", "url_image_s3", "is_active", "last_seen_at", "created_at",
+                "updated_at", "raw_data")),
+            Table("suppliers", meta, Column("supplier_id", BigInteger), *columns(
+                "name", "store_name", "plan_name", "is_verified", "created_at", "updated_at")),
+            Table("warehouses", meta, Column("warehouse_id", BigInteger), Column("first_seen_at", DateTime),
+                  Column("last_seen_at", DateTime)),
+            Table("product_stock_log", meta, Column("id", Integer), Column("product_id", BigInteger),
+                  Column("warehouse_id", BigInteger), Column("stock_qty", Integer), Column("snapshot_at", DateTime)),
+            Table("product_stock_latest", meta, Column("id", Integer), Column("product_id", BigInteger),
+                  Column("warehouse_id", BigInteger), Column("stock_qty", Integer), Column("snapshot_at", DateTime)),
+            Table("product_raw_blobs", meta, Column("digest", Text), Column("payload", LargeBinary),
+                  Column("size_bytes", Integer), Column("created_at", DateTime)),
+        )
+
+    def _record(self, pid, supplier_id, description="Línea 1\nLínea\t2"):
+        return {"id": pid, "name": f"Producto {pid}", "description": description, "sale_price": 1000,
+                "supplier": {"id": supplier_id, "name": "Prov", "is_verified": True},
+                "warehouse_id": 7, "stock": 3, "image_url": "https://img/x.jpg",
+                "raw_json": {"id": pid, "note": "a\\b"}}
+
+    def test_copy_staging_then_set_based_upserts(self):
+        cursor = FakeCopyCursor()
+        session = MagicMock()
+        session.connection.return_value.connection.cursor.return_value = cursor
+        tables = self._tables()
+        batch = [self._record(1, 10), self._record(2, 11, description=None)]
+
+        with patch.object(loader, "COPY_CHUNK_SIZE", 1):
+            processed = LoaderCommand().ingest_batch_copy(batch, session, *tables)
+
+        self.assertEqual(processed, 4)  # 2 chunks x rowcount simulado
+        session.commit.assert_called_once()
+        inserts = [sql.split(" (")[0] for sql in cursor.statements if sql.startswith(("INSERT", "WITH"))]
+        self.assertEqual(inserts, [
+            "INSERT INTO warehouses", "INSERT INTO suppliers", "INSERT INTO product_raw_blobs", "INSERT INTO products",
+            "WITH incoming AS",
+        ] * 2)
+        products_sql = next(sql for sql in cursor.statements if sql.startswith("INSERT INTO products"))
+        self.assertIn("SELECT DISTINCT ON (product_id)", products_sql)
+        self.assertIn("ON CONFLICT (product_id) DO UPDATE SET sale_price = EXCLUDED.sale_price", products_sql)
+        self.assertTrue(products_sql.endswith(
+            "WHERE (products.captured_at IS NULL OR products.captured_at <= EXCLUDED.captured_at) "
+            "AND products.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+        ))
+        # Sin cambios de contenido: UPDATE angosto de last_seen_at/captured_at
+        touch_sql = next(sql for sql in cursor.statements if sql.startswith("UPDATE products"))
+        self.assertIn("SET last_seen_at = s.last_seen_at, captured_at = s.captured_at", touch_sql)
+        self.assertTrue(touch_sql.endswith("(t.content_hash = s.content_hash AND t.captured_at < s.captured_at)"))
+        # Dimensiones compartidas: insertar nuevas sin bloquear y actualizar solo las que cambiaron
+        suppliers_sql = [sql for sql in cursor.statements if "suppliers" in sql and not sql.startswith(("CREATE", "TRUNCATE"))]
+        self.assertTrue(suppliers_sql[0].endswith("ON CONFLICT (supplier_id) DO NOTHING"))
+        self.assertTrue(suppliers_sql[1].startswith("UPDATE suppliers AS t SET name = s.name"))
+        self.assertIn("IS DISTINCT FROM", suppliers_sql[1])
+
+        # Historial de stock: solo cambios respecto del último valor conocido
+        stock_sql = next(sql for sql in cursor.statements if sql.startswith("WITH incoming"))
+        self.assertIn("INSERT INTO product_stock_latest", stock_sql)
+        self.assertIn("WHERE product_stock_latest.stock_qty IS DISTINCT FROM EXCLUDED.stock_qty", stock_sql)
+        self.assertTrue(stock_sql.endswith("INSERT INTO product_stock_log (product_id, warehouse_id, stock_qty, snapshot_at) "
+                                           "SELECT product_id, warehouse_id, stock_qty, snapshot_at FROM changed"))
+
+        # Último chunk: descripción NULL y escapes del formato text de COPY
+        fields = cursor.copies["stage_products"][0].split("\t")
+        self.assertEqual(fields[0], "2")
+        self.assertEqual(fields[4], "\\N")
+        self.assertIn('"note": "a\\\\\\\\b"', loader.copy_value({"note": "a\\b"}))
+        self.assertTrue(cursor.copies["stage_product_raw_blobs"][0].split("\t")[1].startswith("\\\\x789c"))
+
+    def test_content_hash_ignores_load_timestamps(self):
+        command = LoaderCommand()
+        _, _, first, _, _ = command.build_rows([dict(self._record(1, 10), capture_timestamp="2026-01-01T00:00:00")])
+        _, _, again, _, _ = command.build_rows([dict(self._record(1, 10), capture_timestamp="2026-01-02T00:00:00")])
+        _, _, changed, _, _ = command.build_rows([dict(self._record(1, 10), sale_price=1200)])
+
+        self.assertEqual(len(first[0]["content_hash"]), 32)
+        self.assertEqual(first[0]["content_hash"], again[0]["content_hash"])
+        self.assertNotEqual(first[0]["content_hash"], changed[0]["content_hash"])
+
+    def test_raw_payloads_stored_once_per_content(self):
+        from core.models import ProductRawBlob
+
+        shared = {"sku": "X", "stock": 3}
+        batch = [dict(self._record(1, 10), raw_json=shared), dict(self._record(2, 10), raw_json=shared),
+                 dict(self._record(3, 10), raw_json={"id": 3})]
+        _, _, products, _, blobs = LoaderCommand().build_rows(batch)
+
+        self.assertEqual(len(blobs), 2)  # 1 y 2 comparten payload
+        self.assertEqual(products[0]["raw_blob_digest"], products[1]["raw_blob_digest"])
+        self.assertIsNone(products[0]["raw_data"])
+        blob = next(b for b in blobs if b["digest"] == products[2]["raw_blob_digest"])
+        self.assertEqual(ProductRawBlob(digest=blob["digest"], payload=blob["payload"]).data, {"id": 3})
+        self.assertTrue(loader.copy_value(b"\x01\xff").startswith("\\\\x01ff"))
+
+    def test_known_raw_blobs_are_not_resent(self):
+        session = MagicMock()
+        session.execute.return_value.scalars.return_value.all.return_value = ["b" * 32]
+        blobs = [{"digest": "a" * 32}, {"digest": "b" * 32}]
+
+        pending = LoaderCommand().new_raw_blobs(blobs, session, self._tables()[5])
+
+        self.assertEqual([b["digest"] for b in pending], ["a" * 32])
+        self.assertIn("FOR KEY SHARE", str(session.execute.call_args[0][0].compile(dialect=postgresql.dialect())))
+
+    def test_db_error_rolls_back(self):
+        session = MagicMock()
+        session.connection.side_effect = RuntimeError("conexión perdida")
+        processed = LoaderCommand().ingest_batch_copy([self._record(1, 10)], session, *self._tables())
+        self.assertIsNone(processed)
+        session.rollback.assert_called_once()
+
+
+class SimulatedCrash(BaseException):
+    """Simula la muerte del proceso (no la captura el manejo de errores del loader)."""
+
+
+class LoaderStreamingTest(SimpleTestCase):
+    """Tests para el procesamiento en streaming por chunks con checkpoint"""
+
+    def _write_file(self, raw):
+        path = raw / "raw_products_20260101_000000.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for pid in range(1, 8):
+                f.write(json.dumps({"id": pid, "supplier": {"id": 1}, "image_url": "https://img/x.jpg"}) + "\n")
+            f.write("{roto\n")
+            f.write(json.dumps({"record_type": "seen", "ids": [50, 51]}) + "\n")
+        return path
+
+    def test_resumes_from_checkpoint_after_crash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self._write_file(Path(tmp))
+            command = LoaderCommand()
+            command.reflect_tables = lambda session: ("products", "suppliers", "warehouses", "stock")
+            command.touch_last_seen = MagicMock(return_value=True)
+            command.archive_file = MagicMock()
+            ingested = []
+
+            def crash_on_second_chunk(records, session, *tables):
+                if len(ingested) == 1:
+                    raise SimulatedCrash()
+                ingested.append([r["id"] for r in records])
+                return len(records)
+
+            with patch.object(loader, "CHUNK_SIZE", 3), patch.object(loader, "INGEST_MODE", "copy"):
+                command.ingest_batch_copy = crash_on_second_chunk
+                with self.assertRaises(SimulatedCrash):
+                    command.process_file_complete(path, MagicMock())
+                self.assertEqual(command.read_checkpoint(path), 3)
+
+                ingested.append("restart")
+                command.ingest_batch_copy = lambda records, session, *tables: (
+                    ingested.append([r["id"] for r in records]) or len(records)
+                )
+                command.process_file_complete(path, MagicMock())
+
+        self.assertEqual(ingested, [[1, 2, 3], "restart", [4, 5, 6], [7]])
+        command.touch_last_seen.assert_called_once()
+        self.assertEqual(command.touch_last_seen.call_args.args[0], [50, 51])
+        _, kwargs = command.archive_file.call_args
+        self.assertTrue(kwargs["success"])
+        self.assertEqual(kwargs["stats"]["json_errors"], 1)
+        self.assertEqual(kwargs["stats"]["processed"], 4)
+
+
+class RawDirWatcherTest(SimpleTestCase):
+    """Tests para la detección de segmentos publicados (modo polling, sin watchdog)"""
+
+    def test_wakes_only_on_published_segments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            (raw / "raw_products_20260101_000000.jsonl.gz").touch()  # ya existía al iniciar
+            watcher = RawDirWatcher(raw, poll_interval=0.02, use_watchdog=False).start()
+            self.addCleanup(watcher.stop)
+
+            part = raw / ".raw_products_20260101_000100.jsonl.gz.part"
+            part.touch()
+            (raw / "shopify_candidates_20260101.jsonl").touch()
+            self.assertFalse(watcher.wait(0.2))
+
+            part.rename(raw / "raw_products_20260101_000100.jsonl.gz")
+            self.assertTrue(watcher.wait(2))
+            self.assertFalse(watcher.wait(0.1))  # el evento se consumió
+
+            (raw / "raw_products_20260101_000000_20260101_000100.jsonl.zst").touch()  # devuelto por loader_replay
+            self.assertTrue(watcher.wait(2))
+
+
+class LoaderLeaseTest(SimpleTestCase):
+    """Tests para el lease de archivos entre workers (rename a inflight/)"""
+
+    def _command(self, raw):
+        command = LoaderCommand()
+        command.raw_dir = raw
+        return command
+
+    def test_only_one_worker_gets_the_lease(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            path = raw / "raw_products_20260101_000000.jsonl.gz"
+            path.touch()
+            (raw / "raw_products_20260101_000000.offset").write_text('{"line": 10}')
+
+            a, b = self._command(raw), self._command(raw)
+            lease = a.claim_file(path)
+            self.assertIsNotNone(lease)
+            self.assertIsNone(b.claim_file(path))
+            self.assertEqual(lease.parent.name, "inflight")
+            self.assertEqual(a.read_checkpoint(lease), 10)  # el checkpoint viaja con el lease
+            self.assertEqual(b.get_files_chronologically(), [])
+
+    def test_stale_leases_return_to_queue(self):
+        import os
+
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            command = self._command(raw)
+            for name in ("raw_products_20260101_000000.jsonl.gz", "raw_products_20260101_000100.jsonl.gz"):
+                (raw / name).touch()
+                command.claim_file(raw / name)
+            stale = command.inflight_dir / "raw_products_20260101_000000.jsonl.gz"
+            os.utime(stale, (time.time() - 3600, time.time() - 3600))
+
+            command.recover_stale_leases()
+
+            self.assertEqual([f.name for f in command.get_files_chronologically()], [stale.name])
+            self.assertEqual([f.name for f in command.inflight_dir.iterdir()], ["raw_products_20260101_000100.jsonl.gz"])
+
+    def test_unarchived_file_is_released(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            (raw / "raw_products_20260101_000000.jsonl.gz").touch()
+            command = self._command(raw)
+            command.worker_session = MagicMock()
+            command.process_file_complete = MagicMock(return_value=None)  # p.ej. DB caída al reflejar
+
+            self.assertTrue(command.process_leased_file(raw / "raw_products_20260101_000000.jsonl.gz"))
+            self.assertEqual(len(command.get_files_chronologically()), 1)
+
+
+class LoaderSchemaCacheTest(SimpleTestCase):
+    """Esquema reflejado una vez por proceso; se refresca solo si cambian las migraciones."""
+
+    def setUp(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        self.engine = create_engine("sqlite://")
+        meta = MetaData()
+        for name in loader.LOADER_TABLES + ("users",):
+            Table(name, meta, Column("id", Integer, primary_key=True))
+        Table("django_migrations", meta, Column("id", Integer, primary_key=True), Column("name", Text))
+        meta.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        patcher = patch.object(LoaderCommand, "_schema", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reflects_once_until_a_migration_is_applied(self):
+        command = LoaderCommand()
+        with patch.object(LoaderCommand, "load_schema", wraps=command.load_schema) as load_schema:
+            first = command.reflect_tables(self.session)
+            self.assertIs(command.reflect_tables(self.session), first)
+            self.assertIs(LoaderCommand().reflect_tables(self.session), first)  # compartido entre instancias
+            self.assertEqual(load_schema.call_count, 1)
+
+            with self.engine.begin() as conn:
+                conn.execute(loader.text("INSERT INTO django_migrations (name) VALUES ('0021_nueva')"))
+            self.assertIsNot(command.reflect_tables(self.session), first)
+            self.assertEqual(load_schema.call_count, 2)
+
+        self.assertEqual([t.name for t in first], list(loader.LOADER_TABLES))
+        self.assertEqual(len(first[0].metadata.tables), len(loader.LOADER_TABLES))  # no refleja el resto de la DB
+
+
+class StockHistoryPartitionsTest(SimpleTestCase):
+    """Particiones mensuales de product_stock_log y política de retención"""
+
+    class FakeCursor:
+        def __init__(self, partitions):
+            self.partitions = partitions
+            self.statements = []
+            self.rowcount = 0
+
+        def execute(self, sql, params=None):
+            self.statements.append(sql)
+            self._result = [(name,) for name in self.partitions] if "pg_inherits" in sql else [(False,)]
+
+        def fetchall(self):
+            return self._result
+
+        def fetchone(self):
+            return self._result[0]
+
+    def test_month_arithmetic(self):
+        from datetime import date
+        from core.loader_bot import stock_history
+
+        self.assertEqual(stock_history.add_months(date(2026, 11, 1), 2), date(2027, 1, 1))
+        self.assertEqual(stock_history.add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(stock_history.partition_name(date(2026, 3, 1)), "product_stock_log_p202603")
+        self.assertEqual(stock_history.retention_cutoff(12, today=date(2026, 10, 17)), date(2025, 10, 1))
+
+    def test_expired_partitions_are_rolled_up_then_dropped(self):
+        from datetime import date
+        from core.loader_bot import stock_history
+
+        cursor = self.FakeCursor(["product_stock_log_p202509", "product_stock_log_p202510", "product_stock_log_default"])
+        expired = stock_history.expire_partitions(cursor, 12, today=date(2026, 10, 17))
+
+        self.assertEqual(expired, ["product_stock_log_p202509"])
+        rollup = next(i for i, sql in enumerate(cursor.statements) if "INSERT INTO product_stock_daily" in sql)
+        self.assertIn("FROM product_stock_log_p202509", cursor.statements[rollup])
+        self.assertEqual(cursor.statements[rollup + 1], "ALTER TABLE product_stock_log DETACH PARTITION product_stock_log_p202509")
+        self.assertEqual(cursor.statements[rollup + 2], "DROP TABLE product_stock_log_p202509")
+
+
+class SegmentArchiverTest(SimpleTestCase):
+    """Archivado en segundo plano de processed/ e índice para loader_replay"""
+
+    def _segment(self, raw, name="raw_products_20260101_000000.jsonl.gz"):
+        path = raw / name
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"id": 30, "capture_timestamp": "2026-01-01T00:00:05"}) + "\n")
+            f.write(json.dumps({"id": 7, "capture_timestamp": "2026-01-01T00:00:01"}) + "\n")
+            f.write(json.dumps({"record_type": "seen", "ids": [99, 3], "capture_timestamp": "2026-01-01T00:00:09"}) + "\n")
+            f.write("{no json\n")
+        return path
+
+    def test_archive_file_stages_then_compresses_in_background(self):
+        from core.loader_bot.archiver import PENDING_DIRNAME, read_index
+
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            command = LoaderCommand()
+            command.raw_dir = raw
+            command.archiver = command.build_archiver(workers=1)
+            lease = command.claim_file(self._segment(raw))
+            with patch.object(command.archiver, "submit") as submit:
+                command.archive_file(lease, success=True)
+            staged = submit.call_args[0][0]
+            self.assertFalse(lease.exists())  # el lease se libera sin esperar la compresión
+            self.assertEqual(staged.parent.name, PENDING_DIRNAME)
+
+            command.archiver.submit(staged).result()
+            command.archiver.shutdown()
+            [entry] = read_index(raw / "processed")
+
+            archive = raw / "processed" / entry["archive"]
+            self.assertFalse(staged.exists())
+            self.assertTrue(entry["archive"].startswith("raw_products_20260101_000000_"))
+            with LoaderCommand.open_batch_file(archive) as f:
+                self.assertEqual(len(f.readlines()), 4)
+        self.assertEqual((entry["records"], entry["seen_ids"]), (2, 2))
+        self.assertEqual((entry["min_product_id"], entry["max_product_id"]), (3, 99))
+        self.assertEqual((entry["captured_from"], entry["captured_to"]), ("2026-01-01T00:00:01", "2026-01-01T00:00:09"))
+
+    def test_recover_resumes_interrupted_archives(self):
+        from core.loader_bot.archiver import SegmentArchiver, read_index
+
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            archiver = SegmentArchiver(raw / "processed", fmt="gzip", workers=0)
+            staged = archiver.stage(self._segment(raw), "raw_products_20260101_000000_20260101_000100")
+
+            self.assertEqual(archiver.recover(stale_after=60), 0)  # recién movido: puede estar en curso
+            self.assertEqual(archiver.recover(), 1)
+            self.assertFalse(staged.exists())
+            self.assertEqual([e["archive"] for e in read_index(raw / "processed")],
+                             ["raw_products_20260101_000000_20260101_000100.jsonl.gz"])
+
+    def test_periodic_recover_skips_archives_in_flight(self):
+        from core.loader_bot.archiver import SegmentArchiver
+
+        with tempfile.TemporaryDirectory() as tmp:
+            raw = Path(tmp)
+            archiver = SegmentArchiver(raw / "processed", fmt="gzip", workers=0)
+            staged = archiver.stage(self._segment(raw), "raw_products_20260101_000000_20260101_000100")
+            archive, recovered = archiver.archive, []
+
+            def archive_while_recovering(path):
+                recovered.append(archiver.recover())  # Ciclo del daemon a mitad del archivado
+                return archive(path)
+
+            with patch.object(archiver, "archive", side_effect=archive_while_recovering):
+                self.assertIsNotNone(archiver.submit(staged))
+            self.assertEqual(recovered, [0])
+            self.assertFalse(staged.exists())
+
+    def test_replay_selects_archives_by_capture_and_product_range(self):
+        from core.management.commands.loader_replay import Command as ReplayCommand
+
+        entries = [
+            {"archive": "b", "captured_from": "2026-01-02T00:00:00", "captured_to": "2026-01-02T01:00:00",
+             "min_product_id": 10, "max_product_id": 20},
+            {"archive": "a", "captured_from": "2026-01-01T00:00:00", "captured_to": "2026-01-01T23:59:00",
+             "min_product_id": 1, "max_product_id": 5},
+        ]
+        select = ReplayCommand().select
+        options = {"since": None, "until": None, "product_ids": None, "archives": None}
+
+        self.assertEqual([e["archive"] for e in select(entries, {**options, "until": "2026-01-01"})], ["a"])
+        self.assertEqual([e["archive"] for e in select(entries, {**options, "since": "2026-01-01"})], ["a", "b"])
+        self.assertEqual([e["archive"] for e in select(entries, {**options, "product_ids": [15]})], ["b"])
@@ -3,9 +3,12 @@
 Service Tests
 Tests básicos para la capa de servicios
 """
-from django.test import TestCase
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, SimpleTestCase
 from core.models import Product, UniqueProductCluster
-from core.services import GoldMineService, DashboardService
+from core.services import GoldMineService, DashboardService, VectorSearchService
 
 
 class GoldMineServiceTest(TestCase):
@@ -45,3 +48,73 @@ class DashboardServiceTest(TestCase):
         self.assertIn('total_unique_products', stats)
         self.assertIn('competition_distribution', stats)
         self.assertIsInstance(stats['total_unique_products'], int)
+
+
+class VectorSearchServiceTest(SimpleTestCase):
+    """Tests para VectorSearchService (SQL generado, sin base de datos)"""
+
+    def test_binary_mode_shortlists_on_bits_and_reranks(self):
+        sql, params = VectorSearchService.build_query(limit=5, exclude_id=7, concept='Lámpara', clustered_only=True, mode='binary')
+        self.assertIn("pe.embedding_bits <~> binary_quantize", sql)
+        self.assertIn("embedding_visual <=> %(vector)s::vector AS distance", sql)
+        self.assertIn("p.taxonomy_concept = %(concept)s", sql)
+        self.assertIn("JOIN product_cluster_membership", sql)
+        self.assertEqual(params['shortlist'], 100)  # Piso MIN_SHORTLIST
+        self.assertEqual(params['exclude_id'], 7)
+
+    def test_exact_mode_and_vector_formatting(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [(1, 0.25)]
+        rows = VectorSearchService.nearest(cursor, [0.5, 1], limit=3, mode='exact')
+        self.assertEqual(rows, [(1, 0.25)])
+        sql, params = cursor.execute.call_args[0]
+        self.assertNotIn("embedding_bits", sql)
+        self.assertEqual(params['vector'], '[0.5,1.0]')
+        with self.assertRaises(ValueError):
+            VectorSearchService.build_query(mode='hnsw-magic')
+
+    def test_hnsw_settings_are_local_and_sized_per_query(self):
+        sql, params = VectorSearchService.build_query(limit=5, mode='hnsw', ef_search=40, iterative_scan=True)
+        self.assertIn("set_config('hnsw.ef_search', %(ef_search)s, true)", sql)
+        self.assertNotIn("hnsw.iterative_scan", sql)  # Sin filtros no hace falta
+        self.assertEqual(params['ef_search'], '40')
+
+        # Filtrado: iterative scan; binary: ef_search nunca menor que la preselección
+        sql, params = VectorSearchService.build_query(limit=50, concept='Silla Gamer', mode='binary', ef_search=40,
+                                                      iterative_scan=True)
+        self.assertEqual((params['ef_search'], params['iterative_scan']), ('500', 'relaxed_order'))
+        self.assertIn("hnsw.max_scan_tuples", sql)
+
+        sql, params = VectorSearchService.build_query(limit=5, mode='exact')
+        self.assertNotIn("set_config", sql)
+        self.assertIn("+ 0", sql)  # Sin índice ANN
+
+    def test_iterative_scan_only_with_pgvector_0_8(self):
+        from core.services import vector_search_service
+
+        for version, expected in (('0.7.4', False), ('0.8.0', True)):
+            cursor = MagicMock()
+            cursor.fetchone.return_value = (version,)
+            cursor.fetchall.return_value = []
+            with patch.object(vector_search_service, '_pgvector_version', None):
+                VectorSearchService.nearest(cursor, [0.5], limit=5, concept='Lámpara', mode='hnsw')
+                VectorSearchService.nearest(cursor, [0.5], limit=5, concept='Lámpara', mode='hnsw')
+            version_queries = [c for c in cursor.execute.call_args_list if 'pg_extension' in c[0][0]]
+            self.assertEqual(len(version_queries), 1)  # Se lee una sola vez
+            sql = cursor.execute.call_args[0][0]
+            self.assertEqual("hnsw.iterative_scan" in sql, expected, version)
+            self.assertIn("hnsw.ef_search", sql)
+
+    def test_eval_harness_helpers(self):
+        from core.management.commands.vector_search_eval import plan_buffers, recall_at_k, synthetic_embeddings
+
+        self.assertEqual(recall_at_k([1, 2, 3, 4], [2, 4, 9, 10]), 0.5)
+        self.assertEqual(recall_at_k([], [1]), 1.0)
+        plan = [{"Plan": {"Shared Hit Blocks": 12, "Shared Read Blocks": 3}}]
+        self.assertEqual(plan_buffers(plan), {"shared_hit": 12, "shared_read": 3})
+
+        chunks = list(synthetic_embeddings(25, groups=3, chunk=10, dim=8))
+        self.assertEqual([len(ids) for ids, _, _ in chunks], [10, 10, 5])
+        ids, group, vectors = chunks[-1]
+        self.assertEqual(ids.tolist(), [21, 22, 23, 24, 25])
+        self.assertTrue(np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5))
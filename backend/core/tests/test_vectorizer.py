@@ -1,10 +1,268 @@
+import os
+import struct
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+from io import BytesIO
+from unittest.mock import MagicMock, patch
 
-from django.test import TestCase
+import numpy as np
+from PIL import Image
+
+from django.test import TestCase, SimpleTestCase
 from django.core.management import call_command
 
+from core.vectorizer_bot import embedding_cache, embedding_writer, image_fetcher, inference
+from core.vectorizer_bot.pipeline import Pipeline
+from core.vectorizer_bot.preprocess import ImagePreprocessor, PreprocessConfig, decode, to_pixels
+
 class VectorizerTest(TestCase):
     def test_vectorizer_model_loading(self):
         """
         Verifica que el modelo SigLIP se cargue o maneje el error si no hay GPU.
         """
         pass
+
+
+class VectorizerPipelineTest(SimpleTestCase):
+    """Pipeline por etapas: colas acotadas, lotes dinámicos y métricas"""
+
+    def _run(self, pipeline, done, timeout=5):
+        pipeline.start()
+        try:
+            self.assertTrue(done.wait(timeout))
+        finally:
+            pipeline.stop()
+
+    def test_items_flow_through_stages_in_dynamic_batches(self):
+        written, batches, done = [], [], threading.Event()
+
+        def write(items):
+            batches.append(len(items))
+            written.extend(items)
+            if len(written) == 9:
+                done.set()
+
+        pipeline = Pipeline("test", report_every=0)
+        pipeline.source("cola", lambda: iter(range(10)))
+        pipeline.stage("doble", lambda x: x * 2, workers=3, maxsize=2)
+        pipeline.stage("filtro", lambda x: None if x == 4 else x)  # None = descartar
+        pipeline.stage("escritura", write, batch_size=4, max_wait=0.2)
+        self._run(pipeline, done)
+
+        self.assertEqual(sorted(written), [0, 2, 6, 8, 10, 12, 14, 16, 18])
+        self.assertLessEqual(max(batches), 4)
+        self.assertTrue(pipeline.report()[-1].startswith("escritura: "))
+        self.assertIn("cola 0/64", pipeline.report()[-1])
+
+    def test_stage_errors_are_counted_and_do_not_stop_the_pipeline(self):
+        seen, done = [], threading.Event()
+
+        def check(x):
+            if x == 2:
+                raise ValueError("imagen corrupta")
+            return x
+
+        def collect(x):
+            seen.append(x)
+            if len(seen) == 3:
+                done.set()
+
+        pipeline = Pipeline("test", report_every=0)
+        pipeline.source("cola", lambda: iter([1, 2, 3, 4]))
+        pipeline.stage("check", check)
+        pipeline.stage("collect", collect)
+        self._run(pipeline, done)
+
+        self.assertEqual(seen, [1, 3, 4])
+        self.assertEqual(pipeline.stages[1].stats.errors, 1)
+        self.assertIn("1 err", pipeline.report()[1])
+
+
+class EmbeddingWriterTest(SimpleTestCase):
+    """Escritura de embeddings por COPY BINARY (formato binario de pgvector)"""
+
+    def test_binary_copy_matches_pgvector_format(self):
+        from pgvector import Vector
+
+        vector = np.array([0.5, -1.0, 0.25], dtype=np.float32)
+        data = embedding_writer.binary_copy_buffer([(42, vector)]).read()
+
+        self.assertTrue(data.startswith(embedding_writer.COPY_SIGNATURE))
+        row = data[len(embedding_writer.COPY_SIGNATURE) + 8:]
+        self.assertEqual(struct.unpack(">hiq", row[:14]), (2, 8, 42))
+        (length,) = struct.unpack(">i", row[14:18])
+        self.assertEqual(row[18:18 + length], Vector(vector).to_binary())
+        self.assertEqual(row[18 + length:], struct.pack(">h", -1))
+
+    def test_batches_are_deduplicated_and_failures_sent_in_one_statement(self):
+        cursor = MagicMock()
+        embedding_writer.write_embeddings(cursor, [(1, np.zeros(3)), (2, np.ones(3)), (1, np.ones(3))])
+        copy_sql, buffer = cursor.copy_expert.call_args[0]
+        self.assertIn("FORMAT binary", copy_sql)
+        self.assertEqual(buffer.read().count(struct.pack(">hiq", 2, 8, 1)), 1)
+        self.assertIn("ON CONFLICT (product_id)", cursor.execute.call_args_list[-1][0][0])
+
+        with patch.object(embedding_writer, "execute_values") as execute_values:
+            self.assertEqual(embedding_writer.mark_failed(cursor, [5, 6, 5]), 2)
+        self.assertEqual(execute_values.call_count, 1)
+        self.assertEqual(execute_values.call_args[0][2], [(5,), (6,)])
+
+
+class EmbeddingCacheTest(SimpleTestCase):
+    """Caché de embeddings por hash de imagen y por URL"""
+
+    def test_url_hits_map_back_to_urls(self):
+        cursor = MagicMock()
+        image_hash = embedding_cache.content_hash(b"jpeg bytes")
+        url_hash = embedding_cache.content_hash("https://cdn/a.jpg")
+        cursor.fetchall.return_value = [(url_hash, image_hash, np.ones(3))]
+
+        hits = embedding_cache.lookup_urls(cursor, ["https://cdn/a.jpg", "https://cdn/b.jpg", None], "siglip")
+
+        self.assertEqual(list(hits), ["https://cdn/a.jpg"])
+        self.assertEqual(hits["https://cdn/a.jpg"][0], image_hash)
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("e.model = %s", sql)
+        self.assertEqual(len(params[0]), 2)
+
+    def test_store_copies_each_image_once_and_links_urls(self):
+        cursor = MagicMock()
+        embedding_cache.store(
+            cursor, "siglip",
+            images=[("a" * 32, np.ones(3)), ("a" * 32, np.ones(3))],
+            urls=[("https://cdn/1.jpg", "a" * 32), ("https://cdn/2.jpg", "a" * 32), ("https://cdn/3.jpg", None)],
+        )
+        copy_sql, buffer = cursor.copy_expert.call_args[0]
+        self.assertIn("image_embedding_stage", copy_sql)
+        self.assertEqual(buffer.read().count(b"a" * 32), 1)
+        url_sql, (url_hashes, urls, image_hashes) = cursor.execute.call_args_list[-1][0]
+        self.assertIn("INSERT INTO image_url_cache", url_sql)
+        self.assertEqual(urls, ["https://cdn/1.jpg", "https://cdn/2.jpg"])
+
+
+class InferenceBackendTest(SimpleTestCase):
+    """Validación de backends ONNX contra fp32"""
+
+    def test_compare_embeddings_identical_and_perturbed(self):
+        rng = np.random.default_rng(0)
+        reference = rng.normal(size=(20, 16))
+        same = inference.compare_embeddings(reference, reference * 3)
+        self.assertAlmostEqual(same["mean_cosine"], 1.0, places=5)
+        self.assertEqual(same["neighbor_overlap"], 1.0)
+
+        noisy = inference.compare_embeddings(reference, reference + rng.normal(scale=0.5, size=reference.shape))
+        self.assertLess(noisy["mean_cosine"], 0.99)
+        self.assertLessEqual(noisy["min_cosine"], noisy["p1_cosine"])
+
+    def test_validation_is_tied_to_the_exported_file(self):
+        with tempfile.TemporaryDirectory() as onnx_dir:
+            model = inference.onnx_path(onnx_dir, "onnx-int8")
+            model.write_bytes(b"modelo v1")
+            self.assertFalse(inference.is_validated(onnx_dir, "onnx-int8"))
+
+            inference.write_validation(onnx_dir, "onnx-int8", {"passed": True, "mean_cosine": 0.998})
+            self.assertTrue(inference.is_validated(onnx_dir, "onnx-int8"))
+            self.assertFalse(inference.is_validated(onnx_dir, "onnx"))
+
+            model.write_bytes(b"modelo v2, reexportado")  # Otro archivo: hay que revalidar
+            os.utime(model, (1, 1))
+            self.assertFalse(inference.is_validated(onnx_dir, "onnx-int8"))
+
+
+def _jpeg(size, color=(200, 30, 90)):
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG", quality=95)
+    return buf.getvalue()
+
+
+class PreprocessTest(SimpleTestCase):
+    """Preprocesamiento por procesos con memoria compartida"""
+
+    def test_large_jpeg_is_drafted_but_not_below_target(self):
+        config = PreprocessConfig()
+        image = decode(_jpeg((2000, 1600)), config)
+        self.assertLess(image.size[0], 2000)
+        self.assertGreaterEqual(image.size[0], 384)
+        self.assertGreaterEqual(image.size[1], 384)
+
+    def test_pixels_are_normalized_channels_first(self):
+        pixels = to_pixels(Image.new("RGB", (500, 300), (255, 0, 127)), PreprocessConfig())
+        self.assertEqual(pixels.shape, (3, 384, 384))
+        self.assertEqual(pixels.dtype, np.float32)
+        np.testing.assert_allclose(pixels[:, 10, 10], [1.0, -1.0, 127 / 127.5 - 1], atol=1e-5)
+
+    def test_process_pool_fills_shared_slots(self):
+        preprocessor = ImagePreprocessor(PreprocessConfig(height=32, width=32), workers=1, slots=4)
+        try:
+            slots = [preprocessor.preprocess(_jpeg((64, 64), color)) for color in [(255, 255, 255), (0, 0, 0)]]
+            batch = preprocessor.stack(slots)
+            self.assertEqual(batch.shape, (2, 3, 32, 32))
+            self.assertAlmostEqual(float(batch[0].mean()), 1.0, places=1)
+            self.assertAlmostEqual(float(batch[1].mean()), -1.0, places=1)
+            with self.assertRaises(Exception):
+                preprocessor.preprocess(b"no es una imagen")
+            for slot in slots:
+                preprocessor.release(slot)
+            self.assertEqual(preprocessor.free.qsize(), 4)  # El slot del fallo también volvió
+        finally:
+            preprocessor.close()
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/missing.jpg":
+            self.send_error(404)
+            return
+        body = b"x" * (4096 if self.path == "/big.jpg" else 100)
+        self.send_response(200)
+        if self.path != "/chunked.jpg":
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body * (40 if self.path == "/chunked.jpg" else 1))
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageFetcherTest(SimpleTestCase):
+    """Descargas con pool de conexiones, límite de tamaño y backoff por URL"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_fetch_classifies_and_limits_size(self):
+        fetcher = image_fetcher.ImageFetcher(pool_size=2, timeout=5, max_bytes=1000)
+        try:
+            self.assertEqual(fetcher.fetch(f"{self.base}/ok.jpg").data, b"x" * 100)
+            missing = fetcher.fetch(f"{self.base}/missing.jpg")
+            self.assertEqual((missing.data, missing.error, missing.status), (None, "http_404", 404))
+            self.assertEqual(fetcher.fetch(f"{self.base}/big.jpg").error, "too_large")
+            self.assertEqual(fetcher.fetch(f"{self.base}/chunked.jpg").error, "too_large")  # Sin Content-Length
+            self.assertEqual(fetcher.fetch("http://127.0.0.1:1/nada.jpg").error, "connection")
+        finally:
+            fetcher.close()
+
+    def test_record_failures_dedupes_and_maps_back_to_urls(self):
+        cursor = MagicMock()
+        url_hash = embedding_cache.content_hash("https://cdn/a.jpg")
+        cursor.fetchall.return_value = [(url_hash, None)]
+        result = image_fetcher.record_failures(
+            cursor, [("https://cdn/a.jpg", "timeout", None), ("https://cdn/a.jpg", "http_404", 404)], give_up_permanent=2,
+        )
+        self.assertEqual(result, {"https://cdn/a.jpg": None})
+        sql, params = cursor.execute.call_args[0]
+        self.assertIn("ON CONFLICT (url_hash)", sql)
+        self.assertEqual(params["errors"], ["http_404"])  # Una fila por URL: gana el último fallo
+        self.assertIn("http_404", params["permanent"])
@@ -0,0 +1,21 @@
+"""
+Vectorizer Bot - Componentes del vectorizer de imágenes de producto
+
+Este paquete agrupa las piezas reutilizables del comando `vectorizer`
+(core/management/commands/vectorizer.py), que sigue siendo el orquestador del daemon.
+
+Módulos:
+- pipeline: Pipeline por etapas con colas acotadas, lotes dinámicos y métricas por etapa
+- embedding_writer: Upsert masivo de embeddings por COPY BINARY (formato binario de pgvector)
+- embedding_cache: Caché de embeddings por hash de imagen y por URL (fotos repetidas entre productos)
+- image_fetcher: Descarga con conexiones reutilizadas (HTTP/2 si está disponible) y backoff por URL fallida
+- preprocess: Decode (JPEG draft) + resize/normalización en un pool de procesos sobre memoria compartida
+- inference: Backends de inferencia de SigLIP (torch fp32, ONNX Runtime, ONNX int8) y su validación
+"""
+
+from .pipeline import Pipeline, Stage
+
+__all__ = [
+    'Pipeline',
+    'Stage',
+]
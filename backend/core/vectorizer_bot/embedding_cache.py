@@ -0,0 +1,103 @@
+"""
+Caché de embeddings direccionada por contenido.
+
+Muchos proveedores de Dropi reutilizan las mismas fotos: la misma URL en varios productos
+o la misma imagen subida con URLs distintas. Dos niveles en Postgres:
+
+- image_embeddings: hash blake2b-128 de los bytes de la imagen → vector (y el modelo
+  que lo generó; un vector de otro modelo no cuenta como acierto).
+- image_url_cache: hash de la URL → hash de imagen. Un acierto evita hasta la descarga.
+  Las entradas más viejas que `max_age_days` se ignoran (la URL pudo cambiar de imagen).
+
+`last_used_at` se actualiza como mucho una vez por día por entrada (sin escribir en cada
+acierto) y `manage.py embedding_cache --prune` desaloja las menos usadas (LRU).
+
+Las funciones reciben un cursor psycopg2 de una conexión con `register_vector` (los
+vectores vuelven como numpy) y no confirman: la transacción es de quien llama.
+"""
+from hashlib import blake2b
+
+from .embedding_writer import binary_copy_buffer
+
+STAGE_TABLE = "image_embedding_stage"
+
+SQL_LOOKUP_URLS = """
+    SELECT u.url_hash, e.image_hash, e.embedding
+    FROM image_url_cache u
+    JOIN image_embeddings e ON e.image_hash = u.image_hash
+    WHERE u.url_hash = ANY(%s) AND e.model = %s
+      AND u.fetched_at > NOW() - make_interval(days => %s);
+"""
+SQL_LOOKUP_IMAGES = """
+    SELECT image_hash, embedding FROM image_embeddings
+    WHERE image_hash = ANY(%s) AND model = %s;
+"""
+SQL_STAGE = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (image_hash varchar(32), embedding vector)
+    ON COMMIT DELETE ROWS;
+"""
+SQL_STORE_IMAGES = f"""
+    INSERT INTO image_embeddings (image_hash, model, embedding, created_at, last_used_at)
+    SELECT image_hash, %s, embedding, NOW(), NOW() FROM {STAGE_TABLE}
+    ON CONFLICT (image_hash) DO UPDATE
+        SET model = EXCLUDED.model, embedding = EXCLUDED.embedding, last_used_at = NOW()
+        WHERE image_embeddings.model IS DISTINCT FROM EXCLUDED.model;
+"""
+SQL_STORE_URLS = """
+    INSERT INTO image_url_cache (url_hash, url, image_hash, fetched_at)
+    SELECT u.url_hash, u.url, u.image_hash, NOW()
+    FROM unnest(%s::varchar[], %s::text[], %s::varchar[]) AS u(url_hash, url, image_hash)
+    ON CONFLICT (url_hash) DO UPDATE SET image_hash = EXCLUDED.image_hash, fetched_at = NOW();
+"""
+SQL_TOUCH = """
+    UPDATE image_embeddings SET last_used_at = NOW()
+    WHERE image_hash = ANY(%s) AND last_used_at < NOW() - INTERVAL '1 day';
+"""
+
+
+def content_hash(data):
+    """Clave de caché de una imagen (o de una URL): blake2b-128 en hex."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return blake2b(data, digest_size=16).hexdigest()
+
+
+def lookup_urls(cursor, urls, model, max_age_days=30):
+    """{url: (image_hash, vector)} para las URLs con imagen ya vectorizada por `model`."""
+    by_hash = {content_hash(url): url for url in urls if url}
+    if not by_hash:
+        return {}
+    cursor.execute(SQL_LOOKUP_URLS, (list(by_hash), model, max_age_days))
+    return {by_hash[url_hash]: (image_hash, vector) for url_hash, image_hash, vector in cursor.fetchall()}
+
+
+def lookup_images(cursor, image_hashes, model):
+    """{image_hash: vector} para las imágenes ya vectorizadas por `model`."""
+    hashes = list(dict.fromkeys(h for h in image_hashes if h))
+    if not hashes:
+        return {}
+    cursor.execute(SQL_LOOKUP_IMAGES, (hashes, model))
+    return dict(cursor.fetchall())
+
+
+def store(cursor, model, images=(), urls=()):
+    """
+    Guarda vectores nuevos [(image_hash, vector)] y asociaciones [(url, image_hash)].
+    Si dos workers calculan la misma imagen a la vez, el segundo no la reescribe.
+    """
+    images = list(dict(images).items())
+    if images:
+        cursor.execute(SQL_STAGE)
+        cursor.copy_expert(f"COPY {STAGE_TABLE} (image_hash, embedding) FROM STDIN WITH (FORMAT binary)",
+                           binary_copy_buffer(images))
+        cursor.execute(SQL_STORE_IMAGES, (model,))
+    urls = {url: image_hash for url, image_hash in urls if url and image_hash}
+    if urls:
+        cursor.execute(SQL_STORE_URLS, ([content_hash(u) for u in urls], list(urls), list(urls.values())))
+
+
+def touch(cursor, image_hashes):
+    """Marca uso de entradas acertadas (para el desalojo LRU)."""
+    hashes = list(dict.fromkeys(h for h in image_hashes if h))
+    if hashes:
+        cursor.execute(SQL_TOUCH, (hashes,))
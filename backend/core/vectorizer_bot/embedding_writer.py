@@ -0,0 +1,87 @@
+"""
+Escritura masiva de embeddings en product_embeddings.
+
+Los vectores viajan en el formato binario de pgvector dentro de un COPY BINARY a una
+tabla temporal (4 bytes por dimensión, sin texto decimal que el servidor tenga que
+parsear) y se aplican con un único INSERT ... SELECT ... ON CONFLICT. Los productos
+fallidos (sin vector) se marcan con un solo execute_values.
+
+Las funciones reciben un cursor psycopg2 y no confirman: la transacción es de quien llama.
+"""
+import io
+import struct
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+STAGE_TABLE = "embedding_stage"
+
+SQL_STAGE = f"""
+    CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (product_id bigint, embedding_visual vector)
+    ON COMMIT DELETE ROWS;
+"""
+# embedding_bits: nivel compacto (cuantización binaria) para la preselección de VectorSearchService
+SQL_MERGE = f"""
+    INSERT INTO product_embeddings (product_id, embedding_visual, embedding_bits, processed_at)
+    SELECT product_id, embedding_visual, binary_quantize(embedding_visual)::bit(1152), NOW() FROM {STAGE_TABLE}
+    ON CONFLICT (product_id)
+    DO UPDATE SET embedding_visual = EXCLUDED.embedding_visual, embedding_bits = EXCLUDED.embedding_bits,
+                  processed_at = NOW();
+"""
+SQL_FAILED = """
+    INSERT INTO product_embeddings (product_id, processed_at)
+    VALUES %s
+    ON CONFLICT (product_id) DO UPDATE SET processed_at = NOW();
+"""
+
+_ROW_HEADER = struct.Struct(">hiq")  # 2 campos; largo y valor del bigint
+_TEXT_ROW_HEADER = struct.Struct(">hi")  # 2 campos; largo del texto (los bytes UTF-8 van a continuación)
+_VECTOR_HEADER = struct.Struct(">iHH")  # largo del campo; dim y reservado (formato binario de pgvector)
+
+
+def pack_vector(vector):
+    """Campo vector en formato binario de pgvector (con su largo de COPY)."""
+    values = np.asarray(vector, dtype=">f4").ravel()
+    return _VECTOR_HEADER.pack(4 + values.nbytes, values.size, 0) + values.tobytes()
+
+
+def binary_copy_buffer(rows):
+    """
+    [(clave, vector)] → stream COPY BINARY con columnas (bigint, vector), o (text, vector)
+    si la clave es un string (hash de imagen).
+    """
+    buf = io.BytesIO()
+    buf.write(COPY_SIGNATURE)
+    buf.write(struct.pack(">ii", 0, 0))  # flags, largo de extensión del header
+    for key, vector in rows:
+        if isinstance(key, str):
+            encoded = key.encode("utf-8")
+            buf.write(_TEXT_ROW_HEADER.pack(2, len(encoded)) + encoded)
+        else:
+            buf.write(_ROW_HEADER.pack(2, 8, int(key)))
+        buf.write(pack_vector(vector))
+    buf.write(struct.pack(">h", -1))
+    buf.seek(0)
+    return buf
+
+
+def write_embeddings(cursor, rows):
+    """Upsert de [(product_id, vector)] vía COPY BINARY. Retorna las filas escritas."""
+    rows = list(dict(rows).items())  # Un ID repetido en el lote rompería el ON CONFLICT: gana el último
+    if not rows:
+        return 0
+    cursor.execute(SQL_STAGE)
+    cursor.copy_expert(f"COPY {STAGE_TABLE} (product_id, embedding_visual) FROM STDIN WITH (FORMAT binary)",
+                       binary_copy_buffer(rows))
+    cursor.execute(SQL_MERGE)
+    return cursor.rowcount
+
+
+def mark_failed(cursor, product_ids):
+    """processed_at = NOW() sin vector para productos que no se pudieron vectorizar (un statement)."""
+    product_ids = list(dict.fromkeys(product_ids))
+    if not product_ids:
+        return 0
+    execute_values(cursor, SQL_FAILED, [(pid,) for pid in product_ids], page_size=1000)
+    return len(product_ids)
@@ -0,0 +1,171 @@
+"""
+Descarga de imágenes de producto con conexiones reutilizadas y registro de URLs rotas.
+
+- ImageFetcher: un cliente compartido por todos los hilos de descarga (keep-alive: sin un
+  handshake TCP+TLS por imagen). Con httpx + h2 instalados usa HTTP/2 (muchas descargas
+  multiplexadas sobre pocas conexiones al CDN); si no, un requests.Session con pool.
+  El cuerpo se lee en streaming y se corta al pasar `max_bytes`.
+- image_fetch_failures: fallos por URL (hash blake2b como en la caché de embeddings) con
+  backoff exponencial. Una URL que sigue fallando se abandona (`retry_after` NULL) tras
+  `give_up` intentos, o `give_up_permanent` si el error no es transitorio (404, 410,
+  imagen demasiado grande...). Un acierto borra el registro.
+
+Las funciones de fallos reciben un cursor psycopg2 y no confirman: la transacción es de
+quien llama.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+from .embedding_cache import content_hash
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (httpx lo necesita para HTTP/2)
+except ImportError:
+    h2 = None
+
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "DropTools-Vectorizer/1.0"
+# Errores que no se arreglan solos: se abandonan antes
+PERMANENT_ERRORS = ("http_400", "http_401", "http_403", "http_404", "http_410", "http_451", "too_large")
+
+SQL_LOOKUP = """
+    SELECT url_hash, failures, retry_after FROM image_fetch_failures WHERE url_hash = ANY(%s);
+"""
+# Backoff: base · 2^(fallos-1), con tope; NULL = abandonada
+SQL_RECORD = """
+    INSERT INTO image_fetch_failures AS f
+        (url_hash, url, failures, last_error, last_status, first_failed_at, last_failed_at, retry_after)
+    SELECT u.url_hash, u.url, 1, u.error, u.status, NOW(), NOW(),
+           CASE WHEN 1 >= (CASE WHEN u.error = ANY(%(permanent)s) THEN %(give_up_permanent)s ELSE %(give_up)s END)
+                THEN NULL ELSE NOW() + make_interval(secs => %(base)s) END
+    FROM unnest(%(hashes)s::varchar[], %(urls)s::text[], %(errors)s::varchar[], %(statuses)s::int[])
+        AS u(url_hash, url, error, status)
+    ON CONFLICT (url_hash) DO UPDATE SET
+        failures = f.failures + 1,
+        last_error = EXCLUDED.last_error,
+        last_status = EXCLUDED.last_status,
+        last_failed_at = NOW(),
+        retry_after = CASE
+            WHEN f.failures + 1 >= (CASE WHEN EXCLUDED.last_error = ANY(%(permanent)s)
+                                         THEN %(give_up_permanent)s ELSE %(give_up)s END) THEN NULL
+            ELSE NOW() + make_interval(secs => LEAST(%(base)s * power(2, f.failures), %(cap)s)) END
+    RETURNING url_hash, retry_after;
+"""
+SQL_CLEAR = """
+    DELETE FROM image_fetch_failures WHERE url_hash = ANY(%s);
+"""
+
+
+class FetchResult:
+    __slots__ = ("data", "error", "status")
+
+    def __init__(self, data=None, error=None, status=None):
+        self.data = data
+        self.error = error  # None | "http_<status>" | "timeout" | "connection" | "too_large" | "error"
+        self.status = status
+
+
+class ImageFetcher:
+    """Cliente HTTP compartido (thread-safe) para descargar imágenes."""
+
+    def __init__(self, pool_size=16, timeout=10, max_bytes=15 * 1024 * 1024, http2=True):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.http2 = bool(http2 and httpx is not None and h2 is not None)
+        if httpx is not None:
+            self.client = httpx.Client(
+                http2=self.http2,
+                timeout=httpx.Timeout(timeout),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+            )
+        else:
+            self.client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            self.client.mount("http://", adapter)
+            self.client.mount("https://", adapter)
+            self.client.headers["User-Agent"] = USER_AGENT
+
+    @property
+    def protocol(self):
+        if httpx is None:
+            return "HTTP/1.1 (requests)"
+        return "HTTP/2 (httpx)" if self.http2 else "HTTP/1.1 (httpx)"
+
+    def fetch(self, url):
+        try:
+            if httpx is not None:
+                with self.client.stream("GET", url) as response:
+                    return self._read(response.status_code, response.headers, response.iter_bytes(CHUNK_SIZE))
+            with self.client.get(url, timeout=self.timeout, stream=True) as response:
+                return self._read(response.status_code, response.headers, response.iter_content(CHUNK_SIZE))
+        except Exception as e:
+            return FetchResult(error=self._classify(e))
+
+    def _read(self, status, headers, chunks):
+        if status >= 400:
+            return FetchResult(error=f"http_{status}", status=status)
+        length = headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            return FetchResult(error="too_large", status=status)
+        body = bytearray()
+        for chunk in chunks:
+            body += chunk
+            if len(body) > self.max_bytes:
+                return FetchResult(error="too_large", status=status)
+        return FetchResult(data=bytes(body), status=status)
+
+    @staticmethod
+    def _classify(exc):
+        if httpx is not None:
+            if isinstance(exc, httpx.TimeoutException):
+                return "timeout"
+            if isinstance(exc, httpx.TransportError):
+                return "connection"
+        if isinstance(exc, requests.Timeout):
+            return "timeout"
+        if isinstance(exc, requests.ConnectionError):
+            return "connection"
+        return "error"
+
+    def close(self):
+        self.client.close()
+
+
+def lookup_failures(cursor, urls):
+    """{url: (fallos, retry_after)} para las URLs con fallos registrados (retry_after None = abandonada)."""
+    by_hash = {content_hash(url): url for url in urls if url}
+    if not by_hash:
+        return {}
+    cursor.execute(SQL_LOOKUP, (list(by_hash),))
+    return {by_hash[url_hash]: (failures, retry_after) for url_hash, failures, retry_after in cursor.fetchall()}
+
+
+def record_failures(cursor, failures, base=900, cap=86400, give_up=8, give_up_permanent=3):
+    """
+    Registra [(url, error, status)] y retorna {url: retry_after} (None = abandonada).
+    Con los defaults: 15 min, 30 min, 1 h... hasta 1 día entre intentos.
+    """
+    by_hash = {content_hash(url): (url, error, status) for url, error, status in failures if url}
+    if not by_hash:
+        return {}
+    urls, errors, statuses = zip(*by_hash.values())
+    cursor.execute(SQL_RECORD, {
+        "hashes": list(by_hash), "urls": list(urls), "errors": list(errors), "statuses": list(statuses),
+        "permanent": list(PERMANENT_ERRORS), "base": base, "cap": cap,
+        "give_up": give_up, "give_up_permanent": give_up_permanent,
+    })
+    return {by_hash[url_hash][0]: retry_after for url_hash, retry_after in cursor.fetchall()}
+
+
+def clear_failures(cursor, urls):
+    """Borra el registro de URLs que volvieron a descargarse bien."""
+    hashes = list(dict.fromkeys(content_hash(url) for url in urls if url))
+    if hashes:
+        cursor.execute(SQL_CLEAR, (hashes,))
@@ -0,0 +1,207 @@
+"""
+Backends de inferencia del vectorizer (solo la torre de imagen de SigLIP).
+
+- torch: PyTorch fp32, el de siempre (CPU o CUDA).
+- onnx: el mismo modelo exportado a ONNX y corrido con ONNX Runtime.
+- onnx-int8: ONNX con cuantización dinámica int8 de los pesos (MatMul/Gemm); en CPU es
+  el más rápido, a cambio de una pequeña diferencia en los vectores.
+
+Todos reciben `pixel_values` [N, 3, 384, 384] (lo que produce el AutoProcessor) y
+retornan embeddings L2-normalizados como numpy float32 [N, 1152].
+
+Los backends ONNX solo se activan si `manage.py vectorizer_validate` los aprobó contra
+fp32 (validation.json junto a los modelos, atado al archivo exacto); si no, se usa torch.
+"""
+import json
+import logging
+import os
+import pathlib
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+logger = logging.getLogger("vectorizer.inference")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "siglip_vision.onnx", "onnx-int8": "siglip_vision.int8.onnx"}
+VALIDATION_FILE = "validation.json"
+ONNX_OPSET = 17
+
+
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name, device="cpu", threads=0):
+        from transformers import SiglipModel
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = device
+        self.model = SiglipModel.from_pretrained(model_name).to(device)
+        self.model.eval()
+
+    def embed(self, pixel_values):
+        if not isinstance(pixel_values, torch.Tensor):
+            pixel_values = torch.from_numpy(np.asarray(pixel_values))
+        with torch.no_grad():
+            # SigLIP: get_image_features retorna los embeddings ya proyectados
+            features = self.model.get_image_features(pixel_values=pixel_values.to(self.device))
+        return l2_normalize(features.cpu().numpy())
+
+
+class OnnxBackend:
+    def __init__(self, name, model_path, threads=0):
+        if onnxruntime is None:
+            raise ImportError("onnxruntime no está instalado")
+        self.name = name
+        self.model_path = pathlib.Path(model_path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1  # Un lote a la vez: todos los hilos dentro de cada operador
+        self.session = onnxruntime.InferenceSession(
+            str(self.model_path), sess_options=options, providers=["CPUExecutionProvider"],
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def embed(self, pixel_values):
+        if torch is not None and isinstance(pixel_values, torch.Tensor):
+            pixel_values = pixel_values.cpu().numpy()
+        (features,) = self.session.run(None, {self.input_name: np.ascontiguousarray(pixel_values, dtype=np.float32)})
+        return l2_normalize(features)
+
+
+def onnx_path(onnx_dir, backend):
+    return pathlib.Path(onnx_dir) / ONNX_FILES[backend]
+
+
+def file_signature(path):
+    """Tamaño y mtime: la validación queda atada al archivo exacto que se probó."""
+    stat = pathlib.Path(path).stat()
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def read_validation(onnx_dir):
+    path = pathlib.Path(onnx_dir) / VALIDATION_FILE
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return {}
+
+
+def write_validation(onnx_dir, backend, result):
+    """Registra el resultado de la validación de `backend` (conserva la de los demás)."""
+    results = read_validation(onnx_dir)
+    results[backend] = {**result, "file": file_signature(onnx_path(onnx_dir, backend))}
+    (pathlib.Path(onnx_dir) / VALIDATION_FILE).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+def is_validated(onnx_dir, backend):
+    result = read_validation(onnx_dir).get(backend) or {}
+    path = onnx_path(onnx_dir, backend)
+    return bool(result.get("passed")) and path.exists() and result.get("file") == file_signature(path)
+
+
+def compare_embeddings(reference, candidate, k=10):
+    """
+    Acuerdo entre dos juegos de embeddings de las mismas imágenes: coseno por imagen
+    (media, percentil 1, mínimo) y solapamiento de los k vecinos más cercanos dentro de
+    la muestra (lo que ve una búsqueda por similitud).
+    """
+    reference, candidate = l2_normalize(reference), l2_normalize(candidate)
+    cosines = np.sum(reference * candidate, axis=1)
+    k = min(k, len(reference) - 1)
+    overlap = None
+    if k > 0:
+        def neighbors(vectors):
+            sims = vectors @ vectors.T
+            np.fill_diagonal(sims, -np.inf)
+            return np.argsort(-sims, axis=1)[:, :k]
+
+        ref_nn, cand_nn = neighbors(reference), neighbors(candidate)
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_nn, cand_nn)]))
+    return {
+        "images": int(len(cosines)),
+        "mean_cosine": float(np.mean(cosines)),
+        "p1_cosine": float(np.percentile(cosines, 1)),
+        "min_cosine": float(np.min(cosines)),
+        "neighbor_overlap": overlap,
+        "k": k,
+    }
+
+
+def load_backend(name, model_name, onnx_dir, device="cpu", threads=0, require_validation=True):
+    """
+    Backend `name`; cae a torch si el modelo ONNX no existe, falta onnxruntime o (con
+    require_validation) no pasó `vectorizer_validate`.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    if name != "torch":
+        path = onnx_path(onnx_dir, name)
+        if onnxruntime is None:
+            logger.error(f"❌ Backend {name}: onnxruntime no está instalado. Usando torch.")
+        elif not path.exists():
+            logger.error(f"❌ Backend {name}: falta {path} (correr vectorizer_validate --export). Usando torch.")
+        elif require_validation and not is_validated(onnx_dir, name):
+            logger.error(f"❌ Backend {name}: sin validación aprobada contra fp32 (vectorizer_validate). Usando torch.")
+        else:
+            return OnnxBackend(name, path, threads)
+    return TorchBackend(model_name, device, threads)
+
+
+def export_onnx(model_name, onnx_dir, quantize=True):
+    """
+    Exporta la torre de imagen a ONNX (lote dinámico) y, con `quantize`, la versión int8.
+    Retorna las rutas generadas.
+    """
+    from transformers import SiglipModel
+
+    class VisionFeatures(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    onnx_dir = pathlib.Path(onnx_dir)
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    model = SiglipModel.from_pretrained(model_name).eval()
+    size = model.config.vision_config.image_size
+    fp32_path = onnx_path(onnx_dir, "onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            VisionFeatures(model),
+            (torch.zeros(1, 3, size, size),),
+            str(fp32_path),
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+    paths = [fp32_path]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = onnx_path(onnx_dir, "onnx-int8")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8, per_channel=True)
+        paths.append(int8_path)
+    return paths
@@ -0,0 +1,220 @@
+"""
+Pipeline por etapas con colas acotadas entre ellas.
+
+Cada etapa tiene su cola de entrada (tamaño fijo: si la siguiente etapa se atrasa, la
+anterior se bloquea en lugar de acumular memoria) y N hilos. Las etapas con
+`batch_size` agrupan ítems dinámicamente: toman lo que haya en la cola hasta llenar el
+lote o hasta que pasen `max_wait` segundos desde el primero, así una etapa lenta (la
+inferencia) trabaja con lotes grandes cuando hay backlog y no espera cuando hay poco.
+
+Un hilo reporter registra cada `report_every` segundos el throughput y la profundidad
+de cola de cada etapa.
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("vectorizer.pipeline")
+
+POLL_SECONDS = 0.5  # Cada cuánto los hilos bloqueados revisan si hay que detenerse
+
+
+class StageStats:
+    """Contadores de una etapa (los actualizan sus hilos con el lock de la etapa)."""
+
+    def __init__(self):
+        self.items = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.last_items = 0
+        self.last_report = time.time()
+
+    def snapshot(self):
+        """Ítems/s desde el reporte anterior."""
+        now = time.time()
+        rate = (self.items - self.last_items) / max(now - self.last_report, 1e-6)
+        self.last_items, self.last_report = self.items, now
+        return rate
+
+
+class Stage:
+    """
+    Etapa del pipeline.
+
+    - Fuente (`source=True`): `func()` es un generador que produce ítems mientras el
+      pipeline esté activo.
+    - Por ítem: `func(item)` retorna el ítem para la etapa siguiente (None = descartar).
+    - Por lote (`batch_size`): `func(items)` retorna un iterable de ítems para la siguiente.
+    """
+
+    def __init__(self, name, func, workers=1, maxsize=64, batch_size=None, max_wait=0.5, source=False):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.source = source
+        self.queue = None if source else queue.Queue(maxsize=maxsize)
+        self.next = None
+        self.stats = StageStats()
+        self._lock = threading.Lock()
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def capacity(self):
+        return self.queue.maxsize if self.queue is not None else 0
+
+    def emit(self, item, stop):
+        """Pasa un ítem a la etapa siguiente; se bloquea si su cola está llena (backpressure)."""
+        if self.next is None or item is None:
+            return
+        while not stop.is_set():
+            try:
+                self.next.queue.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def take(self, stop):
+        """Siguiente ítem o lote de la cola de entrada; None si el pipeline se detiene."""
+        while not stop.is_set():
+            try:
+                first = self.queue.get(timeout=POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        else:
+            return None
+        if not self.batch_size:
+            return first
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def record(self, items, seconds, error=False):
+        with self._lock:
+            self.stats.items += items
+            self.stats.batches += 1
+            self.stats.busy_seconds += seconds
+            if error:
+                self.stats.errors += 1
+
+    def run(self, stop):
+        if self.source:
+            self.run_source(stop)
+            return
+        while not stop.is_set():
+            work = self.take(stop)
+            if work is None:
+                return
+            size = len(work) if self.batch_size else 1
+            started = time.time()
+            try:
+                result = self.func(work)
+            except Exception as e:
+                logger.error(f"❌ Etapa {self.name}: {e}")
+                self.record(size, time.time() - started, error=True)
+                continue
+            self.record(size, time.time() - started)
+            if self.batch_size:
+                for item in result or ():
+                    self.emit(item, stop)
+            else:
+                self.emit(result, stop)
+
+    def run_source(self, stop):
+        """Consume el generador de la fuente; si falla (p. ej. DB caída) lo reinicia tras una pausa."""
+        while not stop.is_set():
+            try:
+                for item in self.func():
+                    if stop.is_set():
+                        return
+                    self.record(1, 0.0)
+                    self.emit(item, stop)
+                return  # Fuente agotada
+            except Exception as e:
+                logger.error(f"❌ Etapa {self.name}: {e}")
+                self.record(0, 0.0, error=True)
+                stop.wait(POLL_SECONDS * 20)
+
+
+class Pipeline:
+    """Encadena etapas en el orden en que se agregan y las corre en hilos daemon."""
+
+    def __init__(self, name="pipeline", report_every=60, log=None):
+        self.name = name
+        self.report_every = report_every
+        self.log = log or logger
+        self.stages = []
+        self.stop_event = threading.Event()
+        self._threads = []
+
+    def add(self, stage):
+        if self.stages:
+            self.stages[-1].next = stage
+        self.stages.append(stage)
+        return stage
+
+    def source(self, name, func):
+        return self.add(Stage(name, func, source=True))
+
+    def stage(self, name, func, workers=1, maxsize=64, batch_size=None, max_wait=0.5):
+        return self.add(Stage(name, func, workers=workers, maxsize=maxsize, batch_size=batch_size, max_wait=max_wait))
+
+    def start(self):
+        for stage in self.stages:
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=stage.run, args=(self.stop_event,), name=f"{self.name}-{stage.name}-{n}", daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+        if self.report_every:
+            reporter = threading.Thread(target=self._report_loop, name=f"{self.name}-reporter", daemon=True)
+            reporter.start()
+            self._threads.append(reporter)
+        return self
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait(self):
+        """Bloquea hasta que se detenga el pipeline (Ctrl+C lo interrumpe)."""
+        while not self.stop_event.wait(1):
+            pass
+
+    def report(self):
+        """Una línea por etapa: ítems/s desde el reporte anterior, cola, ocupación y errores."""
+        lines = []
+        for stage in self.stages:
+            with stage._lock:
+                rate = stage.stats.snapshot()
+                line = f"{stage.name}: {rate:.1f}/s"
+                if not stage.source:
+                    busy = stage.stats.busy_seconds / max(stage.workers, 1)
+                    line += f", cola {stage.depth()}/{stage.capacity()}"
+                    if stage.batch_size and stage.stats.batches:
+                        line += f", lote medio {stage.stats.items / stage.stats.batches:.0f}"
+                    line += f", ocupado {busy:.0f}s"
+                if stage.stats.errors:
+                    line += f", {stage.stats.errors} err"
+            lines.append(line)
+        return lines
+
+    def _report_loop(self):
+        while not self.stop_event.wait(self.report_every):
+            self.log.info("📊 " + " | ".join(self.report()))
@@ -14,6 +14,7 @@ from ..models import (
     ProductClusterMembership,
 )
 from ..permissions import IsAdminRole
+from ..services.vector_search_service import VectorSearchService
 
 
 class ClusterLabStatsView(APIView):
@@ -157,21 +158,19 @@ class ClusterOrphansView(APIView):
                 target_title, target_image, target_vector = res
                 
                 # 2. Buscar Top 15 Candidatos Visuales (Expandido para Grid)
+                neighbors = VectorSearchService.nearest(cur, target_vector, 50, exclude_id=target_pid)
                 cur.execute("""
-                    SELECT 
-                        p.product_id, p.title, p.sale_price, p.url_image_s3,
-                        (pe.embedding_visual <=> %s) as dist 
-                    FROM product_embeddings pe
-                    JOIN products p ON pe.product_id = p.product_id
-                    WHERE pe.product_id != %s AND pe.embedding_visual IS NOT NULL
-                    ORDER BY dist ASC
-                    LIMIT 50
-                """, (target_vector, target_pid))
+                    SELECT product_id, title, sale_price, url_image_s3
+                    FROM products WHERE product_id = ANY(%s)
+                """, ([pid for pid, _ in neighbors],))
+                details = {row[0]: row[1:] for row in cur.fetchall()}
                 
                 candidates = []
 
-                for row in cur.fetchall():
-                    c_pid, c_title, c_price, c_img, dist = row
+                for c_pid, dist in neighbors:
+                    if c_pid not in details:
+                        continue
+                    c_title, c_price, c_img = details[c_pid]
                     
                     # Calcular Scores (Misma lógica que Clusterizer V3)
                     visual_score = max(0, 1.0 - float(dist))
@@ -6,6 +6,7 @@ from django.db import connection
 from django.db.models import Q, Count
 from ..models import UniqueProductCluster, Product, ProductClusterMembership
 from ..permissions import IsAdminRole
+from ..services.vector_search_service import VectorSearchService
 
 
 class GoldMineView(APIView):
@@ -27,20 +28,9 @@ class GoldMineView(APIView):
         # 2. Buscar por similaridad (pgvector cosine distance <=>)
         # Buscamos embeddings visuales cercanos y unimos con clusters
         # Traemos los top 50 matches visuales
-        sql = """
-            SELECT 
-                pe.product_id, 
-                (pe.embedding_visual <=> %s::vector) as distance
-            FROM product_embeddings pe
-            WHERE pe.embedding_visual IS NOT NULL
-            ORDER BY distance ASC
-            LIMIT 50
-        """
-        
         similar_products = []
         with connection.cursor() as cur:
-            cur.execute(sql, (vector,))
-            rows = cur.fetchall()
+            rows = VectorSearchService.nearest(cur, vector, 50)
             similar_pids = [r[0] for r in rows]
 
         # 3. Recuperar detalles de clusters para esos productos
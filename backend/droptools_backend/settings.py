@@ -217,6 +217,13 @@ REPORTER_ESTIMATED_PENDING_FACTOR = float(os.getenv('REPORTER_ESTIMATED_PENDING_
 REPORTER_RANGE_SIZE = int(os.getenv('REPORTER_RANGE_SIZE', '100'))
 REPORTER_SELENIUM_SEMAPHORE_TTL = int(os.getenv('REPORTER_SELENIUM_SEMAPHORE_TTL', '3300'))  # 55 min
 
+# Búsqueda por similitud visual (VectorSearchService): "binary" = preselección por Hamming sobre
+# embedding_bits y re-rank con el vector completo; "hnsw" = ANN sobre embedding_visual; "exact" = sin índice
+VECTOR_SEARCH_MODE = os.getenv('VECTOR_SEARCH_MODE', 'binary')
+VECTOR_SEARCH_OVERSAMPLE = int(os.getenv('VECTOR_SEARCH_OVERSAMPLE', '10'))  # candidatos preseleccionados por resultado
+VECTOR_SEARCH_EF_SEARCH = int(os.getenv('VECTOR_SEARCH_EF_SEARCH', '100'))  # default; cada llamada puede fijar el suyo
+VECTOR_SEARCH_MAX_SCAN_TUPLES = int(os.getenv('VECTOR_SEARCH_MAX_SCAN_TUPLES', '20000'))  # tope del iterative scan con filtros
+
 # Etiqueta para UI/logs: development | development_docker | production
 REPORTER_RUN_MODE = 'development_docker' if (IS_DEVELOPMENT and IS_DOCKER) else ('development' if IS_DEVELOPMENT else 'production')
 